@@ -1,26 +1,66 @@
 import cv2
+import numpy as np
 import os
 import time
 import math
 import threading
 import json
 import tempfile
-from shared_state import counter_state
+from shared_state import counter_state, frame_hub
 # Detector không cần thiết vì tracker tự động detect - đã bỏ để tối ưu FPS
 from src.tracker import PersonTracker
 from src.counter import PeopleCounter
+from src.overlay import OverlayRenderer
+from src.encoder import STREAM_TIERS, TieredEncoder
+from src.history_store import HistoryStore
+from src.ingest import GrowingVideoCapture
+from src.timing import NULL_TIMER, FpsMeter
+from src import metrics
+from src.profiler import ProfileControl
+from src import live_config
+from src.track_record import TrackRecorder
+from src.heatmap import FlowHeatmap, heatmap_path as heatmap_file
+from src.zones import ZoneTracker, parse_zones
+from src.reid import ReIdCache
+from src.pacing import PlaybackPacer, DEFAULT_MODE as DEFAULT_PACING
+from src.frame_pool import FramePool, FrameHolds
+from src.hls import HlsEncoder, hls_dir
 
 LINE_Y = 300
-output_frame = None
+overlay_payload = None  # Overlay JSON cho chế độ client-side (overlay_mode="client")
 output_lock = threading.Lock()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 REALTIME_DIR = os.path.join(BASE_DIR, "realtime")
 LATEST_JPG_PATH = os.path.join(REALTIME_DIR, "latest.jpg")
 STATS_JSON_PATH = os.path.join(REALTIME_DIR, "stats.json")
-HISTORY_JSONL_PATH = os.path.join(REALTIME_DIR, "history.jsonl")
+HISTORY_DB_PATH = os.path.join(REALTIME_DIR, "history.db")
 os.makedirs(REALTIME_DIR, exist_ok=True)
 
+# History lưu SQLite theo run (mỗi video upload = 1 run của stream "upload"), giữ qua các lần chạy
+history_store = HistoryStore(HISTORY_DB_PATH, stream="upload")
+
+# Frame được publish qua frame_hub trong process (app.py đọc trực tiếp từ bộ nhớ).
+# Bật REALTIME_WRITE_LATEST_JPG=1 nếu cần ghi thêm latest.jpg cho server ở process khác (realtime.py --serve)
+WRITE_LATEST_JPG = os.environ.get("REALTIME_WRITE_LATEST_JPG", "0") == "1"
+
+# Encode theo nhu cầu: chỉ encode tier đang có client /video_feed xem (luôn encode "full" nếu ghi latest.jpg)
+encoder = TieredEncoder(frame_hub, always=("full",) if WRITE_LATEST_JPG else ())
+
+# Khi chạy trong worker process của job scheduler (src/jobs.py): frame/stats đi qua shared-memory ring
+# của worker thay vì frame_hub trong process, server chỉ yêu cầu encode khi đang xem job này
+frame_ring = None
+
+# Label metrics của video upload; snapshot metrics gửi kèm ring stats mỗi METRICS_PUSH_INTERVAL giây
+METRIC_STREAM = "upload"
+METRICS_PUSH_INTERVAL = 1.0
+_metrics_pushed_at = 0.0
+
+
+def attach_frame_ring(ring):
+    global frame_ring
+    frame_ring = ring
+
 
 def _atomic_write_bytes(path, data: bytes):
     fd, tmp_path = tempfile.mkstemp(prefix="tmp_", dir=os.path.dirname(path))
@@ -41,19 +81,56 @@ def _atomic_write_json(path, obj):
     _atomic_write_bytes(path, data)
 
 
-def _clear_history():
+def _write_ring_stats(ring, payload):
+    """Ghi stats vào ring, kèm snapshot metrics cho server (/metrics) khoảng mỗi giây"""
+    global _metrics_pushed_at
+    now = time.time()
+    if now - _metrics_pushed_at >= METRICS_PUSH_INTERVAL:
+        _metrics_pushed_at = now
+        if ring.write_stats(dict(payload, metrics=metrics.REGISTRY.snapshot())):
+            return
+    ring.write_stats(payload)
+
+
+def _publish_frame(frame, timer=NULL_TIMER, buffer=None):
+    """
+    Encode + đẩy frame mới cho các subscriber /video_feed (và latest.jpg nếu được bật).
+    buffer: PooledFrame chứa frame, encoder giữ tới frame sau (encode lại frame cuối cho client mới)
+    """
+    ring = frame_ring
+    if ring is not None:
+        encoder.remote_demand = dict(zip(STREAM_TIERS, ring.read_demand()))
+    with timer.stage("encode"):
+        encoded = encoder.publish(frame, buffer)
+    with timer.stage("write"):
+        if WRITE_LATEST_JPG and "full" in encoded:
+            _atomic_write_bytes(LATEST_JPG_PATH, encoded["full"].tobytes())
+        if ring is not None:
+            tiers = list(STREAM_TIERS)
+            for tier, buf in encoded.items():
+                ring.write_frame(buf, tiers.index(tier))
+            _write_ring_stats(ring, {"stats": counter_state.get(), "overlay": overlay_payload, "encode": encoder.stats()})
+
+
+def _write_stats_file(stats):
+    """stats.json cho server ở process khác; worker của job scheduler báo stats qua ring nên bỏ qua"""
+    if frame_ring is None:
+        _atomic_write_json(STATS_JSON_PATH, stats)
+
+
+def _start_history_run():
+    """Mỗi video mới là 1 run mới trong history store (không xoá history các lần trước)"""
     try:
-        with open(HISTORY_JSONL_PATH, "w", encoding="utf-8"):
-            pass
-    except Exception:
-        pass
+        history_store.start_run()
+    except Exception as e:
+        print(f"[HISTORY] Cannot start run: {e}")
 
 
 def _append_history(stats):
     try:
         row = {"t": round(time.time(), 2), "in": stats.get("in", 0), "out": stats.get("out", 0), "net": stats.get("net", 0)}
-        with open(HISTORY_JSONL_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        history_store.append(row)
+        counter_state.add_history(row)
     except Exception:
         pass
 
@@ -68,7 +145,7 @@ def auto_detect_line_position(video_path, num_samples=30):
     Returns:
         dict: Cấu hình line tối ưu {y, angle, x1, x2}
     """
-    cap = cv2.VideoCapture(video_path)
+    cap = GrowingVideoCapture(video_path)
     if not cap.isOpened():
         return None
     
@@ -122,6 +199,9 @@ def auto_detect_line_position(video_path, num_samples=30):
         frame_count += 1
     
     cap.release()
+    # Model (và ByteTrack của predictor) dùng chung trong process: xoá track của các frame mẫu
+    # (kích thước gốc, không liên tục) để job dùng model sau đó bắt đầu sạch
+    tracker.reset()
     
     if not movement_heatmap:
         print("[AUTO-DETECT] No movement detected, using default position")
@@ -188,21 +268,65 @@ def auto_detect_line_position(video_path, num_samples=30):
     
     return result
 
-def process_video(video_path, line_config=None, auto_detect=True):
-    global output_frame
+def warmup_model(tracker_factory=None):
+    """
+    Load model và chạy warm-up inference 1 lần khi worker khởi động (src/jobs.py); model dùng chung
+    cho mọi job sau trong process. Trả về số giây warm-up, None nếu không load được model.
+    """
+    try:
+        return (tracker_factory or PersonTracker)().warmup()
+    except Exception as e:
+        print(f"[WARMUP] Skipped: {e}")
+        return None
+
+
+def process_video(video_path, line_config=None, auto_detect=True, overlay_mode="server",
+                  progress=None, should_stop=None, timer=None, tracker_factory=None, record_tracks=None, pacing=None,
+                  heatmap_path=None, hls_key=None):
+    """
+    overlay_mode: "server" - vẽ overlay lên frame trước khi encode
+                  "client" - publish frame gốc + overlay JSON (get_overlay), dashboard tự vẽ
+    progress: callback(dict frames/total/fps/eta) gọi khoảng mỗi giây (job scheduler)
+    should_stop: callable → True thì dừng giữa chừng (huỷ job)
+    timer: StageTimer (src/timing.py) để đo từng stage (tools/bench_pipeline.py),
+           mặc định ghi histogram people_stage_seconds của /metrics (src/metrics.py)
+    tracker_factory: thay PersonTracker (benchmark dùng tracker giả, không cần model)
+    record_tracks: đường dẫn .npz để ghi track mỗi frame (src/track_record.py, replay/sweep tham số counter)
+    pacing: "realtime" (theo timestamp nguồn, bỏ frame để đuổi kịp khi chậm) | "fast" (không chờ: benchmark,
+            ghi track), mặc định PACING_MODE (src/pacing.py)
+    heatmap_path: file .npz heatmap occupancy/flow (src/heatmap.py), mặc định theo tên ring của worker
+    hls_key: bật output HLS (src/hls.py) vào realtime/hls/<hls_key>/, frame đã vẽ encode 1 lần bằng ffmpeg
+    Trả về tổng kết {in, out, net, frames, total_frames, fps, duration, cancelled, error}.
+    """
+    global overlay_payload
+    stream = METRIC_STREAM
+    timer = timer or metrics.StageMetrics(stream=stream)
+    # Profile theo yêu cầu từ server (src/profiler.py), target = tên ring của worker
+    control_target = frame_ring.name if frame_ring is not None else stream
+    profile = ProfileControl(control_target)
+    timer = profile.wrap(timer)
+    # Đổi line/ROI khi đang chạy (src/live_config.py), áp dụng giữa 2 frame
+    live = live_config.LiveConfig(control_target)
+    fps_meter = FpsMeter()
+    tracker_factory = tracker_factory or PersonTracker
+    started_at = time.time()
+    recorder = TrackRecorder(record_tracks) if record_tracks else None
+    record_meta = {"video_path": os.path.abspath(video_path)}
+    result = {"frames": 0, "total_frames": 0, "cancelled": False, "error": None}
     # Reset tất cả state khi video mới bắt đầu
     counter_state.reset()  # Reset counter state (count_in, count_out)
-    counter_state.running = True
-    _clear_history()
+    counter_state.set_running(True)
+    _start_history_run()
 
     try:
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"Video file not found: {video_path}")
 
         with output_lock:
-            output_frame = None  # Reset frame (module-level global)
+            overlay_payload = None
 
-        cap = cv2.VideoCapture(video_path)
+        # File có thể còn đang upload (/upload/stream): đọc tới đâu xử lý tới đó
+        cap = GrowingVideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError(f"Cannot open video file: {video_path}")
 
@@ -213,6 +337,8 @@ def process_video(video_path, line_config=None, auto_detect=True):
         frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        result["total_frames"] = total_frames
         
         # Tối ưu: resize frame nếu quá lớn để tăng FPS
         # Giữ nguyên kích thước nếu <= 1280x720, resize nếu lớn hơn
@@ -230,15 +356,12 @@ def process_video(video_path, line_config=None, auto_detect=True):
             roi_y1 = max(0, min(int(roi_config.get("y1", 0)), frame_height))
             roi_x2 = max(roi_x1, min(int(roi_config.get("x2", frame_width)), frame_width))
             roi_y2 = max(roi_y1, min(int(roi_config.get("y2", frame_height)), frame_height))
-            tracker = PersonTracker(roi=(roi_x1, roi_y1, roi_x2, roi_y2))
+            tracker = tracker_factory(roi=(roi_x1, roi_y1, roi_x2, roi_y2))
             print(f"[ROI] Using ROI: ({roi_x1}, {roi_y1}, {roi_x2}, {roi_y2})")
         else:
-            tracker = PersonTracker()
+            tracker = tracker_factory()
             print("[ROI] No ROI configured, detecting entire frame")
         
-        # Reset tracker state khi video mới
-        tracker.reset()
-        
         line_type = (line_config or {}).get("line_type", "horizontal")
         is_vertical = (line_type == "vertical")
 
@@ -289,20 +412,60 @@ def process_video(video_path, line_config=None, auto_detect=True):
             counter = PeopleCounter(line_y, line_angle, line_x1, line_x2, frame_width, frame_height,
                                     line_type="horizontal")
         
+        record_meta.update({
+            "frame_width": frame_width, "frame_height": frame_height, "fps": fps,
+            "line": ({"line_type": "vertical", "line_x": counter.line_x} if is_vertical else
+                     {"line_type": "horizontal", "y": counter.line_y, "angle": counter.line_angle,
+                      "x1": counter.line_x1, "x2": counter.line_x2}),
+            "debounce_threshold": counter.debounce_threshold, "min_distance": counter.MIN_DISTANCE,
+        })
+
+        # Re-id: ID mới (ByteTrack đổi ID sau khi bị che) của người đã đếm không bị đếm lại
+        reid = ReIdCache(counter, stream=stream)
+
+        # Vùng đa giác (hàng chờ...): số người trong vùng + dwell time, báo qua counter_state["zones"]
+        zones = ZoneTracker(parse_zones((line_config or {}).get("zones")), stream=stream)
+        record_meta["zones"] = zones.config()
+
+        # Heatmap occupancy/flow cộng dồn mỗi frame, ghi snapshot định kỳ cho API /heatmap
+        heatmap = FlowHeatmap(frame_width, frame_height, fps=fps,
+                              path=heatmap_path or heatmap_file(control_target))
+
+        # Reset tracker state khi video mới, sau auto-detect line (dùng chung model/ByteTrack của process)
+        tracker.reset()
+
         # Reset counter state khi video mới (reset tất cả tracking state)
         counter.reset()
         print("[COUNTER] Counter state reset for new video")
 
+        # Render sẵn layer tĩnh (line, label, ROI) 1 lần cho cấu hình này
+        overlay = OverlayRenderer.from_counter(counter, roi=tracker.roi, zones=zones.config())
+        client_overlay = (overlay_mode == "client")
+
+        # HLS: ffmpeg encode H.264 1 lần cho mọi viewer, server chỉ phục vụ file segment tĩnh
+        hls = None
+        if hls_key:
+            hls = HlsEncoder(hls_dir(hls_key), frame_width, frame_height, fps)
+            hls.start()
+
         # Tối ưu FPS: skip frames để tăng tốc độ xử lý
         # Process mỗi N frame để tăng FPS (ví dụ: process_frame_interval = 1 nghĩa là xử lý mọi frame)
         # Tăng lên 2 hoặc 3 để skip frames và tăng FPS (nhưng có thể giảm độ chính xác tracking)
         process_frame_interval = 1  # Có thể tăng lên 2 hoặc 3 để skip frames và tăng FPS
         
-        # Calculate delay between frames to maintain video speed
-        frame_delay = 1.0 / fps if fps > 0 else 1.0 / 30.0
+        # Nhịp phát theo timestamp nguồn (frame_count / fps), độ trễ + số frame bỏ để đuổi kịp báo qua progress
+        pacer = PlaybackPacer(fps, mode=pacing or DEFAULT_PACING)
 
         frame_count = 0
-        last_processed_frame = None  # Lưu frame cuối cùng đã xử lý để hiển thị
+        last_processed_frame = None  # Lưu frame cuối cùng đã xử lý để hiển thị (view read-only)
+
+        # Decode/resize ghi vào buffer dùng lại (src/frame_pool.py), không cấp phát frame mới mỗi vòng.
+        # Slot "last": frame cuối đã xử lý; encoder tự giữ buffer của frame vừa publish (last_frame)
+        pool = FramePool((frame_height, frame_width, 3))
+        holds = FrameHolds()
+        direct_decode = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) == \
+            (frame_width, frame_height)
+        raw_frame = None  # buffer decode kích thước gốc (khi cần resize), dùng lại giữa các frame
         
         # Ghi frame đầu tiên ngay để stream có dữ liệu
         ret, first_frame = cap.read()
@@ -310,26 +473,53 @@ def process_video(video_path, line_config=None, auto_detect=True):
             if first_frame.shape[1] != frame_width or first_frame.shape[0] != frame_height:
                 first_frame = cv2.resize(first_frame, (frame_width, frame_height))
             try:
-                ok, buf = cv2.imencode(".jpg", first_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if ok:
-                    _atomic_write_bytes(LATEST_JPG_PATH, buf.tobytes())
-                    _atomic_write_json(STATS_JSON_PATH, counter_state.get())
+                _publish_frame(first_frame)
+                _write_stats_file(counter_state.get())
             except Exception:
                 pass
         
         while True:
-            ret, frame = cap.read()
+            profile.poll()
+            request = live.poll()
+            if request is not None:
+                # Counter giữ số đếm, tracker giữ model + trạng thái ByteTrack; overlay dựng xong mới thay
+                overlay, applied = live_config.apply(request["update"], counter, tracker, zones)
+                live.applied(request, applied, frame_count)
+                record_meta.setdefault("line_changes", []).append({"frame": frame_count, **applied})
+            if should_stop is not None and should_stop():
+                print(f"[JOB] Cancelled at frame {frame_count}")
+                result["cancelled"] = True
+                break
+            if pacer.should_skip(frame_count + 1):
+                # Chậm hơn nguồn: bỏ frame này (grab, không decode/track), pacer giới hạn số frame bỏ liên tiếp
+                with timer.stage("decode"):
+                    ret = cap.grab()
+                if not ret:
+                    break
+                frame_count += 1
+                result["frames"] = frame_count
+                metrics.FRAMES_DROPPED.inc(stream=stream, reason="catchup")
+                continue
+            buf = pool.acquire()
+            with timer.stage("decode"):
+                ret, raw = cap.read(buf.array if direct_decode else raw_frame)
             if not ret:
+                buf.release()
                 break
 
             frame_count += 1
+            result["frames"] = frame_count
             
-            # Resize frame nếu cần để tăng FPS
-            if frame.shape[1] != frame_width or frame.shape[0] != frame_height:
-                frame = cv2.resize(frame, (frame_width, frame_height))
+            # Resize frame nếu cần để tăng FPS (ghi thẳng vào buffer của pool)
+            if raw is not buf.array:
+                raw_frame = raw
+                with timer.stage("resize"):
+                    cv2.resize(raw, (frame_width, frame_height), dst=buf.array)
+            frame = buf.array
             
             # Skip frames để tăng FPS (chỉ xử lý mỗi N frame)
             should_process = (frame_count % process_frame_interval == 0)
+            metrics.FRAMES.inc(stream=stream)
             
             try:
                 if should_process:
@@ -337,56 +527,33 @@ def process_video(video_path, line_config=None, auto_detect=True):
                     current_counts = counter_state.get()
                     
                     # Tracker tự động detect và track, không cần detector riêng
-                    tracks = tracker.update(None, frame)
+                    with timer.stage("track"):
+                        tracks = tracker.update(None, frame)
+                    if recorder is not None:
+                        recorder.add(frame_count, tracks)
                     
-                    # Lưu frame đã xử lý để hiển thị
-                    last_processed_frame = frame.copy()
+                    # Lưu frame đã xử lý để hiển thị: xử lý mọi frame thì giữ chính buffer (overlay vẽ sau
+                    # cũng là frame cần hiển thị), bỏ frame thì cần bản sạch để vẽ lại cho frame bị bỏ
+                    if process_frame_interval > 1:
+                        clean = pool.acquire()
+                        np.copyto(clean.array, frame)
+                        holds.keep("last", clean)
+                        clean.release()
+                    else:
+                        holds.keep("last", buf)
+                    last_processed_frame = holds.get("last").readonly()
                 else:
-                    # Skip frame này, sử dụng frame đã xử lý trước đó
+                    # Skip frame này, sử dụng frame đã xử lý trước đó (chép vào buffer của frame này)
+                    metrics.FRAMES_SKIPPED.inc(stream=stream)
                     if last_processed_frame is not None:
-                        frame = last_processed_frame.copy()
+                        np.copyto(frame, last_processed_frame)
                     tracks = []
 
-                # Chỉ vẽ khi đã xử lý frame (không vẽ khi skip)
-                if should_process:
-                    # Vẽ ROI nếu có để người dùng thấy vùng đang detect
-                    if tracker.roi is not None:
-                        roi_x1, roi_y1, roi_x2, roi_y2 = tracker.roi
-                        # Vẽ rectangle cho ROI với màu xanh dương
-                        cv2.rectangle(frame, (roi_x1, roi_y1), (roi_x2, roi_y2), (255, 0, 0), 2)
-                        # Thêm label
-                        cv2.putText(frame, "ROI (Detection Area)", 
-                                   (roi_x1, roi_y1 - 10),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                                   (255, 0, 0), 2)
-
-                    # Draw counting line
-                if is_vertical:
-                    # Đường dọc giữa: trái→phải = Vào, phải→trái = Ra
-                    cv2.line(frame, (line_x, 0), (line_x, frame_height), (0, 255, 255), 3)
-                    cv2.putText(frame, "Trai -> Phai = VAO", (line_x + 15, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    cv2.putText(frame, "Phai -> Trai = RA", (line_x + 15, 60),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                else:
-                    if line_angle == 0:
-                        cv2.line(frame, (line_x1, line_y), (line_x2, line_y), (0, 255, 255), 3)
-                    else:
-                        angle_rad = math.radians(line_angle)
-                        center_x = (line_x1 + line_x2) // 2
-                        center_y = line_y
-                        length = abs(line_x2 - line_x1) // 2
-                        dx = length * math.cos(angle_rad)
-                        dy = length * math.sin(angle_rad)
-                        pt1 = (int(center_x - dx), int(center_y - dy))
-                        pt2 = (int(center_x + dx), int(center_y + dy))
-                        cv2.line(frame, pt1, pt2, (0, 255, 255), 3)
-                    label_x = min(line_x1, line_x2) + 10
-                    label_y = line_y - 10 if line_y > 30 else line_y + 25
-                    cv2.putText(frame, f"Counting Line ({line_angle}°)",
-                                (label_x, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-
-                    # Process tracks
+                # Đếm người qua line - tách khỏi phần vẽ để chạy cho cả đường ngang và đường dọc
+                boxes = []
+                with timer.stage("count"):
+                    if should_process:
+                        reid.begin(frame, frame_count / fps, [tr.track_id for tr in tracks if tr.is_confirmed()])
                     for track in tracks:
                         if not track.is_confirmed():
                             continue
@@ -396,116 +563,104 @@ def process_video(video_path, line_config=None, auto_detect=True):
                             cx = int((l + r) / 2)  # Center x
                             cy = int((t + b) / 2)  # Center y
 
-                            counter.update(track.track_id, cx, cy, counter_state)
-
-                            # Draw bounding box and ID
-                            cv2.rectangle(frame, (l, t), (r, b), (0, 255, 0), 2)
-                            cv2.putText(frame, f"ID {track.track_id}",
-                                        (l, t - 5),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                                        (0, 255, 0), 2)
+                            reid.match_new(track.track_id, l, t, r, b)
+                            counted = counter.update(track.track_id, cx, cy, counter_state)
+                            if counted:
+                                reid.remember(track.track_id, l, t, r, b, counted)
+                            boxes.append((track.track_id, l, t, r, b))
                         except Exception as e:
                             print(f"Error processing track: {e}")
                             continue
+                    if should_process:
+                        reid.end(boxes)
+                        # Thời gian video (không phụ thuộc tốc độ xử lý) để tính dwell
+                        zones.update(boxes, frame_count / fps)
+                        zones.report(counter_state, frame_count / fps)
 
                 # Get updated counts (luôn cập nhật để hiển thị đúng)
                 updated_counts = counter_state.get()
+                if should_process:
+                    with timer.stage("heatmap"):
+                        heatmap.update(boxes)
+                        heatmap.autosave()
+                    metrics.ACTIVE_TRACKS.set(len(boxes), stream=stream)
+                    metrics.record_crossings(stream, updated_counts["in"] - current_counts["in"],
+                                             updated_counts["out"] - current_counts["out"])
+
+                # FPS đo riêng cho từng lần chạy (không dùng chung giữa các job)
+                if fps_meter.tick():
+                    metrics.FPS.set(round(fps_meter.fps, 2), stream=stream)
+                    if progress is not None:
+                        cur = fps_meter.fps
+                        remaining = max(0, total_frames - frame_count) if total_frames else None
+                        progress({
+                            "frames": frame_count,
+                            "total": total_frames,
+                            "fps": round(cur, 2),
+                            "eta": round(remaining / cur, 1) if remaining is not None and cur > 0 else None,
+                            "lag_ms": round(pacer.lag * 1000, 1),
+                            "catchup_skips": pacer.catchup_skips,
+                        })
                 
-                # Draw statistics on frame
-                stats_y = 30
-                cv2.rectangle(frame, (10, 10), (300, 120), (0, 0, 0), -1)
-                cv2.rectangle(frame, (10, 10), (300, 120), (255, 255, 255), 2)
-                
-                # IN count
-                cv2.putText(frame, f"IN: {updated_counts['in']}", 
-                           (20, stats_y),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                           (0, 255, 0), 2)
-                
-                # OUT count
-                cv2.putText(frame, f"OUT: {updated_counts['out']}", 
-                           (20, stats_y + 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                           (0, 0, 255), 2)
-                
-                # NET count
-                net_color = (255, 255, 0) if updated_counts['net'] >= 0 else (0, 165, 255)
-                cv2.putText(frame, f"NET: {updated_counts['net']}", 
-                           (20, stats_y + 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                           net_color, 2)
-                
-                # Frame info và FPS
-                import time as time_module
-                if not hasattr(process_video, 'last_fps_time'):
-                    process_video.last_fps_time = time_module.time()
-                    process_video.fps_counter = 0
-                
-                process_video.fps_counter += 1
-                current_time = time_module.time()
-                if current_time - process_video.last_fps_time >= 1.0:
-                    process_video.current_fps = process_video.fps_counter / (current_time - process_video.last_fps_time)
-                    process_video.fps_counter = 0
-                    process_video.last_fps_time = current_time
-                
-                fps_text = f"FPS: {process_video.current_fps:.1f}" if hasattr(process_video, 'current_fps') else "FPS: --"
-                cv2.putText(frame, f"Frame: {frame_count} | {fps_text}", 
-                           (20, stats_y + 90),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                           (255, 255, 255), 1)
+                fps_text = f"FPS: {fps_meter.fps:.1f}" if fps_meter.fps is not None else "FPS: --"
+
+                with timer.stage("draw"):
+                    if client_overlay:
+                        # Client-side overlay: giữ frame gốc, dashboard tự vẽ từ JSON
+                        payload = overlay.payload(boxes, updated_counts, frame_count)
+                        with output_lock:
+                            overlay_payload = payload
+                    else:
+                        overlay.render(frame, boxes, updated_counts, info_text=f"Frame: {frame_count} | {fps_text}")
 
-                # Update output frame immediately so it can be displayed
-                with output_lock:
-                    output_frame = frame.copy()
+                # View read-only cho HLS / encoder, không copy
+                view = buf.readonly()
+                if hls is not None:
+                    with timer.stage("encode"):
+                        hls.submit(view)
 
                 # Ghi realtime artifacts - ghi mỗi frame để stream mượt hơn
                 # Ghi cả khi skip frame để đảm bảo stream luôn có dữ liệu
                 try:
-                    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    if ok:
-                        _atomic_write_bytes(LATEST_JPG_PATH, buf.tobytes())
+                    _publish_frame(view, timer, buf)
                     if should_process:
-                        st = counter_state.get()
-                        _atomic_write_json(STATS_JSON_PATH, st)
-                        # Ghi history mỗi 10 frame để đồng bộ với online mode và cập nhật biểu đồ tốt hơn
-                        if frame_count % 10 == 0:
-                            _append_history(st)
+                        with timer.stage("write"):
+                            st = counter_state.get()
+                            _write_stats_file(st)
+                            # Ghi history mỗi 10 frame để đồng bộ với online mode và cập nhật biểu đồ tốt hơn
+                            if frame_count % 10 == 0:
+                                _append_history(st)
                 except Exception as e:
                     print(f"Error writing frame: {e}")
                     pass
                 
-                # Tối ưu delay: chỉ delay khi cần thiết để không làm chậm xử lý
-                # Delay nhỏ hơn khi skip frames để tăng FPS
-                if should_process:
-                    # Delay nhỏ hơn khi đã skip frames
-                    time.sleep(frame_delay * 0.3)
-                else:
-                    # Delay rất nhỏ khi skip frame
-                    time.sleep(frame_delay * 0.1)
+                # Chờ đến hạn của frame theo timestamp nguồn (realtime), không chờ khi đang trễ
+                with timer.stage("pacing"):
+                    pacer.wait(frame_count)
+                metrics.PLAYBACK_LAG.set(round(pacer.lag, 3), stream=stream)
                 
             except Exception as e:
                 print(f"Error processing frame {frame_count}: {e}")
-                # Still show the frame even if processing fails
-                with output_lock:
-                    output_frame = frame.copy()
+                metrics.FRAMES_DROPPED.inc(stream=stream, reason="error")
                 continue
+            finally:
+                buf.release()
 
         print(f"Video processing completed. Processed {frame_count} frames.")
         
         # Ghi frame cuối cùng khi video kết thúc
         if last_processed_frame is not None:
             try:
-                ok, buf = cv2.imencode(".jpg", last_processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if ok:
-                    _atomic_write_bytes(LATEST_JPG_PATH, buf.tobytes())
+                _publish_frame(last_processed_frame, buffer=holds.get("last"))
                 st = counter_state.get()
-                _atomic_write_json(STATS_JSON_PATH, st)
+                _write_stats_file(st)
                 _append_history(st)
             except Exception:
                 pass
 
     except Exception as e:
         print(f"Error in process_video: {e}")
+        result["error"] = str(e)
         import traceback
         traceback.print_exc()
         # Create error frame
@@ -513,29 +668,58 @@ def process_video(video_path, line_config=None, auto_detect=True):
         cv2.putText(error_frame, f"Error: {str(e)}", 
                    (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 
                    0.7, (0, 0, 255), 2)
-        with output_lock:
-            output_frame = error_frame
         try:
-            ok, buf = cv2.imencode(".jpg", error_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            if ok:
-                _atomic_write_bytes(LATEST_JPG_PATH, buf.tobytes())
-            _atomic_write_json(STATS_JSON_PATH, counter_state.get())
+            _publish_frame(error_frame)
+            _write_stats_file(counter_state.get())
         except Exception:
             pass
     finally:
-        counter_state.running = False
+        profile.close()
+        counter_state.set_running(False)
         if 'cap' in locals():
             cap.release()
         try:
             st = counter_state.get()
-            _atomic_write_json(STATS_JSON_PATH, st)
+            _write_stats_file(st)
             _append_history(st)
         except Exception:
             pass
+        if frame_ring is not None:
+            try:
+                _write_ring_stats(frame_ring, {"stats": counter_state.get(), "overlay": None, "encode": encoder.stats()})
+            except Exception:
+                pass
+        if 'heatmap' in locals():
+            heatmap.save()
+        if 'reid' in locals():
+            result["reid_matches"] = reid.matches
+        if 'pacer' in locals():
+            result["pacing"] = pacer.stats()
+        if 'pool' in locals():
+            result["frame_pool"] = pool.stats()
+        if 'hls' in locals() and hls is not None:
+            hls.close()
+            result["hls"] = hls.stats()
+        if 'zones' in locals() and zones.zones:
+            zones.report(counter_state, result["frames"] / fps, force=True)
+            result["zones"] = zones.summary(result["frames"] / fps)
+        if recorder is not None and "frame_width" in record_meta:
+            try:
+                st = counter_state.get()
+                record_meta.update({"frames": result["frames"], "in": st["in"], "out": st["out"]})
+                recorder.save(record_meta)
+            except Exception as e:
+                print(f"[RECORD] Cannot save {record_tracks}: {e}")
+
+    st = counter_state.get()
+    duration = time.time() - started_at
+    result.update({"in": st["in"], "out": st["out"], "net": st["net"], "duration": round(duration, 2),
+                   "fps": round(result["frames"] / duration, 2) if duration > 0 else 0.0})
+    return result
 
-def get_output_frame():
-    """Return current output frame (numpy array) for encoding in app, or None."""
+def get_overlay():
+    """Return overlay JSON mới nhất (client-side overlay mode), hoặc {"mode": "server"}."""
     with output_lock:
-        if output_frame is None:
-            return None
-        return output_frame.copy()
+        if overlay_payload is None:
+            return {"mode": "server"}
+        return overlay_payload
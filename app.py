@@ -1,18 +1,21 @@
 import os
-import threading
-import json
 import time
-import tempfile
 import cv2
 import numpy as np
-from flask import Flask, request, jsonify, render_template, Response
+from flask import Flask, request, jsonify, render_template, Response, send_file
 from flask_cors import CORS
-from ai_worker import process_video
+from ai_worker import history_store
+from shared_state import frame_hub, counter_state, stats_event_stream
+from src.encoder import STREAM_TIERS, DEFAULT_TIER
+from src.history import history_response, iter_csv
+from src.ingest import receive_stream
+from src.jobs import JobScheduler, JobQueueFull
+from src.metrics import REGISTRY, CONTENT_TYPE, QUEUE_DEPTH
+from src import profiler, live_config, heatmap, hls
+from src.zones import parse_zones
 
 UPLOAD_FOLDER = "uploads"
 REALTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "realtime")
-LATEST_JPG = os.path.join(REALTIME_DIR, "latest.jpg")
-STATS_JSON = os.path.join(REALTIME_DIR, "stats.json")
 HISTORY_JSONL = os.path.join(REALTIME_DIR, "history.jsonl")
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv', 'webm'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -33,41 +36,22 @@ def _create_placeholder_frame():
         return buf.tobytes()
     return None
 
-# Tạo placeholder frame ban đầu nếu chưa có
-if not os.path.exists(LATEST_JPG):
-    placeholder = _create_placeholder_frame()
-    if placeholder:
-        with open(LATEST_JPG, "wb") as f:
-            f.write(placeholder)
+# Placeholder frame ban đầu cho frame hub khi chưa có video
+# history.jsonl cũ được nhập vào history.db 1 lần; compaction phút/giờ chạy nền.
+# Worker process (spawn) import lại module này dưới tên __mp_main__ → bỏ qua phần khởi động server
+if __name__ != "__mp_main__":
+    history_store.import_jsonl(HISTORY_JSONL)
+    history_store.start_compactor()
 
-def _read_stats():
-    """Đọc stats từ file JSON"""
-    try:
-        if os.path.exists(STATS_JSON):
-            with open(STATS_JSON, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {"in": 0, "out": 0, "net": 0, "running": False}
+# Video upload chạy trong pool worker process (src/jobs.py), frame/stats đổ về frame_hub/counter_state.
+# Không tạo trong worker: _load_jobs sẽ đánh dấu failed các job đang chạy của server
+scheduler = JobScheduler(frame_hub, counter_state, history_store) if __name__ != "__mp_main__" else None
+for _tier in STREAM_TIERS:
+    QUEUE_DEPTH.set_function(lambda tier=_tier: frame_hub.demand().get(tier, 0), queue=f"subscribers_{_tier}")
 
-def _read_history():
-    """Đọc history từ file JSONL"""
-    out = []
-    try:
-        if os.path.exists(HISTORY_JSONL):
-            with open(HISTORY_JSONL, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            for line in lines[-2000:]:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    out.append(json.loads(line))
-                except Exception:
-                    continue
-    except Exception:
-        pass
-    return out
+PLACEHOLDER_JPG = _create_placeholder_frame()
+if PLACEHOLDER_JPG and frame_hub.latest()[1] is None:
+    frame_hub.publish(PLACEHOLDER_JPG)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -84,71 +68,219 @@ def index():
 
 @app.route("/video_feed")
 def video_feed():
-    """Stream video feed từ latest.jpg"""
+    """Stream video feed từ frame hub trong bộ nhớ. ?tier=full|thumb"""
+    tier = request.args.get("tier", DEFAULT_TIER)
+    if tier not in STREAM_TIERS:
+        tier = DEFAULT_TIER
+
     def gen():
-        last_mtime = 0
-        last_frame_data = None
-        
-        while True:
-            try:
-                if os.path.exists(LATEST_JPG):
-                    mtime = os.path.getmtime(LATEST_JPG)
-                    if mtime != last_mtime:
-                        last_mtime = mtime
-                        with open(LATEST_JPG, "rb") as f:
-                            last_frame_data = f.read()
-                        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + last_frame_data + b"\r\n")
-                    elif last_frame_data:
-                        # Gửi lại frame cuối cùng nếu không có thay đổi để giữ stream sống
-                        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + last_frame_data + b"\r\n")
-                else:
-                    # Nếu không có file, tạo và gửi placeholder
-                    placeholder = _create_placeholder_frame()
-                    if placeholder:
-                        last_frame_data = placeholder
-                        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + placeholder + b"\r\n")
-                time.sleep(0.033)  # ~30 FPS
-            except Exception as e:
-                # Nếu có lỗi, gửi placeholder frame
-                try:
-                    placeholder = _create_placeholder_frame()
-                    if placeholder:
-                        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + placeholder + b"\r\n")
-                except:
-                    pass
-                time.sleep(0.1)
+        # Đăng ký subscriber để worker chỉ encode tier đang có người xem
+        with frame_hub.subscribe(tier):
+            last_seq = -1
+            while True:
+                # Block đến khi worker publish frame mới; hết 1s thì gửi lại frame cũ để giữ stream sống
+                last_seq, frame_data = frame_hub.wait_for(last_seq, timeout=1.0, tier=tier)
+                if frame_data is None:
+                    frame_data = PLACEHOLDER_JPG
+                if frame_data:
+                    yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame_data + b"\r\n")
     return Response(gen(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @app.route("/api/result")
 def api_result():
     """API trả về kết quả đếm hiện tại"""
-    return jsonify(_read_stats())
+    return jsonify(counter_state.get())
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events: đẩy số đếm và điểm history mới khi SharedCounter thay đổi"""
+    return Response(stats_event_stream(counter_state), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history")
 def api_history():
-    """API trả về lịch sử đếm"""
-    return jsonify(_read_history())
+    """API trả về lịch sử đếm. ?since=<cursor> chỉ lấy điểm mới, ?points=N để downsample"""
+    try:
+        return jsonify(history_response(history_store, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        return jsonify([])
+
+@app.route("/api/stream/stats")
+def api_stream_stats():
+    """API trả về số subscriber và chi phí encode theo tier"""
+    return jsonify(scheduler.get_stream_stats())
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics: latency từng stage, fps, track, lượt qua line, hàng đợi (gộp cả worker job)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route("/api/overlay")
+def api_overlay():
+    """API trả về overlay JSON (box, ID, line) khi chạy chế độ client-side overlay"""
+    return jsonify(scheduler.get_overlay())
 
 @app.route("/api/export/csv")
 def api_export_csv():
-    """API xuất CSV"""
-    import csv
-    from io import BytesIO, StringIO
-    from flask import send_file
-    history = _read_history()
-    si = StringIO()
-    w = csv.writer(si)
-    w.writerow(["Thoi_gian", "IN", "OUT", "NET"])
-    for row in history:
-        t = row.get("t", "")
-        if isinstance(t, (int, float)):
-            t = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
-        w.writerow([t, row.get("in", 0), row.get("out", 0), row.get("net", 0)])
-    buf = BytesIO(si.getvalue().encode("utf-8-sig"))
-    return send_file(
-        buf, mimetype="text/csv", as_attachment=True,
-        download_name=f"counting_{time.strftime('%Y%m%d_%H%M%S')}.csv"
-    )
+    """API xuất CSV (stream từng khối). ?from=&to=&bucket=raw|minute|hour|auto"""
+    try:
+        chunks = iter_csv(history_store, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filename = f"counting_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(chunks, mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route("/api/jobs")
+def api_jobs():
+    """Danh sách job (mới nhất trước) + trạng thái pool worker"""
+    return jsonify({"jobs": scheduler.list(), **scheduler.summary()})
+
+@app.route("/api/jobs/<job_id>")
+def api_job(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    if not scheduler.cancel(job_id):
+        return jsonify({"error": "Job not found or already finished"}), 404
+    return jsonify(scheduler.get(job_id))
+
+@app.route("/api/jobs/<job_id>/watch", methods=["POST"])
+def api_job_watch(job_id):
+    """Chuyển video/số đếm trên dashboard sang job đang chạy này"""
+    if not scheduler.watch(job_id):
+        return jsonify({"error": "Job not running"}), 409
+    return jsonify(scheduler.get(job_id))
+
+@app.route("/api/jobs/<job_id>/profile", methods=["POST"])
+def api_job_profile(job_id):
+    """Admin: profile worker đang chạy job này trong ?seconds=N (mode=sample|cprofile), không restart"""
+    if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote_addr):
+        return jsonify({"error": "Forbidden"}), 403
+    target = scheduler.control_target(job_id)
+    if target is None:
+        return jsonify({"error": "Job not running"}), 409
+    body, status = profiler.run_profile(target, request.values)
+    return jsonify(body), status
+
+@app.route("/api/jobs/<job_id>/config", methods=["POST"])
+def api_job_config(job_id):
+    """
+    Đổi line (horizontal/nghiêng/vertical, y, angle, x1/x2, line_x) và ROI của job đang chạy.
+    Áp dụng ở frame kế tiếp, không load lại model, giữ nguyên số đếm.
+    """
+    try:
+        update = live_config.parse_update(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    target = scheduler.control_target(job_id)
+    if target is None:
+        return jsonify({"error": "Job not running"}), 409
+    request_id = live_config.request_update(target, update)
+    applied = live_config.wait_applied(target, request_id)
+    if applied is None:
+        return jsonify({"pending": True, "request_id": request_id, "update": update}), 202
+    job = scheduler.set_line_config(job_id, applied["config"])
+    return jsonify({"job": job, "applied_at_frame": applied["frame"]})
+
+@app.route("/api/jobs/<job_id>/heatmap")
+def api_job_heatmap(job_id):
+    """Heatmap occupancy/flow của job (đang chạy hoặc đã xong): ?kind=occupancy|flow&format=png|npy|json[&width=]"""
+    if scheduler.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    snap = heatmap.load(heatmap.heatmap_path(job_id))
+    if snap is None:
+        return jsonify({"error": "No heatmap yet"}), 404
+    try:
+        body, content_type = heatmap.export(snap, request.args.get("format", "png"),
+                                            request.args.get("kind", "occupancy"), request.args.get("width"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(body, content_type=content_type, headers={"Cache-Control": "no-cache"})
+
+@app.route("/api/hls")
+def api_hls():
+    """Playlist HLS của job đang xem trên dashboard (HLS_OUTPUT=1, src/hls.py), 404 nếu chưa có"""
+    job_id = scheduler.summary()["watched_job"]
+    if not job_id or not hls.has_playlist(job_id):
+        return jsonify({"error": "No HLS stream"}), 404
+    return jsonify({"job": job_id, "url": hls.playlist_url(job_id)})
+
+@app.route("/hls/<key>/<filename>")
+def hls_file(key, filename):
+    """Playlist / init / segment HLS của job key: file tĩnh, encode 1 lần cho mọi viewer"""
+    found = hls.resolve(key, filename)
+    if found is None:
+        return jsonify({"error": "Not found"}), 404
+    path, content_type, cache = found
+    resp = send_file(path, mimetype=content_type, conditional=True)
+    resp.headers["Cache-Control"] = cache
+    return resp
+
+@app.route("/api/admin/profiles/<profile_id>/artifact")
+def api_profile_artifact(profile_id):
+    """File .collapsed (flamegraph/speedscope) hoặc .pstats của 1 lần profile"""
+    if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote_addr):
+        return jsonify({"error": "Forbidden"}), 403
+    path = profiler.artifact_path(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+def _parse_priority(values):
+    try:
+        return int(values.get("priority", 0))
+    except (TypeError, ValueError):
+        return 0
+
+def _parse_upload_options(values):
+    """
+    Đọc cấu hình xử lý từ form (/upload) hoặc query string (/upload/stream).
+    Trả về (line_config, auto_detect, overlay_mode); ValueError nếu giá trị line / vùng không hợp lệ.
+    zones: JSON list vùng đa giác [{"id", "points": [[x, y], ...]}] (src/zones.py)
+    """
+    # Check if auto-detect is enabled
+    auto_detect = values.get("auto_detect", "true").lower() == "true"
+
+    # Line type: "horizontal" (ngang/trên-dưới) hoặc "vertical" (dọc/trái-phải)
+    line_type = values.get("line_type", "horizontal").lower()
+    if line_type not in ("horizontal", "vertical"):
+        line_type = "horizontal"
+
+    # Overlay mode: "server" (vẽ lên frame) hoặc "client" (dashboard tự vẽ từ /api/overlay)
+    overlay_mode = values.get("overlay_mode", "server").lower()
+    if overlay_mode not in ("server", "client"):
+        overlay_mode = "server"
+
+    # Get line configuration (only if not auto-detect)
+    if not auto_detect:
+        if line_type == "vertical":
+            line_config = {
+                "line_type": "vertical",
+                "line_x": int(values.get("line_x", 320)),
+                "auto": False
+            }
+        else:
+            line_config = {
+                "line_type": "horizontal",
+                "y": int(values.get("line_y", 300)),
+                "angle": float(values.get("line_angle", 0)),
+                "x1": int(values.get("line_x1", 0)),
+                "x2": int(values.get("line_x2", 640)),
+                "auto": False
+            }
+    else:
+        line_config = {"auto": True, "line_type": line_type}
+    zones = parse_zones(values.get("zones"))
+    if zones:
+        line_config["zones"] = zones
+    return line_config, auto_detect, overlay_mode
 
 @app.route("/upload", methods=["POST"])
 def upload():
@@ -163,42 +295,11 @@ def upload():
         return jsonify({"error": "Invalid file type. Allowed types: mp4, avi, mov, mkv, flv, wmv, webm"}), 400
 
     try:
-        # Check if auto-detect is enabled
-        auto_detect = request.form.get("auto_detect", "true").lower() == "true"
-        
-        # Line type: "horizontal" (ngang/trên-dưới) hoặc "vertical" (dọc/trái-phải)
-        line_type = request.form.get("line_type", "horizontal").lower()
-        if line_type not in ("horizontal", "vertical"):
-            line_type = "horizontal"
-
-        # Get line configuration from form (only if not auto-detect)
-        if not auto_detect:
-            try:
-                if line_type == "vertical":
-                    line_x = int(request.form.get("line_x", 320))
-                    line_config = {
-                        "line_type": "vertical",
-                        "line_x": line_x,
-                        "auto": False
-                    }
-                else:
-                    line_y = int(request.form.get("line_y", 300))
-                    line_angle = float(request.form.get("line_angle", 0))
-                    line_x1 = int(request.form.get("line_x1", 0))
-                    line_x2 = int(request.form.get("line_x2", 640))
-                    line_config = {
-                        "line_type": "horizontal",
-                        "y": line_y,
-                        "angle": line_angle,
-                        "x1": line_x1,
-                        "x2": line_x2,
-                        "auto": False
-                    }
-            except ValueError:
-                return jsonify({"error": "Invalid line configuration values"}), 400
-        else:
-            line_config = {"auto": True, "line_type": line_type}
-        
+        line_config, auto_detect, overlay_mode = _parse_upload_options(request.form)
+    except ValueError:
+        return jsonify({"error": "Invalid line configuration values"}), 400
+
+    try:
         # Sanitize filename
         filename = os.path.basename(video.filename)
         path = os.path.join(UPLOAD_FOLDER, filename)
@@ -208,17 +309,69 @@ def upload():
         if not os.path.exists(path) or os.path.getsize(path) == 0:
             return jsonify({"error": "Failed to save video file"}), 500
 
-        threading.Thread(
-            target=process_video,
-            args=(path, line_config, auto_detect),
-            daemon=True
-        ).start()
-
-        return jsonify({"message": "Processing started", "line_config": line_config})
+        job = scheduler.submit(path, line_config, auto_detect, overlay_mode, _parse_priority(request.form))
+        return jsonify({"message": "Processing queued", "job_id": job["id"], "line_config": line_config})
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
     except ValueError as e:
         return jsonify({"error": f"Invalid line configuration: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": f"Error uploading file: {str(e)}"}), 500
 
+def _remove_upload(path):
+    """Xoá file upload dở (chưa có job nào đọc)"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@app.route("/upload/stream", methods=["POST"])
+def upload_stream():
+    """
+    Upload dạng raw body: POST /upload/stream?filename=<tên file>&<các tham số như /upload>.
+    Ghi từng chunk xuống đĩa và bắt đầu xử lý ngay khi đã nhận phần đầu file
+    (MKV/WebM/MP4 fragmented decode được khi chưa upload xong).
+    """
+    filename = os.path.basename(request.args.get("filename", ""))
+    if not filename:
+        return jsonify({"error": "No video file provided"}), 400
+    if not allowed_file(filename):
+        return jsonify({"error": "Invalid file type. Allowed types: mp4, avi, mov, mkv, flv, wmv, webm"}), 400
+    try:
+        line_config, auto_detect, overlay_mode = _parse_upload_options(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid line configuration values"}), 400
+
+    # Hàng đợi đầy thì từ chối trước khi nhận body (không ghi file upload dở)
+    if scheduler.is_full():
+        return jsonify({"error": "Job queue full"}), 503
+
+    path = os.path.join(UPLOAD_FOLDER, filename)
+    priority = _parse_priority(request.args)
+    submitted = {}
+
+    def start_processing(ready_path):
+        # Job vào hàng đợi ngay khi đủ phần đầu file; worker đọc tiếp bằng GrowingVideoCapture
+        submitted["job"] = scheduler.submit(ready_path, line_config, auto_detect, overlay_mode, priority)
+
+    try:
+        total = receive_stream(request.stream, path, on_ready=start_processing)
+    except JobQueueFull as e:
+        _remove_upload(path)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        job = submitted.get("job")
+        if job is None:
+            _remove_upload(path)
+            return jsonify({"error": f"Error uploading file: {str(e)}"}), 500
+        # Job đã chạy trên phần file nhận được: worker xử lý tới chỗ file bị cắt, trả id để theo dõi
+        return jsonify({"error": f"Upload aborted: {str(e)}", "job_id": job["id"], "truncated": True}), 500
+    if total == 0:
+        _remove_upload(path)
+        return jsonify({"error": "Failed to save video file"}), 500
+    job = submitted.get("job") or {}
+    return jsonify({"message": "Upload complete", "bytes": total, "job_id": job.get("id"),
+                    "line_config": line_config})
+
 if __name__ == "__main__":
     app.run(threaded=True, debug=False, use_reloader=False)
@@ -0,0 +1,263 @@
+"""
+Async server (aiohttp) cho realtime: /video_feed + API trên 1 event loop thay vì 1 thread/viewer.
+Chạy: python realtime.py --serve --async [--max-viewers 500]
+
+- Mỗi viewer là 1 coroutine: chỉ gửi khi tier có frame mới (không gửi lại frame cũ),
+  client chậm bị chặn ở await write() và lần sau lấy luôn frame mới nhất → không dồn hàng đợi
+- FrameHub / SharedCounter (thread) báo có thay đổi vào event loop qua call_soon_threadsafe
+- Vượt giới hạn viewer → 503
+- Truy vấn SQLite (history, CSV) chạy trong thread pool để không block event loop
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from realtime import _ArtifactPump, _read_sources, history_store
+from shared_state import FrameHub, SharedCounter, StatsEventCursor
+from src.encoder import STREAM_TIERS, DEFAULT_TIER
+from src.history import history_response, iter_csv
+from src.metrics import REGISTRY, CONTENT_TYPE, QUEUE_DEPTH
+from src import profiler, live_config, heatmap, hls
+from src.shm_ring import DEFAULT_NAME
+
+DEFAULT_MAX_VIEWERS = int(os.environ.get("REALTIME_MAX_VIEWERS", "500"))
+_BOUNDARY = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+
+
+class AsyncNotifier:
+    """Báo thay đổi từ thread bất kỳ sang các coroutine đang chờ trên event loop"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.version = 0
+        self._event = asyncio.Event()
+
+    def notify(self, *_):
+        # Gọi từ thread khác (pump, worker)
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.version += 1
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, version, timeout=None):
+        """Chờ đến khi version khác giá trị đã biết (hoặc hết timeout)"""
+        if self.version != version:
+            return
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _cors(request, response):
+    # Header thêm trước khi gửi (cả StreamResponse), dashboard có thể ở origin khác
+    response.headers["Access-Control-Allow-Origin"] = "*"
+
+
+def create_async_app(shm_name=None, max_viewers=DEFAULT_MAX_VIEWERS):
+    hub = FrameHub()
+    state = SharedCounter()
+    viewers = {"count": 0, "rejected": 0}
+    notifiers = {}
+    QUEUE_DEPTH.set_function(lambda: viewers["count"], queue="viewers")
+    for tier in STREAM_TIERS:
+        QUEUE_DEPTH.set_function(lambda tier=tier: hub.demand().get(tier, 0), queue=f"subscribers_{tier}")
+
+    async def on_startup(app):
+        loop = asyncio.get_running_loop()
+        frames = {tier: AsyncNotifier(loop) for tier in STREAM_TIERS}
+        stats = AsyncNotifier(loop)
+        hub.listeners.append(lambda tier: frames[tier].notify() if tier in frames else None)
+        state.listeners.append(stats.notify)
+        notifiers["frames"], notifiers["stats"] = frames, stats
+        app["pump"] = _ArtifactPump(hub, state, shm_name or DEFAULT_NAME)
+
+    async def video_feed(request):
+        tier = request.query.get("tier", DEFAULT_TIER)
+        if tier not in STREAM_TIERS:
+            tier = DEFAULT_TIER
+        if viewers["count"] >= max_viewers:
+            viewers["rejected"] += 1
+            return web.Response(status=503, text="Too many viewers")
+        notifier = notifiers["frames"][tier]
+        resp = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame",
+                                           "Cache-Control": "no-cache"})
+        viewers["count"] += 1
+        try:
+            await resp.prepare(request)
+            with hub.subscribe(tier):
+                last_seq = 0
+                while True:
+                    version = notifier.version
+                    seq, data = hub.latest(tier)
+                    if data and seq != last_seq:
+                        last_seq = seq
+                        # Chờ client nhận xong (drain) rồi mới lấy frame tiếp: client chậm tự bỏ qua frame
+                        await resp.write(_BOUNDARY + data + b"\r\n")
+                        continue
+                    await notifier.wait(version, timeout=5.0)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            viewers["count"] -= 1
+        return resp
+
+    async def api_stream(request):
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                           "X-Accel-Buffering": "no"})
+        await resp.prepare(request)
+        notifier = notifiers["stats"]
+        cursor = StatsEventCursor(state)
+        try:
+            await resp.write(b"retry: 3000\n\n")
+            while True:
+                version = notifier.version
+                events = cursor.poll()
+                if events:
+                    await resp.write("".join(events).encode("utf-8"))
+                await notifier.wait(version, timeout=15.0)
+                if notifier.version == version:
+                    await resp.write(b": keepalive\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return resp
+
+    async def api_result(request):
+        return web.json_response(request.app["pump"].get_stats())
+
+    async def api_overlay(request):
+        return web.json_response(request.app["pump"].get_overlay())
+
+    async def api_stream_stats(request):
+        data = request.app["pump"].get_stream_stats()
+        data["viewers"] = {"active": viewers["count"], "max": max_viewers, "rejected": viewers["rejected"]}
+        return web.json_response(data)
+
+    async def api_sources(request):
+        return web.json_response(_read_sources())
+
+    async def api_config(request):
+        try:
+            update = live_config.parse_update(await request.json())
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        target = request.app["pump"].shm_name
+        request_id = live_config.request_update(target, update)
+        loop = asyncio.get_running_loop()
+        applied = await loop.run_in_executor(None, live_config.wait_applied, target, request_id)
+        if applied is None:
+            return web.json_response({"pending": True, "request_id": request_id, "update": update}, status=202)
+        return web.json_response({"config": applied["config"], "applied_at_frame": applied["frame"]})
+
+    async def api_profile(request):
+        if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote):
+            return web.json_response({"error": "Forbidden"}, status=403)
+        params = dict(request.query)
+        params.update(await request.post())
+        loop = asyncio.get_running_loop()
+        # Chờ kết quả trên thread pool, event loop vẫn phục vụ viewer
+        body, status = await loop.run_in_executor(None, profiler.run_profile, request.app["pump"].shm_name, params)
+        return web.json_response(body, status=status)
+
+    async def api_profile_artifact(request):
+        if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote):
+            return web.json_response({"error": "Forbidden"}, status=403)
+        path = profiler.artifact_path(request.match_info["profile_id"])
+        if path is None:
+            return web.json_response({"error": "Profile not found"}, status=404)
+        return web.FileResponse(path, headers={
+            "Content-Disposition": f"attachment; filename={os.path.basename(path)}"})
+
+    async def metrics(request):
+        return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def api_heatmap(request):
+        snap = heatmap.load(heatmap.heatmap_path(request.app["pump"].shm_name))
+        if snap is None:
+            return web.json_response({"error": "No heatmap yet"}, status=404)
+        try:
+            body, content_type = heatmap.export(snap, request.query.get("format", "png"),
+                                                request.query.get("kind", "occupancy"), request.query.get("width"))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.Response(body=body, headers={"Content-Type": content_type, "Cache-Control": "no-cache"})
+
+    async def api_hls(request):
+        key = request.app["pump"].shm_name
+        if not hls.has_playlist(key):
+            return web.json_response({"error": "No HLS stream"}, status=404)
+        return web.json_response({"key": key, "url": hls.playlist_url(key)})
+
+    async def hls_file(request):
+        # File tĩnh: FileResponse gửi bằng sendfile, không chặn event loop
+        found = hls.resolve(request.match_info["key"], request.match_info["filename"])
+        if found is None:
+            return web.json_response({"error": "Not found"}, status=404)
+        path, content_type, cache = found
+        return web.FileResponse(path, headers={"Content-Type": content_type, "Cache-Control": cache})
+
+    async def api_history(request):
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(None, history_response, history_store, request.query)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except Exception:
+            data = []
+        return web.json_response(data)
+
+    async def api_export_csv(request):
+        try:
+            chunks = iter_csv(history_store, dict(request.query))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        filename = f"counting_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        resp = web.StreamResponse(headers={"Content-Type": "text/csv; charset=utf-8",
+                                           "Content-Disposition": f"attachment; filename={filename}"})
+        await resp.prepare(request)
+        loop = asyncio.get_running_loop()
+        # Generator chạy trọn trên 1 thread riêng (cursor SQLite gắn với connection của thread)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+                if chunk is None:
+                    break
+                await resp.write(chunk.encode("utf-8"))
+            await resp.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            executor.submit(chunks.close)
+            executor.shutdown(wait=False)
+        return resp
+
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_response_prepare.append(_cors)
+    app.router.add_get("/video_feed", video_feed)
+    app.router.add_get("/api/stream", api_stream)
+    app.router.add_get("/api/result", api_result)
+    app.router.add_get("/api/overlay", api_overlay)
+    app.router.add_get("/api/stream/stats", api_stream_stats)
+    app.router.add_get("/api/sources", api_sources)
+    app.router.add_get("/api/history", api_history)
+    app.router.add_get("/api/export/csv", api_export_csv)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/api/heatmap", api_heatmap)
+    app.router.add_get("/api/hls", api_hls)
+    app.router.add_get("/hls/{key}/{filename}", hls_file)
+    app.router.add_post("/api/config", api_config)
+    app.router.add_post("/api/admin/profile", api_profile)
+    app.router.add_get("/api/admin/profiles/{profile_id}/artifact", api_profile_artifact)
+    return app
+
+
+def run_async_server(port=5001, shm_name=None, max_viewers=DEFAULT_MAX_VIEWERS):
+    app = create_async_app(shm_name, max_viewers)
+    print(f"[ASYNC] Serving on :{port} (max viewers {max_viewers})")
+    web.run_app(app, host="0.0.0.0", port=port, print=None)
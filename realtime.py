@@ -1,22 +1,36 @@
 """
 Realtime: (1) Flask server phục vụ stream + API đọc từ thư mục realtime/
           (2) Mode webcam: capture + detect + đếm, ghi latest.jpg & stats.json
-Chạy server:  python realtime.py   hoặc  python realtime.py --serve
-Chạy webcam: python realtime.py --cam 0 [--write-artifacts] [--show]
+Chạy server:  python realtime.py   hoặc  python realtime.py --serve [--async --max-viewers N]
+Chạy webcam: python realtime.py --cam 0 [--shm] [--write-artifacts] [--show] [--hls]
+Chạy file:   python realtime.py --video clip.mp4 [--loop] --shm
+Nhiều nguồn: python realtime.py --sources sources.json   (src/supervisor.py, health → realtime/sources.json)
+Xem 1 nguồn của supervisor: python realtime.py --serve --source-id cam0
+
+Webcam → server: --shm dùng ring buffer shared-memory (src/shm_ring.py), không ghi file mỗi frame.
+--write-artifacts vẫn ghi latest.jpg/stats.json làm fallback; server tự dùng shm khi có writer sống.
+--hls: thêm output HLS (src/hls.py) ở realtime/hls/<tên ring>/, server phục vụ /hls/... như file tĩnh.
 """
 import argparse
 import os
 import time
 import json
 import tempfile
-import ultralytics
+
+from src.history import history_response, iter_csv
+from src.history_store import HistoryStore, HistoryFollower
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 REALTIME_DIR = os.path.join(BASE_DIR, "realtime")
 LATEST_JPG = os.path.join(REALTIME_DIR, "latest.jpg")
 STATS_JSON = os.path.join(REALTIME_DIR, "stats.json")
 HISTORY_JSONL = os.path.join(REALTIME_DIR, "history.jsonl")
+HISTORY_DB = os.path.join(REALTIME_DIR, "history.db")
+OVERLAY_JSON = os.path.join(REALTIME_DIR, "overlay.json")
+SOURCES_JSON = os.path.join(REALTIME_DIR, "sources.json")
+HEALTH_INTERVAL = 1.0
 os.makedirs(REALTIME_DIR, exist_ok=True)
+history_store = HistoryStore(HISTORY_DB, stream="webcam")
 
 
 def _read_stats():
@@ -27,6 +41,23 @@ def _read_stats():
         return {"in": 0, "out": 0, "net": 0, "running": False}
 
 
+def _read_overlay():
+    try:
+        with open(OVERLAY_JSON, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {"mode": "server"}
+
+
+def _read_sources():
+    """Health các nguồn do supervisor ghi (rỗng nếu không chạy --sources)"""
+    try:
+        with open(SOURCES_JSON, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {"sources": []}
+
+
 def _atomic_write_bytes(path, data: bytes):
     fd, tmp = tempfile.mkstemp(prefix="tmp_", dir=os.path.dirname(path))
     try:
@@ -45,193 +76,537 @@ def _atomic_write_json(path, obj):
     _atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
 
 
-def _read_history():
-    """Đọc history (JSONL) thành list dict {t, in, out, net}. Giới hạn 2000 dòng gần nhất."""
-    out = []
-    try:
-        if not os.path.exists(HISTORY_JSONL):
-            return out
-        with open(HISTORY_JSONL, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for line in lines[-2000:]:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                continue
-    except Exception:
-        pass
-    return out
-
-
 def _append_history(stats):
     try:
         row = {"t": round(time.time(), 2), "in": stats.get("in", 0), "out": stats.get("out", 0), "net": stats.get("net", 0)}
-        with open(HISTORY_JSONL, "a", encoding="utf-8") as f:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        history_store.append(row)
     except Exception:
         pass
 
 
-def _clear_history():
+def _start_history_run():
     try:
-        with open(HISTORY_JSONL, "w", encoding="utf-8") as f:
-            pass
-    except Exception:
-        pass
+        history_store.start_run()
+    except Exception as e:
+        print(f"[HISTORY] Cannot start run: {e}")
 
 
 # --- Flask server (stream + API) ---
-def create_app():
-    from flask import Flask, jsonify, Response
+class _ArtifactPump:
+    """
+    Thread nền của server: lấy frame/stats từ shared-memory ring của process webcam
+    (fallback: latest.jpg/stats.json trên disk) rồi publish vào FrameHub.
+    Mọi client /video_feed dùng chung 1 bản copy frame, không client nào tự poll disk.
+    """
+    def __init__(self, hub, state, shm_name=None):
+        import threading
+        from src.encoder import STREAM_TIERS
+        self.tier_names = list(STREAM_TIERS)
+        self.hub = hub
+        self.state = state  # SharedCounter cục bộ của server, nguồn cho /api/stream
+        self.history = HistoryFollower(history_store, state)
+        self._stats_mtime = 0
+        self.shm_name = shm_name
+        self.ring = None
+        self.meta = None  # {"stats": ..., "overlay": ...} mới nhất từ ring
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def get_stats(self):
+        meta = self.meta
+        if self.ring is not None and meta and meta.get("stats") is not None:
+            return meta["stats"]
+        return _read_stats()
+
+    def get_overlay(self):
+        meta = self.meta
+        if self.ring is not None and meta:
+            return meta.get("overlay") or {"mode": "server"}
+        return _read_overlay()
+
+    def get_stream_stats(self):
+        """Subscriber theo tier (server này) + chi phí encode do process webcam báo qua ring"""
+        demand = self.hub.demand()
+        meta = self.meta if self.ring is not None else None
+        encode = (meta or {}).get("encode") or {}
+        out = {}
+        for tier in self.tier_names:
+            item = dict(encode.get(tier, {}))
+            item["subscribers"] = demand.get(tier, 0)
+            out[tier] = item
+        return out
+
+    def _drop_ring(self):
+        from src.metrics import REGISTRY
+        if self.ring is not None:
+            self.ring.close()
+            # Process webcam/nguồn đã dừng (supervisor sẽ tạo lại): bỏ metrics cũ của nó
+            REGISTRY.drop_remote("webcam")
+        self.ring = None
+        self.meta = None
+
+    def _run(self):
+        from src.shm_ring import SharedFrameRing
+        from src.metrics import REGISTRY
+        frame_seq = meta_seq = 0
+        last_mtime = 0
+        next_attach = 0.0
+        while True:
+            try:
+                now = time.time()
+                if self.shm_name and self.ring is None and now >= next_attach:
+                    next_attach = now + 1.0
+                    self.ring = SharedFrameRing.attach(self.shm_name)
+                    frame_seq = meta_seq = 0
+                if self.ring is not None:
+                    if not self.ring.is_alive():
+                        self._drop_ring()
+                        continue
+                    # Báo cho webcam biết tier nào đang có người xem để chỉ encode tier đó
+                    demand = self.hub.demand()
+                    self.ring.write_demand([demand.get(t, 0) for t in self.tier_names])
+                    self.ring.wait(0.5)
+                    frame_seq, frames = self.ring.read_frames(frame_seq)
+                    for idx, data in frames.items():
+                        if idx < len(self.tier_names):
+                            self.hub.publish(data, self.tier_names[idx])
+                    meta_seq, meta = self.ring.read_stats(meta_seq)
+                    if meta is not None:
+                        if meta.get("metrics"):
+                            REGISTRY.set_remote("webcam", meta.pop("metrics"))
+                        self.meta = meta
+                        if meta.get("stats"):
+                            self.state.update_from(meta["stats"])
+                    self.history.poll()
+                    continue
+
+                # Fallback: file artifacts
+                if os.path.exists(LATEST_JPG):
+                    mtime = os.path.getmtime(LATEST_JPG)
+                    if mtime != last_mtime:
+                        last_mtime = mtime
+                        with open(LATEST_JPG, "rb") as f:
+                            data = f.read()
+                        # File chỉ có bản full: dùng chung cho mọi tier đang có người xem
+                        for tier in set(self.hub.demand()) | {self.tier_names[0]}:
+                            self.hub.publish(data, tier)
+                if os.path.exists(STATS_JSON):
+                    mtime = os.path.getmtime(STATS_JSON)
+                    if mtime != self._stats_mtime:
+                        self._stats_mtime = mtime
+                        self.state.update_from(_read_stats())
+                self.history.poll()
+                time.sleep(0.03)
+            except Exception:
+                self._drop_ring()
+                time.sleep(0.1)
+
+
+def create_app(shm_name=None):
+    from flask import Flask, jsonify, Response, request, send_file
+    from src import profiler, live_config, heatmap, hls
     from flask_cors import CORS
+    from shared_state import FrameHub, SharedCounter, stats_event_stream
+    from src.shm_ring import DEFAULT_NAME
+    from src.encoder import STREAM_TIERS, DEFAULT_TIER
+    from src.metrics import REGISTRY, CONTENT_TYPE, QUEUE_DEPTH
     app = Flask(__name__)
     CORS(app)
+    hub = FrameHub()
+    state = SharedCounter()
+    pump = _ArtifactPump(hub, state, shm_name or DEFAULT_NAME)
+    for tier in STREAM_TIERS:
+        QUEUE_DEPTH.set_function(lambda tier=tier: hub.demand().get(tier, 0), queue=f"subscribers_{tier}")
 
     @app.route("/api/result")
     def api_result():
-        return jsonify(_read_stats())
+        return jsonify(pump.get_stats())
+
+    @app.route("/api/stream")
+    def api_stream():
+        return Response(stats_event_stream(state), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     @app.route("/api/history")
     def api_history():
-        return jsonify(_read_history())
+        try:
+            return jsonify(history_response(history_store, request.args))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception:
+            return jsonify([])
+
+    @app.route("/api/overlay")
+    def api_overlay():
+        return jsonify(pump.get_overlay())
+
+    @app.route("/api/stream/stats")
+    def api_stream_stats():
+        return jsonify(pump.get_stream_stats())
+
+    @app.route("/api/sources")
+    def api_sources():
+        return jsonify(_read_sources())
+
+    @app.route("/api/config", methods=["POST"])
+    def api_config():
+        """Đổi line/ROI của nguồn đang xem, áp dụng ở frame kế tiếp (src/live_config.py)"""
+        try:
+            update = live_config.parse_update(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        request_id = live_config.request_update(pump.shm_name, update)
+        applied = live_config.wait_applied(pump.shm_name, request_id)
+        if applied is None:
+            return jsonify({"pending": True, "request_id": request_id, "update": update}), 202
+        return jsonify({"config": applied["config"], "applied_at_frame": applied["frame"]})
+
+    @app.route("/api/admin/profile", methods=["POST"])
+    def api_profile():
+        """Admin: profile vòng webcam của ring đang xem trong ?seconds=N (mode=sample|cprofile)"""
+        if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote_addr):
+            return jsonify({"error": "Forbidden"}), 403
+        body, status = profiler.run_profile(pump.shm_name, request.values)
+        return jsonify(body), status
+
+    @app.route("/api/admin/profiles/<profile_id>/artifact")
+    def api_profile_artifact(profile_id):
+        if not profiler.authorized(request.headers.get("X-Admin-Token", ""), request.remote_addr):
+            return jsonify({"error": "Forbidden"}), 403
+        path = profiler.artifact_path(profile_id)
+        if path is None:
+            return jsonify({"error": "Profile not found"}), 404
+        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    @app.route("/api/heatmap")
+    def api_heatmap():
+        """Heatmap của nguồn đang xem: ?kind=occupancy|flow&format=png|npy|json[&width=]"""
+        snap = heatmap.load(heatmap.heatmap_path(pump.shm_name))
+        if snap is None:
+            return jsonify({"error": "No heatmap yet"}), 404
+        try:
+            body, content_type = heatmap.export(snap, request.args.get("format", "png"),
+                                                request.args.get("kind", "occupancy"), request.args.get("width"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(body, content_type=content_type, headers={"Cache-Control": "no-cache"})
+
+    @app.route("/api/hls")
+    def api_hls():
+        """Playlist HLS của nguồn đang xem (webcam chạy với --hls), 404 nếu chưa có"""
+        if not hls.has_playlist(pump.shm_name):
+            return jsonify({"error": "No HLS stream"}), 404
+        return jsonify({"key": pump.shm_name, "url": hls.playlist_url(pump.shm_name)})
+
+    @app.route("/hls/<key>/<filename>")
+    def hls_file(key, filename):
+        found = hls.resolve(key, filename)
+        if found is None:
+            return jsonify({"error": "Not found"}), 404
+        path, content_type, cache = found
+        resp = send_file(path, mimetype=content_type, conditional=True)
+        resp.headers["Cache-Control"] = cache
+        return resp
 
     @app.route("/api/export/csv")
     def api_export_csv():
-        import csv
-        from io import BytesIO, StringIO
-        from flask import send_file
-        history = _read_history()
-        si = StringIO()
-        w = csv.writer(si)
-        w.writerow(["Thoi_gian", "IN", "OUT", "NET"])
-        for row in history:
-            t = row.get("t", "")
-            if isinstance(t, (int, float)):
-                t = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
-            w.writerow([t, row.get("in", 0), row.get("out", 0), row.get("net", 0)])
-        buf = BytesIO(si.getvalue().encode("utf-8-sig"))
-        return send_file(
-            buf, mimetype="text/csv", as_attachment=True,
-            download_name=f"counting_{time.strftime('%Y%m%d_%H%M%S')}.csv"
-        )
+        try:
+            chunks = iter_csv(history_store, request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        filename = f"counting_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        return Response(chunks, mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
 
     @app.route("/video_feed")
     def video_feed():
+        tier = request.args.get("tier", DEFAULT_TIER)
+        if tier not in STREAM_TIERS:
+            tier = DEFAULT_TIER
+
         def gen():
-            last_mtime = 0
-            while True:
-                try:
-                    if os.path.exists(LATEST_JPG):
-                        mtime = os.path.getmtime(LATEST_JPG)
-                        if mtime != last_mtime:
-                            last_mtime = mtime
-                            with open(LATEST_JPG, "rb") as f:
-                                yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + f.read() + b"\r\n")
-                    time.sleep(0.03)
-                except Exception:
-                    time.sleep(0.1)
+            with hub.subscribe(tier):
+                last_seq = 0
+                while True:
+                    seq, data = hub.wait_for(last_seq, timeout=1.0, tier=tier)
+                    if data and seq != last_seq:
+                        yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + data + b"\r\n")
+                    last_seq = seq
         return Response(gen(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
     return app
 
 
-def run_server(port=5001):
-    app = create_app()
+def run_server(port=5001, shm_name=None, use_async=False, max_viewers=None, source_id=None):
+    history_store.import_jsonl(HISTORY_JSONL)
+    if source_id:
+        # Xem 1 nguồn của supervisor: ring và history stream riêng của nguồn đó
+        shm_name = f"{shm_name}_{source_id}"
+        history_store.stream = source_id
+    history_store.start_compactor()
+    if use_async:
+        from async_server import run_async_server, DEFAULT_MAX_VIEWERS
+        run_async_server(port, shm_name, max_viewers or DEFAULT_MAX_VIEWERS)
+        return
+    app = create_app(shm_name)
     app.run(host="0.0.0.0", port=port, threaded=True, debug=False, use_reloader=False)
 
 
 # --- Webcam mode ---
-def run_webcam(args):
+def _open_capture(source, width=0, height=0):
+    import cv2
+    cap = cv2.VideoCapture(source)
+    if cap.isOpened():
+        if width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, float(width))
+        if height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(height))
+    return cap
+
+
+def source_args(spec, shm_name="track_people_ring"):
+    """Namespace tham số webcam cho 1 nguồn trong config supervisor (mặc định như CLI, luôn publish qua shm)"""
+    args = _build_parser().parse_args([])
+    for key, value in spec.items():
+        if key not in ("id", "source", "cpus"):
+            setattr(args, key.replace("-", "_"), value)
+    args.source = spec["source"]
+    args.source_id = spec["id"]
+    args.shm = True
+    args.shm_name = shm_name
+    args.show = False
+    return args
+
+
+def run_webcam(args, report=None):
+    """
+    Capture + detect + đếm cho 1 nguồn: camera index (--cam), file video (--video, --loop) hoặc URL stream.
+    report(health): callback health mỗi giây (supervisor). Trả về False nếu không mở được nguồn.
+    """
     import cv2
     from shared_state import counter_state
     from src.tracker import PersonTracker
     from src.counter import PeopleCounter
+    from src.overlay import OverlayRenderer
+    from src.shm_ring import SharedFrameRing
+    from src.encoder import STREAM_TIERS, TieredEncoder
+    from src.supervisor import is_file_source
+    from src import metrics
+    from src.timing import FpsMeter
+    from src.profiler import ProfileControl
+    from src.capture import LatestFrameGrabber
+    from src import live_config
+    from src.heatmap import FlowHeatmap, heatmap_path
+    from src.hls import HlsEncoder, hls_dir
+    from src.zones import ZoneTracker, parse_zones
+    from src.reid import ReIdCache
+
+    source = args.cam if args.source is None else args.source
+    is_file = is_file_source(source)
+    label = args.source_id or (f"Camera {source}" if not is_file else os.path.basename(source))
+    if args.source_id:
+        history_store.stream = args.source_id
+    stream = args.source_id or "webcam"
+    stage_metrics = timer = metrics.StageMetrics(stream=stream)
+    fps_meter = FpsMeter()
+    metrics_pushed = 0.0
 
     counter_state.reset()
-    counter_state.running = True
-    _clear_history()
-    cap = cv2.VideoCapture(args.cam)
-    if not cap.isOpened():
-        print(f"[REALTIME] Cannot open camera {args.cam}")
-        counter_state.running = False
+    counter_state.set_running(True)
+    _start_history_run()
+    # Capture chạy trên thread riêng, vòng xử lý luôn lấy frame mới nhất (src/capture.py)
+    grabber = LatestFrameGrabber(lambda: _open_capture(source, args.width, args.height),
+                                 is_file=is_file, loop=args.loop, label=label, timer=stage_metrics)
+    if not grabber.open():
+        print(f"[REALTIME] Cannot open {label}")
+        grabber.stop()
+        counter_state.set_running(False)
         if args.write_artifacts:
             _atomic_write_json(STATS_JSON, counter_state.get())
-        return
-
-    if args.width:
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, float(args.width))
-    if args.height:
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(args.height))
+        return False
 
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
-    fps = float(cap.get(cv2.CAP_PROP_FPS) or 30.0)
-    delay = 1.0 / fps if fps > 0 else 1.0 / 30.0
+    w, h, fps = grabber.width, grabber.height, grabber.fps
     line_x = args.line_x if args.line_x is not None else (w // 2)
     line_x = max(50, min(line_x, w - 50))
 
     # Tracker tự động detect, không cần detector riêng
-    tracker = PersonTracker()
+    tracker = PersonTracker(imgsz=args.imgsz or None)
+    # Warm-up trước khi mở capture thread: frame đầu không phải chờ fuse/khởi tạo predictor
+    tracker.warmup()
     counter = PeopleCounter(
         line_y=h // 2, line_angle=0, line_x1=0, line_x2=w,
         frame_width=w, frame_height=h, line_type="vertical", line_x=line_x,
     )
-    print(f"[REALTIME] Camera {args.cam} {w}x{h} | Line X={line_x} (Trái→Phải=IN, Phải→Trái=OUT)")
+    # Re-id: ID mới của người đã đếm (sau khi bị che khuất) không bị đếm lại (src/reid.py)
+    reid = ReIdCache(counter, stream=stream)
+    # Vùng đa giác: số người trong vùng + dwell time (src/zones.py), báo qua counter_state["zones"]
+    zones_arg = args.zones
+    if isinstance(zones_arg, str) and os.path.isfile(zones_arg):
+        with open(zones_arg, "r", encoding="utf-8") as f:
+            zones_arg = json.load(f)
+    zones = ZoneTracker(parse_zones(zones_arg), stream=stream)
+    # Layer tĩnh (line + label + vùng) render 1 lần, stats box chỉ vẽ lại khi số đếm đổi
+    overlay = OverlayRenderer.from_counter(counter, zones=zones.config())
+    client_overlay = (args.overlay == "client")
+    if args.write_artifacts:
+        _atomic_write_json(OVERLAY_JSON, overlay.geometry() if client_overlay else {"mode": "server"})
+    print(f"[REALTIME] {label} {w}x{h} | Line X={line_x} (Trái→Phải=IN, Phải→Trái=OUT)")
+
+    ring = None
+    if args.shm:
+        ring_name = f"{args.shm_name}_{args.source_id}" if args.source_id else args.shm_name
+        ring = SharedFrameRing.create(ring_name)
+        print(f"[REALTIME] Shared-memory ring: {ring_name}")
+    # Profile theo yêu cầu từ server (src/profiler.py), target = tên ring của nguồn
+    profile = ProfileControl(ring.name if ring is not None else stream)
+    timer = profile.wrap(timer)
+    # Đổi line/ROI khi đang chạy (src/live_config.py), áp dụng giữa 2 frame
+    live = live_config.LiveConfig(ring.name if ring is not None else stream)
+    # Heatmap occupancy/flow của nguồn (src/heatmap.py), cũ dần theo --heatmap-half-life
+    heatmap = FlowHeatmap(w, h, half_life=args.heatmap_half_life, fps=fps,
+                          path=heatmap_path(ring.name if ring is not None else stream))
+    publish = args.write_artifacts or ring is not None
+    # Chỉ encode tier mà server đang có client xem (demand ghi trong ring); file artifacts luôn cần bản full
+    tier_names = list(STREAM_TIERS)
+    encoder = TieredEncoder(always=("full",) if args.write_artifacts else ())
+    # HLS: encode H.264 1 lần (ffmpeg) cho mọi viewer, độc lập với encode JPEG theo nhu cầu ở trên
+    hls = None
+    if args.hls:
+        hls = HlsEncoder(hls_dir(ring.name if ring is not None else stream), w, h, fps)
+        hls.start()
 
     win = "Realtime (q=quit)"
     if args.show:
         cv2.namedWindow(win, cv2.WINDOW_NORMAL)
 
+    # Health: fps xử lý, độ trễ capture → đếm xong (latency_ms), frame bị bỏ vì đã có frame mới hơn (dropped)
+    health = {"state": "running", "fps": 0.0, "source_fps": round(fps, 1), "latency_ms": 0.0,
+              "frames": 0, "dropped": 0, "reconnects": 0}
+    meter = {"t": time.time(), "n": 0}
+
+    def report_health(state="running"):
+        now = time.time()
+        if report is None or (now - meter["t"] < HEALTH_INTERVAL and state == health["state"]):
+            return
+        health["fps"] = round(meter["n"] / max(now - meter["t"], 1e-6), 1)
+        meter["t"], meter["n"] = now, 0
+        stats = counter_state.get()
+        health.update(state=state, frames=n, dropped=grabber.dropped, reconnects=grabber.reconnects,
+                      **{"in": stats["in"], "out": stats["out"]})
+        report(dict(health))
+
+    def sync_drop_metrics():
+        # Đồng bộ số frame bị bỏ / đọc lỗi của thread capture sang counter metrics
+        for reason, total in (("stale", grabber.dropped), ("read_error", grabber.read_errors)):
+            if total > seen[reason]:
+                metrics.FRAMES_DROPPED.inc(total - seen[reason], stream=stream, reason=reason)
+                seen[reason] = total
+
     n = 0
+    seen = {"stale": 0, "read_error": 0}
+    flip_buf = None  # buffer --flip dùng lại giữa các frame
+    grabber.start()
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
-                time.sleep(0.05)
+            profile.poll()
+            request = live.poll()
+            if request is not None:
+                overlay, applied = live_config.apply(request["update"], counter, tracker, zones)
+                live.applied(request, applied, n)
+                if args.write_artifacts and not client_overlay:
+                    _atomic_write_json(OVERLAY_JSON, {"mode": "server"})
+            # Chờ frame mới từ thread capture (thời gian rảnh khi xử lý nhanh hơn nguồn)
+            with timer.stage("pacing"):
+                item = grabber.latest(timeout=0.5)
+            if item is None:
+                if grabber.state == "eof":
+                    break
+                sync_drop_metrics()
+                report_health(grabber.state)
                 continue
+            # item.frame là buffer của pool capture (src/frame_pool.py), vẽ overlay thẳng lên đó
+            frame = item.frame
             if args.flip:
-                frame = cv2.flip(frame, 1)
+                frame = flip_buf = cv2.flip(frame, 1, dst=flip_buf)
             n += 1
+            meter["n"] += 1
+            metrics.FRAMES.inc(stream=stream)
 
             # Tracker tự động detect và track, không cần detector riêng
-            tracks = tracker.update(None, frame)
-
-            cv2.line(frame, (line_x, 0), (line_x, h), (0, 255, 255), 3)
-            cv2.putText(frame, "Trai -> Phai = VAO", (line_x + 15, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            cv2.putText(frame, "Phai -> Trai = RA", (line_x + 15, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-
-            for track in tracks:
-                if not track.is_confirmed():
-                    continue
-                try:
-                    l, t, r, b = map(int, track.to_ltrb())
-                    cx, cy = (l + r) // 2, (t + b) // 2
-                    counter.update(track.track_id, cx, cy, counter_state)
-                    cv2.rectangle(frame, (l, t), (r, b), (0, 255, 0), 2)
-                    cv2.putText(frame, f"ID {track.track_id}", (l, t - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                except Exception:
-                    continue
+            with timer.stage("track"):
+                tracks = tracker.update(None, frame)
+
+            before = counter_state.get()
+            boxes = []
+            with timer.stage("count"):
+                reid.begin(frame, item.captured_at, [tr.track_id for tr in tracks if tr.is_confirmed()])
+                for track in tracks:
+                    if not track.is_confirmed():
+                        continue
+                    try:
+                        l, t, r, b = map(int, track.to_ltrb())
+                        cx, cy = (l + r) // 2, (t + b) // 2
+                        reid.match_new(track.track_id, l, t, r, b)
+                        counted = counter.update(track.track_id, cx, cy, counter_state)
+                        if counted:
+                            reid.remember(track.track_id, l, t, r, b, counted)
+                        boxes.append((track.track_id, l, t, r, b))
+                    except Exception:
+                        continue
+                reid.end(boxes)
+                zones.update(boxes, item.captured_at)
+                zones.report(counter_state, item.captured_at)
+
+            with timer.stage("heatmap"):
+                heatmap.update(boxes)
+                heatmap.autosave()
 
             stats = counter_state.get()
-            cv2.rectangle(frame, (10, 10), (300, 120), (0, 0, 0), -1)
-            cv2.rectangle(frame, (10, 10), (300, 120), (255, 255, 255), 2)
-            cv2.putText(frame, f"IN: {stats['in']}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            cv2.putText(frame, f"OUT: {stats['out']}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            cv2.putText(frame, f"NET: {stats['net']}", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                        (255, 255, 0) if stats["net"] >= 0 else (0, 165, 255), 2)
-
-            # Luôn ghi frame khi write_artifacts được bật để stream mượt hơn
-            if args.write_artifacts:
+            latency = time.time() - item.captured_at
+            health["latency_ms"] = round(latency * 1000, 1)
+            metrics.CAPTURE_LATENCY.observe(latency, stream=stream)
+            metrics.ACTIVE_TRACKS.set(len(boxes), stream=stream)
+            metrics.record_crossings(stream, stats["in"] - before["in"], stats["out"] - before["out"])
+            if not client_overlay:
+                with timer.stage("draw"):
+                    overlay.render(frame, boxes, stats)
+
+            if hls is not None:
+                with timer.stage("encode"):
+                    hls.submit(frame)
+
+            # Publish frame mỗi frame để stream mượt hơn: shm ring (nếu bật) và/hoặc file artifacts
+            if publish:
                 try:
-                    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    if ok:
-                        _atomic_write_bytes(LATEST_JPG, buf.tobytes())
-                    # Chỉ cập nhật stats và history theo write_every để giảm I/O
+                    if ring is not None:
+                        demand = ring.read_demand()
+                        encoder.remote_demand = {t: demand[i] for i, t in enumerate(tier_names)}
+                    with timer.stage("encode"):
+                        encoded = encoder.publish(frame, item.buffer)
+                    payload = overlay.payload(boxes, stats, n) if client_overlay else None
+                    if ring is not None:
+                        for tier, buf in encoded.items():
+                            ring.write_frame(buf, tier_names.index(tier))
+                        meta = {"stats": stats, "overlay": payload, "encode": encoder.stats()}
+                        # Snapshot metrics cho /metrics của server khoảng mỗi giây (stats vượt STATS_SIZE thì bỏ)
+                        if time.time() - metrics_pushed >= 1.0:
+                            metrics_pushed = time.time()
+                            if ring.write_stats(dict(meta, metrics=metrics.REGISTRY.snapshot())):
+                                meta = None
+                        if meta is not None:
+                            ring.write_stats(meta)
+                    if args.write_artifacts:
+                        if "full" in encoded:
+                            _atomic_write_bytes(LATEST_JPG, encoded["full"].tobytes())
+                        if client_overlay:
+                            _atomic_write_json(OVERLAY_JSON, payload)
+                    # Chỉ cập nhật stats file và history theo write_every để giảm I/O
                     if n % max(1, args.write_every) == 0:
-                        _atomic_write_json(STATS_JSON, stats)
+                        if args.write_artifacts:
+                            _atomic_write_json(STATS_JSON, stats)
                         # Ghi history mỗi 10 frame để đồng bộ với offline mode
                         if n % 10 == 0:
                             _append_history(stats)
@@ -243,41 +618,91 @@ def run_webcam(args):
                 cv2.imshow(win, frame)
                 if cv2.waitKey(1) & 0xFF == ord("q"):
                     break
-            time.sleep(delay * 0.5)
+            item.release()  # buffer quay lại pool cho thread capture
+            sync_drop_metrics()
+            if fps_meter.tick():
+                metrics.FPS.set(round(fps_meter.fps, 2), stream=stream)
+            report_health()
     except KeyboardInterrupt:
-        print("\n[REALTIME] Stopped.")
+        print(f"\n[REALTIME] {label}: stopped.")
     finally:
-        counter_state.running = False
+        profile.close()
+        heatmap.save()
+        if hls is not None:
+            hls.close()
+        counter_state.set_running(False)
+        report_health("stopped")
         if args.write_artifacts:
             try:
                 _atomic_write_json(STATS_JSON, counter_state.get())
             except Exception:
                 pass
-        cap.release()
+        if ring is not None:
+            ring.close()
+        grabber.stop()
         if args.show:
             cv2.destroyAllWindows()
+    return True
 
 
-def main():
+def run_supervisor(args):
+    from src.supervisor import Supervisor, load_sources
+    try:
+        sources, cpus_per_source = load_sources(args.sources)
+    except (OSError, ValueError) as e:
+        print(f"[SUPERVISOR] Invalid sources config {args.sources}: {e}")
+        return
+    Supervisor(sources, shm_name=args.shm_name, cpus_per_source=cpus_per_source).run()
+
+
+def _build_parser():
     p = argparse.ArgumentParser(description="Realtime: Flask stream server hoặc webcam đếm người.")
     p.add_argument("--serve", action="store_true", help="Chạy Flask server (video_feed + api/result), port 5001")
     p.add_argument("--cam", type=int, default=None, metavar="INDEX", help="Camera index → chạy mode webcam")
+    p.add_argument("--video", dest="source", default=None, metavar="PATH",
+                   help="File video hoặc URL stream thay cho camera")
+    p.add_argument("--loop", action="store_true", help="--video: chạy lặp file (giả lập stream) theo đúng fps")
+    p.add_argument("--sources", default=None, metavar="CONFIG",
+                   help="Config JSON nhiều nguồn → chạy supervisor (mỗi nguồn 1 process)")
+    p.add_argument("--source-id", default=None,
+                   help="Id nguồn: ring <shm-name>_<id> và history stream riêng (server: xem nguồn này)")
     p.add_argument("--width", type=int, default=0)
     p.add_argument("--height", type=int, default=0)
     p.add_argument("--flip", action="store_true", help="Lật ngang frame")
+    p.add_argument("--imgsz", type=int, default=0, help="Kích thước input YOLO (mặc định TRACKER_IMGSZ / 640)")
     p.add_argument("--line-x", type=int, default=None, help="Vị trí đường dọc (mặc định giữa)")
     p.add_argument("--show", action="store_true", help="Hiện cửa sổ OpenCV")
     p.add_argument("--write-artifacts", action="store_true", help="Ghi realtime/latest.jpg và stats.json")
     p.add_argument("--write-every", type=int, default=2)
+    p.add_argument("--zones", default=None, metavar="JSON",
+                   help='Vùng đa giác (chuỗi JSON hoặc file): [{"id": "queue", "points": [[x, y], ...]}]')
+    p.add_argument("--heatmap-half-life", type=float, default=600.0,
+                   help="Giây để heatmap occupancy/flow cũ giảm một nửa (0 = cộng dồn mãi)")
+    p.add_argument("--hls", action="store_true",
+                   help="Webcam: encode thêm HLS H.264 (cần ffmpeg) vào realtime/hls/<ring>/ cho dashboard")
+    p.add_argument("--overlay", choices=("server", "client"), default="server",
+                   help="server: vẽ overlay lên frame; client: ghi frame gốc + overlay.json để dashboard tự vẽ")
     p.add_argument("--port", type=int, default=None, help="Port Flask (mặc định 5001)")
-    args = p.parse_args()
+    p.add_argument("--shm", action="store_true", help="Webcam: publish frame/stats qua shared-memory ring cho server")
+    p.add_argument("--shm-name", default="track_people_ring", help="Tên shared-memory ring (webcam và server phải giống nhau)")
+    p.add_argument("--async", dest="use_async", action="store_true",
+                   help="Server: dùng aiohttp (async_server.py) thay cho Flask, hợp với nhiều viewer")
+    p.add_argument("--max-viewers", type=int, default=None,
+                   help="Server async: số viewer /video_feed tối đa (mặc định REALTIME_MAX_VIEWERS hoặc 500)")
+    return p
+
+
+def main():
+    args = _build_parser().parse_args()
 
     port = args.port or int(os.environ.get("REALTIME_PORT", "5001"))
 
-    if args.cam is not None:
+    if args.sources:
+        run_supervisor(args)
+    elif args.cam is not None or args.source is not None:
         run_webcam(args)
     else:
-        run_server(port)
+        run_server(port, args.shm_name, args.use_async, args.max_viewers, args.source_id)
 
 
 if __name__ == "__main__":
@@ -1,33 +1,210 @@
+import json
 import threading
+from collections import deque
+from contextlib import contextmanager
 
 class SharedCounter:
+    """
+    Số đếm IN/OUT (và tổng kết vùng/dwell của src/zones.py nếu có cấu hình vùng) dùng chung giữa worker và server.
+    Mỗi thay đổi (đếm, running, điểm history mới) tăng version và đánh thức các
+    subscriber đang chờ (SSE /api/stream) thay vì để dashboard poll liên tục.
+    """
     def __init__(self):
         self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        self.history_seq = 0
+        self.history_epoch = 0
+        self.history = deque(maxlen=500)  # [(seq, row)] các điểm history gần nhất cho push
+        self.listeners = []  # callback() không block, gọi mỗi lần thay đổi (server async)
         self.reset()
 
+    def _bump(self):
+        # Gọi khi đang giữ lock
+        self.version += 1
+        self.changed.notify_all()
+        for fn in self.listeners:
+            fn()
+
     def reset(self):
         with self.lock:
             self.in_count = 0
             self.out_count = 0
             self.running = False
+            self.zones = None
+            self.history.clear()
+            self.history_epoch += 1
+            self._bump()
+
+    def set_running(self, running):
+        with self.lock:
+            if self.running != running:
+                self.running = running
+                self._bump()
 
     def add_in(self):
         with self.lock:
             self.in_count += 1
+            self._bump()
 
     def add_out(self):
         with self.lock:
             self.out_count += 1
+            self._bump()
+
+    def set_zones(self, zones):
+        """Tổng kết vùng {zone_id: {occupancy, dwell_p50, ...}}, None khi không có vùng"""
+        with self.lock:
+            if zones != self.zones:
+                self.zones = zones
+                self._bump()
+
+    def update_from(self, stats):
+        """Đồng bộ từ stats của process khác (realtime server đọc shm ring / stats.json)"""
+        with self.lock:
+            in_count, out_count = stats.get("in", 0), stats.get("out", 0)
+            running = bool(stats.get("running", False))
+            zones = stats.get("zones")
+            if (in_count, out_count, running, zones) != (self.in_count, self.out_count, self.running, self.zones):
+                self.in_count, self.out_count, self.running, self.zones = in_count, out_count, running, zones
+                self._bump()
+
+    def add_history(self, row):
+        with self.lock:
+            self.history_seq += 1
+            self.history.append((self.history_seq, row))
+            self._bump()
+
+    def history_since(self, seq):
+        """Trả về (các row có seq > seq, seq mới nhất)"""
+        with self.lock:
+            return [row for s, row in self.history if s > seq], self.history_seq
+
+    def wait_for_change(self, version, timeout=None):
+        """Block đến khi version khác giá trị đã biết (hoặc hết timeout), trả về version hiện tại"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
 
     def get(self):
         with self.lock:
-            return {
+            stats = {
                 "in": self.in_count,
                 "out": self.out_count,
                 "net": self.in_count - self.out_count,
                 "running": self.running
             }
+            if self.zones is not None:
+                stats["zones"] = self.zones
+            return stats
 
 counter_state = SharedCounter()
 def get_shared_counter():
-    return counter_state
\ No newline at end of file
+    return counter_state
+
+
+class StatsEventCursor:
+    """
+    Vị trí của 1 client SSE trên SharedCounter: poll() trả về các event cần gửi kể từ lần trước.
+    - event "stats": số đếm IN/OUT/NET/running khi có thay đổi
+    - event "history": từng điểm history mới
+    - event "reset": khi bắt đầu phiên mới (dashboard xoá biểu đồ)
+    Dùng chung cho server thread (stats_event_stream) và server async (async_server.py).
+    """
+    def __init__(self, counter):
+        self.counter = counter
+        self.version = -1
+        _, self.history_seq = counter.history_since(0)
+        self.epoch = counter.history_epoch
+        self.last_stats = None
+
+    def poll(self):
+        counter = self.counter
+        self.version = counter.version
+        events = []
+        if counter.history_epoch != self.epoch:
+            self.epoch = counter.history_epoch
+            self.history_seq = 0
+            events.append("event: reset\ndata: {}\n\n")
+        stats = counter.get()
+        if stats != self.last_stats:
+            self.last_stats = stats
+            events.append(f"event: stats\ndata: {json.dumps(stats)}\n\n")
+        rows, self.history_seq = counter.history_since(self.history_seq)
+        for row in rows:
+            events.append(f"event: history\ndata: {json.dumps(row)}\n\n")
+        return events
+
+
+def stats_event_stream(counter, keepalive=15.0):
+    """Generator Server-Sent Events: chỉ gửi khi SharedCounter thay đổi"""
+    yield "retry: 3000\n\n"
+    cursor = StatsEventCursor(counter)
+    while True:
+        version = cursor.version
+        if counter.wait_for_change(version, timeout=keepalive) == version:
+            yield ": keepalive\n\n"
+            continue
+        yield from cursor.poll()
+
+class FrameHub:
+    """
+    Publish/subscribe trong process cho frame JPEG đã encode, theo từng tier (full, thumb, ...).
+    Giữ frame mới nhất của mỗi tier kèm sequence number; subscriber block trên condition
+    variable đến khi có frame mới thay vì poll file latest.jpg.
+    Số subscriber theo tier được đếm để encoder chỉ encode tier đang có người xem.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.frames = {}        # {tier: (seq, data)}
+        self.subscribers = {}   # {tier: số client đang xem}
+        self.on_subscribe = None  # callback(tier) khi có client mới (TieredEncoder dùng)
+        self.listeners = []       # callback(tier) không block khi có frame mới (server async)
+
+    def publish(self, data, tier="full"):
+        with self.cond:
+            self.seq += 1
+            self.frames[tier] = (self.seq, data)
+            self.cond.notify_all()
+        for fn in self.listeners:
+            fn(tier)
+
+    def latest(self, tier="full"):
+        with self.cond:
+            return self.frames.get(tier, (0, None))
+
+    def wait_for(self, last_seq, timeout=None, tier="full"):
+        """
+        Chờ đến khi tier có frame khác last_seq.
+        Trả về (seq, frame); hết timeout thì trả về frame hiện tại (seq không đổi).
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.frames.get(tier, (0, None))[0] != last_seq, timeout)
+            return self.frames.get(tier, (0, None))
+
+    @contextmanager
+    def subscribe(self, tier="full"):
+        """Đăng ký 1 client xem tier trong suốt block with"""
+        with self.cond:
+            self.subscribers[tier] = self.subscribers.get(tier, 0) + 1
+        callback = self.on_subscribe
+        if callback is not None:
+            try:
+                callback(tier)
+            except Exception:
+                pass
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.subscribers[tier] -= 1
+
+    def demand(self):
+        """Số client đang xem theo tier (chỉ tier > 0)"""
+        with self.cond:
+            return {tier: n for tier, n in self.subscribers.items() if n > 0}
+
+frame_hub = FrameHub()
+def get_frame_hub():
+    return frame_hub
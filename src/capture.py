@@ -0,0 +1,196 @@
+"""
+Thread capture riêng cho nguồn realtime: luôn giữ frame mới nhất, bỏ frame cũ.
+
+Khi inference chậm hơn camera, đọc cap.read() cùng thread với inference làm frame dồn trong buffer
+của driver → số đếm trễ so với thực tế vài giây. LatestFrameGrabber đọc liên tục trên thread riêng,
+vòng xử lý lấy frame mới nhất (latest) và frame chưa kịp xử lý bị bỏ (đếm vào dropped).
+
+- Camera / URL stream: đọc hết tốc độ nguồn; mất tín hiệu RECONNECT_AFTER giây thì mở lại với backoff
+- File (--video): đọc đúng nhịp fps của file như 1 camera (--loop: quay lại đầu file)
+- Mỗi frame kèm thời điểm capture (time.time()) để đo độ trễ capture → đếm xong (glass-to-count)
+- Decode thẳng vào buffer của FramePool (src/frame_pool.py): frame bị bỏ trả buffer về pool ngay,
+  vòng xử lý giữ buffer của frame đang xử lý tới khi gọi item.release()
+
+    grabber = LatestFrameGrabber(open_fn, is_file=False).start()
+    item = grabber.latest(timeout=1.0)   # CapturedFrame hoặc None
+    ...                                  # item.frame ghi được (vẽ overlay), không bị capture ghi đè
+    item.release()
+    grabber.stop()
+"""
+import threading
+import time
+
+from src.frame_pool import FramePool
+from src.timing import NULL_TIMER
+
+RECONNECT_AFTER = 2.0   # giây không đọc được frame thì mở lại camera/stream
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 30.0
+
+
+class CapturedFrame:
+    __slots__ = ("frame", "seq", "captured_at", "buffer")
+
+    def __init__(self, frame, seq, captured_at, buffer=None):
+        self.frame = frame
+        self.seq = seq
+        self.captured_at = captured_at
+        self.buffer = buffer  # PooledFrame chứa frame (None nếu frame không thuộc pool)
+
+    def retain(self):
+        if self.buffer is not None:
+            self.buffer.retain()
+        return self
+
+    def release(self):
+        if self.buffer is not None:
+            self.buffer.release()
+
+
+class LatestFrameGrabber:
+    """
+    open_fn(): trả về cv2.VideoCapture đã mở (gọi lại khi reconnect).
+    Thống kê: captured (frame đọc được), consumed (frame đã lấy xử lý), dropped (bị frame mới hơn thay),
+    read_errors, reconnects, frame_pool; state: "running" | "reconnecting" | "eof".
+    """
+    def __init__(self, open_fn, is_file=False, loop=False, label="source", timer=NULL_TIMER, pool=None):
+        self.open_fn = open_fn
+        # Buffer: 1 đang decode + 1 chờ lấy + 1-2 đang xử lý/encode
+        self.pool = pool or FramePool()
+        self.timer = timer  # stage "decode" đo trên thread capture
+        self.is_file = is_file
+        self.loop = loop
+        self.label = label
+        self.cap = None
+        self.fps = 30.0
+        self.width = 0
+        self.height = 0
+        self.state = "running"
+        self.captured = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.read_errors = 0
+        self.reconnects = 0
+        self._item = None
+        self._last_seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Mở nguồn lần đầu trên thread gọi; False nếu không mở được"""
+        import cv2
+        self.cap = self.open_fn()
+        if not self.cap.isOpened():
+            return False
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
+        fps = float(self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        self.fps = fps if fps > 0 else 30.0
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.label}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        import cv2
+        delay = 1.0 / self.fps
+        due = time.perf_counter()
+        fail_since = None
+        next_reconnect = 0.0
+        backoff = RECONNECT_MIN
+        shape = (self.height, self.width, 3)
+        while not self._stop.is_set():
+            buf = self.pool.acquire(shape)
+            with self.timer.stage("decode"):
+                ret, frame = self.cap.read(buf.array)
+            if not ret and self.is_file and self.loop:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.cap.read(buf.array)
+                due = time.perf_counter()
+            if ret and frame is not buf.array:
+                # Kích thước thật khác CAP_PROP (hoặc camera đổi độ phân giải sau reconnect): pool theo frame mới
+                buf.release()
+                shape = frame.shape
+                buf = self.pool.acquire(shape)
+                buf.array[...] = frame
+            if not ret:
+                buf.release()
+                if self.is_file:
+                    print(f"[CAPTURE] {self.label}: end of file")
+                    self._set_state("eof")
+                    return
+                # Camera/stream mất tín hiệu: mở lại với backoff thay vì đọc lỗi mãi
+                self.read_errors += 1
+                self._set_state("reconnecting")
+                now = time.time()
+                fail_since = fail_since or now
+                if now - fail_since >= RECONNECT_AFTER and now >= next_reconnect:
+                    print(f"[CAPTURE] {self.label}: no frames for {now - fail_since:.0f}s, reopening")
+                    self.cap.release()
+                    self.cap = self.open_fn()
+                    self.reconnects += 1
+                    next_reconnect = now + backoff
+                    backoff = min(RECONNECT_MAX, backoff * 2)
+                self._stop.wait(0.05)
+                continue
+            fail_since = None
+            backoff = RECONNECT_MIN
+            self._push(buf)
+            if self.is_file:
+                # File giả lập camera: giữ đúng nhịp fps, chậm quá xa thì bỏ phần nợ thay vì đọc dồn
+                due += delay
+                now = time.perf_counter()
+                if due > now:
+                    self._stop.wait(due - now)
+                elif now - due > 1.0:
+                    due = now
+
+    def _push(self, buf):
+        with self._cond:
+            if self._item is not None:
+                if self._item.seq > self._last_seq:
+                    self.dropped += 1  # frame trước chưa được lấy → bỏ
+                self._item.release()  # phần của grabber; vòng xử lý còn giữ thì buffer chưa về pool
+            self.captured += 1
+            self._item = CapturedFrame(buf.array, self.captured, time.time(), buf)
+            self.state = "running"
+            self._cond.notify_all()
+
+    def _set_state(self, state):
+        with self._cond:
+            self.state = state
+            self._cond.notify_all()
+
+    def latest(self, timeout=1.0):
+        """
+        Frame mới nhất chưa xử lý; chờ tối đa timeout giây, None nếu chưa có (hoặc hết file).
+        Gọi item.release() khi xử lý xong để buffer quay lại pool.
+        """
+        with self._cond:
+            end = time.monotonic() + timeout
+            while self._item is None or self._item.seq <= self._last_seq:
+                remaining = end - time.monotonic()
+                if remaining <= 0 or self.state == "eof" or self._stop.is_set():
+                    return None
+                self._cond.wait(remaining)
+            item = self._item.retain()  # người gọi release() khi xử lý xong
+            self._last_seq = item.seq
+            self.consumed += 1
+            return item
+
+    def stats(self):
+        return {"captured": self.captured, "consumed": self.consumed, "dropped": self.dropped,
+                "read_errors": self.read_errors, "reconnects": self.reconnects, "state": self.state,
+                "frame_pool": self.pool.stats()}
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.cap is not None:
+            self.cap.release()
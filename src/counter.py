@@ -8,42 +8,9 @@ class PeopleCounter:
     """
     def __init__(self, line_y, line_angle=0, line_x1=0, line_x2=640, frame_width=640, frame_height=480,
                  line_type="horizontal", line_x=None):
-        self.line_type = line_type
-        self.line_y = line_y
-        self.line_angle = line_angle
-        self.line_x1 = line_x1
-        self.line_x2 = line_x2
         self.frame_width = frame_width
         self.frame_height = frame_height
-        # Vertical: đường dọc tại x = line_x (mặc định giữa khung)
-        self.line_x = int(line_x) if line_x is not None else (frame_width // 2)
-
-        if line_type == "vertical":
-            # Đường dọc: x - line_x = 0
-            self.a = 1
-            self.b = 0
-            self.c = -self.line_x
-        elif line_angle == 0:
-            # Horizontal line: y = line_y
-            self.a = 0
-            self.b = 1
-            self.c = -line_y
-        else:
-            # Angled line: calculate from two points
-            angle_rad = math.radians(line_angle)
-            center_x = (line_x1 + line_x2) / 2
-            center_y = line_y
-            dx = math.cos(angle_rad)
-            dy = math.sin(angle_rad)
-            if abs(dx) > 1e-6:
-                tan_angle = dy / dx
-                self.a = -tan_angle
-                self.b = 1
-                self.c = tan_angle * center_x - center_y
-            else:
-                self.a = 1
-                self.b = 0
-                self.c = -center_x
+        self._set_geometry(line_type, line_y, line_angle, line_x1, line_x2, line_x)
 
         # 3 cấu trúc dữ liệu chính để tránh double count
         self.track_history = {}      # Lưu vị trí trước đó của từng ID: {track_id: (x, y)}
@@ -62,6 +29,54 @@ class PeopleCounter:
         # Chỉ đếm khi người đã vượt qua line một khoảng cách đủ xa
         self.MIN_DISTANCE = 40  # pixels
 
+        # In log mỗi lần đếm (tắt khi replay/sweep hàng nghìn frame/giây)
+        self.verbose = True
+
+    def _set_geometry(self, line_type, line_y, line_angle, line_x1, line_x2, line_x):
+        # Vertical: đường dọc tại x = line_x (mặc định giữa khung)
+        line_x = int(line_x) if line_x is not None else (self.frame_width // 2)
+        if line_type == "vertical":
+            # Đường dọc: x - line_x = 0
+            a, b, c = 1, 0, -line_x
+        elif line_angle == 0:
+            # Horizontal line: y = line_y
+            a, b, c = 0, 1, -line_y
+        else:
+            # Angled line: calculate from two points
+            angle_rad = math.radians(line_angle)
+            center_x = (line_x1 + line_x2) / 2
+            center_y = line_y
+            dx = math.cos(angle_rad)
+            dy = math.sin(angle_rad)
+            if abs(dx) > 1e-6:
+                tan_angle = dy / dx
+                a, b, c = -tan_angle, 1, tan_angle * center_x - center_y
+            else:
+                a, b, c = 1, 0, -center_x
+        # Gán sau khi đã tính xong hệ số: update() không bao giờ thấy line nửa cũ nửa mới
+        self.line_type = line_type
+        self.line_y = line_y
+        self.line_angle = line_angle
+        self.line_x1 = line_x1
+        self.line_x2 = line_x2
+        self.line_x = line_x
+        self.a, self.b, self.c = a, b, c
+
+    def set_line(self, line_type="horizontal", line_y=None, line_angle=0, line_x1=0, line_x2=None, line_x=None):
+        """
+        Đổi line khi đang chạy (gọi giữa 2 frame). Giữ số đếm và counted_ids (không đếm lại người đã đếm),
+        bỏ phía/debounce đã lưu của từng track vì chúng tính theo line cũ: frame sau track được khởi tạo
+        lại phía theo line mới, không bị tính là vừa crossing.
+        """
+        self._set_geometry(line_type,
+                           self.frame_height // 2 if line_y is None else line_y,
+                           line_angle, line_x1,
+                           self.frame_width if line_x2 is None else line_x2,
+                           line_x)
+        self.track_history.clear()
+        self.direction_state.clear()
+        self.stable_counter.clear()
+
     def _get_side_of_line(self, x, y):
         """Determine which side of the line a point is on"""
         if self.line_type == "vertical":
@@ -97,15 +112,18 @@ class PeopleCounter:
         - Sử dụng 3 cấu trúc dữ liệu: track_history, counted_ids, direction_state
         - Chỉ đếm khi có crossing (thay đổi trạng thái)
         - Reset counted_ids khi crossing ngược lại để cho phép đếm lại
+
+        Trả về 'in' | 'out' nếu track vừa được đếm ở lần gọi này, None nếu không.
         """
         # Xác định trạng thái hiện tại của track
         current_state = self._get_side_of_line(cx, cy)
+        counted = None
         
         # Nếu track_id mới xuất hiện, khởi tạo trạng thái và return
         if track_id not in self.direction_state:
             self.track_history[track_id] = (cx, cy)
             self.direction_state[track_id] = current_state
-            return
+            return None
 
         # Lấy trạng thái trước đó
         previous_state = self.direction_state[track_id]
@@ -143,7 +161,9 @@ class PeopleCounter:
                             shared_counter.add_in()
                             self.counted_ids.add(track_id)
                             self.count_type[track_id] = 'in'
-                            print(f"[COUNTER] Person ID {track_id} crossed IN (left→right): ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
+                            counted = 'in'
+                            if self.verbose:
+                                print(f"[COUNTER] Person ID {track_id} crossed IN (left→right): ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
                     elif previous_state == 'right' and current_state == 'left':
                         # Crossing OUT: phải → trái
                         # Reset nếu đã đếm IN trước đó (cho phép đếm lại)
@@ -154,7 +174,9 @@ class PeopleCounter:
                             shared_counter.add_out()
                             self.counted_ids.add(track_id)
                             self.count_type[track_id] = 'out'
-                            print(f"[COUNTER] Person ID {track_id} crossed OUT (right→left): ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
+                            counted = 'out'
+                            if self.verbose:
+                                print(f"[COUNTER] Person ID {track_id} crossed OUT (right→left): ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
                 else:
                     # Horizontal: above→below = IN, below→above = OUT
                     if previous_state == "above" and current_state == "below":
@@ -167,7 +189,9 @@ class PeopleCounter:
                             shared_counter.add_in()
                             self.counted_ids.add(track_id)
                             self.count_type[track_id] = 'in'
-                            print(f"[COUNTER] Person ID {track_id} crossed IN: ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
+                            counted = 'in'
+                            if self.verbose:
+                                print(f"[COUNTER] Person ID {track_id} crossed IN: ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
                     elif previous_state == "below" and current_state == "above":
                         # Crossing OUT: dưới → trên
                         # Reset nếu đã đếm IN trước đó (cho phép đếm lại)
@@ -178,12 +202,14 @@ class PeopleCounter:
                             shared_counter.add_out()
                             self.counted_ids.add(track_id)
                             self.count_type[track_id] = 'out'
-                            print(f"[COUNTER] Person ID {track_id} crossed OUT: ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
+                            counted = 'out'
+                            if self.verbose:
+                                print(f"[COUNTER] Person ID {track_id} crossed OUT: ({prev_x}, {prev_y}) -> ({cx}, {cy}), distance={distance_to_line:.1f}")
             else:
                 # Chưa đủ số lần thay đổi liên tiếp hoặc khoảng cách chưa đủ, chỉ cập nhật trạng thái
                 self.track_history[track_id] = (cx, cy)
                 self.direction_state[track_id] = current_state
-                return
+                return None
         else:
             # Không có thay đổi - reset counter
             self.stable_counter[track_id] = 0
@@ -191,6 +217,15 @@ class PeopleCounter:
         # Cập nhật lịch sử và trạng thái sau mỗi frame
         self.track_history[track_id] = (cx, cy)
         self.direction_state[track_id] = current_state
+        return counted
+
+    def mark_counted(self, track_id, count_type):
+        """
+        Đánh dấu track đã được đếm theo hướng count_type mà không cộng số đếm: ID mới của người đã đếm
+        (src/reid.py ghép lại sau khi ByteTrack đổi ID) không bị đếm lần nữa cùng hướng.
+        """
+        self.counted_ids.add(track_id)
+        self.count_type[track_id] = count_type
 
     def cleanup_track(self, track_id):
         """
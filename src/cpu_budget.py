@@ -0,0 +1,55 @@
+"""
+Ngân sách CPU cho worker process (job upload, nguồn realtime): số thread tính toán + (tuỳ chọn) CPU affinity.
+
+torch, OpenMP/MKL và OpenCV mặc định mỗi thư viện tự lấy thread bằng số core; vài job chạy song song
+sẽ tranh nhau (oversubscribe) làm tổng throughput giảm. Mỗi worker gọi configure_cpu_budget() 1 lần
+khi khởi động, trước khi import torch/ultralytics.
+
+    configure_cpu_budget(4)                   # 4 thread intra-op cho torch/OpenMP/OpenCV
+    configure_cpu_budget(2, cpus=[2, 3])      # + gắn process vào core 2, 3
+"""
+import os
+
+
+def available_cpus():
+    """CPU mà process hiện tại được phép chạy"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(n_workers, per_worker=None):
+    """Chia CPU thành n_workers nhóm liền nhau (mặc định chia đều), nhóm quay vòng nếu thiếu CPU"""
+    cpus = available_cpus()
+    per = per_worker or max(1, len(cpus) // max(1, n_workers))
+    return [[cpus[(i * per + k) % len(cpus)] for k in range(min(per, len(cpus)))] for i in range(n_workers)]
+
+
+def configure_cpu_budget(threads, cpus=None, label="WORKER"):
+    """
+    Giới hạn thread tính toán của process hiện tại (OMP/MKL/OpenBLAS, torch intra-op, cv2)
+    và gắn process vào cpus nếu có. Trả về {"threads", "cpus"} đã áp dụng.
+    """
+    threads = max(1, int(threads))
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            print(f"[{label}] Cannot pin to CPUs {cpus}: {e}")
+            cpus = None
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            # Inter-op chỉ đặt được trước khi torch chạy phép tính song song đầu tiên
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+    return {"threads": threads, "cpus": list(cpus) if cpus else None}
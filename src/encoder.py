@@ -0,0 +1,138 @@
+import threading
+import time
+import cv2
+
+# Các tier encode cho /video_feed?tier=...
+# - full : kích thước gốc cho người vận hành
+# - thumb: ảnh nhỏ cho màn hình tổng quan nhiều camera
+STREAM_TIERS = {
+    "full": {"width": None, "quality": 85},
+    "thumb": {"width": 320, "quality": 70},
+}
+DEFAULT_TIER = "full"
+
+
+def encode_tier(frame, tier):
+    """Encode frame theo cấu hình tier, trả về buffer JPEG (numpy) hoặc None"""
+    cfg = STREAM_TIERS[tier]
+    width = cfg["width"]
+    if width and frame.shape[1] > width:
+        height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, cfg["quality"]])
+    return buf if ok else None
+
+
+class TieredEncoder:
+    """
+    Encode theo nhu cầu xem:
+    - Không có client nào xem tier → bỏ qua encode tier đó
+    - Mỗi tier chỉ encode 1 lần mỗi frame, mọi client cùng tier dùng chung kết quả qua FrameHub
+    - Client mới vào tier chưa có frame mới nhất → encode ngay frame cuối để không phải chờ
+      (frame thuộc FramePool: publish(frame, buffer) giữ 1 tham chiếu tới buffer tới frame sau, để thread
+      server encode frame cuối không đọc phải buffer đã bị pool dùng lại)
+
+    hub: FrameHub nhận kết quả, hoặc None khi chỉ encode cho process khác (webcam → shm ring)
+    always: các tier luôn encode (vd "full" khi cần ghi latest.jpg)
+    remote_demand: số client theo tier ở process khác (server đọc shm ring)
+    """
+    def __init__(self, hub=None, always=()):
+        self.hub = hub
+        self.always = set(always)
+        self.remote_demand = {}
+        self.lock = threading.Lock()
+        self.last_frame = None
+        self._last_buffer = None  # PooledFrame chứa last_frame (None nếu frame không thuộc pool)
+        self.frame_id = 0
+        self.encoded_id = {tier: 0 for tier in STREAM_TIERS}
+        self.metrics = {tier: {"encoded": 0, "skipped": 0, "encode_ms": 0.0, "encode_ms_total": 0.0}
+                        for tier in STREAM_TIERS}
+        if hub is not None:
+            hub.on_subscribe = self._on_subscribe
+
+    def _local_demand(self):
+        return self.hub.demand() if self.hub is not None else {}
+
+    def wanted_tiers(self):
+        demand = self._local_demand()
+        wanted = set(self.always)
+        wanted.update(t for t, n in demand.items() if n > 0)
+        wanted.update(t for t, n in self.remote_demand.items() if n > 0)
+        return [t for t in STREAM_TIERS if t in wanted]
+
+    def _encode(self, frame, tier, frame_id):
+        t0 = time.perf_counter()
+        buf = encode_tier(frame, tier)
+        ms = (time.perf_counter() - t0) * 1000.0
+        with self.lock:
+            m = self.metrics[tier]
+            m["encoded"] += 1
+            m["encode_ms_total"] += ms
+            # EMA để số liệu ổn định nhưng vẫn phản ánh tải hiện tại
+            m["encode_ms"] = ms if m["encoded"] == 1 else m["encode_ms"] * 0.9 + ms * 0.1
+            if frame_id < self.encoded_id[tier]:
+                return None  # đã có frame mới hơn được encode cho tier này
+            self.encoded_id[tier] = frame_id
+        return buf
+
+    def publish(self, frame, buffer=None):
+        """
+        Encode frame cho các tier đang có người xem và publish vào hub.
+        buffer: PooledFrame chứa frame (nếu có), được giữ tới khi publish frame khác.
+        Trả về dict {tier: buffer JPEG} của các tier đã encode.
+        """
+        if buffer is not None:
+            buffer.retain()
+        with self.lock:
+            self.frame_id += 1
+            frame_id = self.frame_id
+            self.last_frame = frame
+            old, self._last_buffer = self._last_buffer, buffer
+        if old is not None:
+            old.release()
+        wanted = self.wanted_tiers()
+        out = {}
+        for tier in STREAM_TIERS:
+            if tier not in wanted:
+                with self.lock:
+                    self.metrics[tier]["skipped"] += 1
+                continue
+            buf = self._encode(frame, tier, frame_id)
+            if buf is not None:
+                if self.hub is not None:
+                    self.hub.publish(buf.tobytes(), tier)
+                out[tier] = buf
+        return out
+
+    def _on_subscribe(self, tier):
+        if tier not in STREAM_TIERS:
+            return
+        with self.lock:
+            frame, frame_id, held = self.last_frame, self.frame_id, self._last_buffer
+            stale = self.encoded_id[tier] != frame_id
+            if frame is None or not stale:
+                return
+            if held is not None:
+                held.retain()  # vòng xử lý publish frame mới trong lúc encode thì buffer vẫn chưa về pool
+        try:
+            buf = self._encode(frame, tier, frame_id)
+        finally:
+            if held is not None:
+                held.release()
+        if buf is not None:
+            self.hub.publish(buf.tobytes(), tier)
+
+    def stats(self):
+        demand = self._local_demand()
+        with self.lock:
+            return {
+                tier: {
+                    "subscribers": demand.get(tier, 0),
+                    "remote_subscribers": self.remote_demand.get(tier, 0),
+                    "encoded": m["encoded"],
+                    "skipped": m["skipped"],
+                    "encode_ms": round(m["encode_ms"], 3),
+                    "encode_ms_total": round(m["encode_ms_total"], 1),
+                }
+                for tier, m in self.metrics.items()
+            }
@@ -0,0 +1,126 @@
+"""
+Pool buffer frame cấp phát sẵn, đếm tham chiếu: decode/resize ghi thẳng vào buffer dùng lại
+(cap.read(buf), cv2.resize(..., dst=buf)) thay vì cấp phát ~2.7 MB (720p) mới mỗi frame.
+
+- acquire() → PooledFrame với 1 tham chiếu (của người gọi); retain()/release() đếm tham chiếu,
+  về 0 thì buffer quay lại pool. Pool FIFO: buffer vừa trả được dùng lại sau cùng
+- Consumer ở thread khác giữ tham chiếu (encoder giữ buffer của frame cuối để encode cho client mới):
+  view không giữ buffer, pool có thể ghi đè bất cứ lúc nào
+- Pool hết buffer rảnh thì cấp phát thêm (không chặn vòng xử lý); tối đa capacity buffer rảnh được giữ
+- Consumer chỉ đọc (encoder, HLS, frame cuối đã xử lý) nhận view read-only (readonly()) thay vì copy;
+  ghi nhầm vào view → ValueError thay vì làm hỏng frame đang dùng ở chỗ khác
+- Đổi kích thước (nguồn đổi độ phân giải) → buffer rảnh cũ bị bỏ, buffer đang dùng trả về thì bỏ luôn
+- FRAME_POOL_SIZE=0: không dùng lại buffer (mỗi acquire cấp phát mới) để so sánh (tools/bench_memory.py)
+
+    pool = FramePool((h, w, 3))
+    holds = FrameHolds()
+    buf = pool.acquire()
+    ok, _ = cap.read(buf.array)
+    holds.keep("last", buf)         # giữ tới khi slot "last" nhận frame khác
+    view = buf.readonly()
+    buf.release()                   # hết phần của vòng xử lý
+"""
+import collections
+import os
+import threading
+
+import numpy as np
+
+POOL_SIZE = int(os.environ.get("FRAME_POOL_SIZE", "6"))
+
+
+def readonly(array):
+    """View read-only của array (không copy)"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class PooledFrame:
+    __slots__ = ("array", "pool", "refs")
+
+    def __init__(self, array, pool):
+        self.array = array
+        self.pool = pool
+        self.refs = 0
+
+    def retain(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        self.pool._release(self)
+
+    def readonly(self):
+        return readonly(self.array)
+
+
+class FramePool:
+    def __init__(self, shape=None, dtype=np.uint8, capacity=None):
+        self.shape = tuple(shape) if shape is not None else None
+        self.dtype = dtype
+        self.capacity = POOL_SIZE if capacity is None else capacity
+        self.lock = threading.Lock()
+        self.allocated = 0  # số buffer đã cấp phát (cả lúc pool hết buffer rảnh)
+        self.reused = 0
+        self.in_use = 0
+        self._free = collections.deque()
+
+    def acquire(self, shape=None):
+        """Buffer (1 tham chiếu) kích thước shape (mặc định shape của pool), nội dung không xác định"""
+        with self.lock:
+            if shape is not None and tuple(shape) != self.shape:
+                self.shape = tuple(shape)
+                self._free.clear()
+            if self._free:
+                frame = self._free.popleft()
+                self.reused += 1
+            else:
+                frame = None
+                self.allocated += 1
+            self.in_use += 1
+        if frame is None:
+            frame = PooledFrame(np.empty(self.shape, dtype=self.dtype), self)
+        frame.refs = 1
+        return frame
+
+    def _release(self, frame):
+        with self.lock:
+            if frame.refs <= 0:
+                raise RuntimeError("frame buffer released more times than retained")
+            frame.refs -= 1
+            if frame.refs:
+                return
+            self.in_use -= 1
+            if frame.array.shape == self.shape and len(self._free) < self.capacity:
+                self._free.append(frame)
+
+    def stats(self):
+        with self.lock:
+            return {"allocated": self.allocated, "reused": self.reused, "in_use": self.in_use,
+                    "free": len(self._free), "capacity": self.capacity}
+
+
+class FrameHolds:
+    """Các slot tên → buffer đang giữ; đặt frame mới vào slot thì buffer cũ được release"""
+    def __init__(self):
+        self._slots = {}
+
+    def keep(self, name, frame):
+        """Slot name giữ thêm 1 tham chiếu tới frame (PooledFrame hoặc None để bỏ giữ)"""
+        if frame is not None:
+            frame.retain()
+        old = self._slots.pop(name, None)
+        if frame is not None:
+            self._slots[name] = frame
+        if old is not None:
+            old.release()
+
+    def get(self, name):
+        return self._slots.get(name)
+
+    def release_all(self):
+        slots, self._slots = self._slots, {}
+        for frame in slots.values():
+            frame.release()
@@ -0,0 +1,215 @@
+"""
+Heatmap mật độ (occupancy) + hướng di chuyển (flow) cộng dồn từ tâm track, cập nhật mỗi frame.
+
+- Lưới cố định (rows x cols, mỗi ô CELL px) → chi phí mỗi frame chỉ phụ thuộc số track trong frame,
+  không phụ thuộc độ dài video; cộng vector hoá bằng np.add.at, không duyệt lại lịch sử
+- Flow: độ dời tâm (dx, dy) của track so với frame trước, ghép id bằng searchsorted (không dict theo track)
+- Decay tuỳ chọn (half_life giây): thay vì nhân cả lưới mỗi frame, tăng trọng số mẫu mới
+  (weight /= decay) và chỉ chia lại lưới khi weight quá lớn → vẫn O(1) mỗi frame
+- Process xử lý ghi snapshot realtime/heatmaps/<key>.npz mỗi SAVE_INTERVAL giây và khi kết thúc
+  (key = id job hoặc tên ring của nguồn webcam); server đọc file, trả PNG tô màu hoặc mảng raw
+
+    heatmap = FlowHeatmap(w, h, fps=fps, path=heatmap_path(key))
+    heatmap.update(boxes)      # [(track_id, l, t, r, b), ...] mỗi frame đã xử lý
+    heatmap.save()             # cuối video
+    body, content_type = export(load(path), fmt="png", kind="flow")
+"""
+import io
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEATMAP_DIR = os.path.join(BASE_DIR, "realtime", "heatmaps")
+CELL = int(os.environ.get("HEATMAP_CELL", "16"))
+HALF_LIFE = float(os.environ.get("HEATMAP_HALF_LIFE", "0"))  # giây, 0 = cộng dồn cả video (job upload)
+SAVE_INTERVAL = 2.0
+MAX_WEIGHT = 1e12   # weight vượt ngưỡng thì chia lại lưới (tránh tràn float)
+MIN_MOVES = 0.5     # ô có ít mẫu flow hơn coi như không có hướng
+MAX_PNG_WIDTH = 1920
+
+FORMATS = ("png", "npy", "json")
+KINDS = ("occupancy", "flow")
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def heatmap_path(key, heatmap_dir=HEATMAP_DIR):
+    """File snapshot của job / nguồn key"""
+    if not _KEY_RE.match(str(key)):
+        raise ValueError("invalid heatmap key")
+    return os.path.join(heatmap_dir, f"{key}.npz")
+
+
+class FlowHeatmap:
+    def __init__(self, frame_width, frame_height, cell=CELL, half_life=HALF_LIFE, fps=30.0, path=None):
+        self.frame_width = int(frame_width)
+        self.frame_height = int(frame_height)
+        self.cell = max(1, int(cell))
+        self.cols = max(1, -(-self.frame_width // self.cell))
+        self.rows = max(1, -(-self.frame_height // self.cell))
+        self.half_life = float(half_life or 0)
+        # Hệ số decay mỗi frame: sau half_life giây giá trị cũ còn một nửa
+        self.decay = 0.5 ** (1.0 / (self.half_life * (fps or 30.0))) if self.half_life > 0 else 1.0
+        self.path = path
+        self.occupancy = np.zeros(self.rows * self.cols, dtype=np.float64)
+        self.flow = np.zeros((2, self.rows * self.cols), dtype=np.float64)  # tổng dx, dy theo ô
+        self.moves = np.zeros(self.rows * self.cols, dtype=np.float64)     # số mẫu flow theo ô
+        self.frames = 0
+        self._weight = 1.0
+        self._prev_ids = np.empty(0, dtype=np.int64)   # id track frame trước (đã sort)
+        self._prev_xy = np.empty((0, 2), dtype=np.float64)
+        self._saved_at = time.monotonic()
+
+    def update(self, boxes):
+        """Cộng tâm các box (track_id, l, t, r, b) của 1 frame vào lưới"""
+        self.frames += 1
+        if self.decay < 1.0:
+            self._weight /= self.decay
+            if self._weight > MAX_WEIGHT:
+                self._rescale()
+        if not boxes:
+            self._prev_ids = np.empty(0, dtype=np.int64)
+            self._prev_xy = np.empty((0, 2), dtype=np.float64)
+            return
+        arr = np.asarray(boxes, dtype=np.float64)
+        ids = arr[:, 0].astype(np.int64)
+        xy = np.column_stack(((arr[:, 1] + arr[:, 3]) * 0.5, (arr[:, 2] + arr[:, 4]) * 0.5))
+        col = np.clip((xy[:, 0] // self.cell).astype(np.intp), 0, self.cols - 1)
+        row = np.clip((xy[:, 1] // self.cell).astype(np.intp), 0, self.rows - 1)
+        cells = row * self.cols + col
+        np.add.at(self.occupancy, cells, self._weight)
+
+        if self._prev_ids.size:
+            pos = np.minimum(np.searchsorted(self._prev_ids, ids), self._prev_ids.size - 1)
+            matched = self._prev_ids[pos] == ids
+            if matched.any():
+                delta = xy[matched] - self._prev_xy[pos[matched]]
+                moved = cells[matched]
+                np.add.at(self.flow[0], moved, delta[:, 0] * self._weight)
+                np.add.at(self.flow[1], moved, delta[:, 1] * self._weight)
+                np.add.at(self.moves, moved, self._weight)
+
+        order = np.argsort(ids, kind="stable")
+        self._prev_ids = ids[order]
+        self._prev_xy = xy[order]
+
+    def _rescale(self):
+        self.occupancy /= self._weight
+        self.flow /= self._weight
+        self.moves /= self._weight
+        self._weight = 1.0
+
+    def snapshot(self):
+        """
+        occupancy: số người·frame tại mỗi ô (đã decay), flow_x/flow_y: vector dời trung bình px/frame,
+        moves: số mẫu flow; kèm meta (cell, kích thước frame, số frame, half_life)
+        """
+        shape = (self.rows, self.cols)
+        moves = self.moves.reshape(shape)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(moves > 0, self.flow.reshape((2,) + shape) / moves, 0.0)
+        return {
+            "occupancy": (self.occupancy.reshape(shape) / self._weight).astype(np.float32),
+            "flow_x": mean[0].astype(np.float32),
+            "flow_y": mean[1].astype(np.float32),
+            "moves": (moves / self._weight).astype(np.float32),
+            "meta": {"cell": self.cell, "frame_width": self.frame_width, "frame_height": self.frame_height,
+                     "frames": self.frames, "half_life": self.half_life, "updated": time.time()},
+        }
+
+    def save(self, path=None):
+        """Ghi snapshot .npz (ghi file tạm rồi os.replace để server không đọc file dở)"""
+        path = path or self.path
+        if not path:
+            return
+        self._saved_at = time.monotonic()
+        snap = self.snapshot()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, occupancy=snap["occupancy"], flow_x=snap["flow_x"], flow_y=snap["flow_y"],
+                         moves=snap["moves"], meta=np.frombuffer(json.dumps(snap["meta"]).encode(), np.uint8))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[HEATMAP] Cannot write {path}: {e}")
+
+    def autosave(self):
+        """Gọi mỗi frame, chỉ ghi file mỗi SAVE_INTERVAL giây"""
+        if self.path and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+
+
+def load(path):
+    """Snapshot đã ghi (dict như FlowHeatmap.snapshot) hoặc None nếu chưa có"""
+    try:
+        with np.load(path) as data:
+            snap = {k: data[k] for k in ("occupancy", "flow_x", "flow_y", "moves")}
+            snap["meta"] = json.loads(data["meta"].tobytes().decode())
+        return snap
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _png_size(meta, width):
+    w, h = meta["frame_width"], meta["frame_height"]
+    width = max(1, min(int(width or w), MAX_PNG_WIDTH))
+    return width, max(1, round(h * width / max(1, w)))
+
+
+def render_png(snap, kind="occupancy", width=None):
+    """
+    PNG tô màu, phóng theo tỉ lệ frame: occupancy → colormap JET trên thang log;
+    flow → màu theo hướng (hue), độ sáng theo tốc độ, ô không có mẫu để đen
+    """
+    import cv2
+    if kind == "flow":
+        fx, fy = snap["flow_x"], snap["flow_y"]
+        mag, ang = cv2.cartToPolar(fx, fy, angleInDegrees=True)
+        peak = float(mag.max())
+        hsv = np.zeros(fx.shape + (3,), dtype=np.uint8)
+        hsv[..., 0] = (ang / 2).astype(np.uint8)   # OpenCV hue 0..179
+        hsv[..., 1] = 255
+        hsv[..., 2] = np.clip(mag / peak * 255 if peak > 0 else 0, 0, 255).astype(np.uint8)
+        hsv[snap["moves"] < MIN_MOVES] = 0
+        image = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+    else:
+        occ = np.log1p(snap["occupancy"])
+        peak = float(occ.max())
+        gray = np.clip(occ / peak * 255 if peak > 0 else 0, 0, 255).astype(np.uint8)
+        image = cv2.applyColorMap(gray, cv2.COLORMAP_JET)
+        image[gray == 0] = 0
+    image = cv2.resize(image, _png_size(snap["meta"], width), interpolation=cv2.INTER_LINEAR)
+    ok, buf = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("PNG encode failed")
+    return buf.tobytes()
+
+
+def export(snap, fmt="png", kind="occupancy", width=None):
+    """
+    (body bytes, content type) cho API. fmt: png | npy (occupancy: rows x cols, flow: 2 x rows x cols)
+    | json (mảng + meta). ValueError nếu tham số sai.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    if width is not None:
+        try:
+            width = int(width)
+        except (TypeError, ValueError):
+            raise ValueError("width must be an integer")
+    if fmt == "png":
+        return render_png(snap, kind, width), "image/png"
+    array = snap["occupancy"] if kind == "occupancy" else np.stack((snap["flow_x"], snap["flow_y"]))
+    if fmt == "npy":
+        buf = io.BytesIO()
+        np.save(buf, array)
+        return buf.getvalue(), "application/octet-stream"
+    body = {"kind": kind, "shape": list(array.shape), **snap["meta"], "data": np.round(array, 3).tolist()}
+    return json.dumps(body).encode("utf-8"), "application/json"
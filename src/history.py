@@ -0,0 +1,170 @@
+"""
+Xử lý /api/history trên HistoryStore (src/history_store.py).
+
+- Cursor trả cho client dạng "run_id:point_id", request tiếp theo chỉ lấy điểm mới sau cursor
+  → chi phí không tăng theo độ dài phiên
+- downsample_lttb / downsample_minmax giảm số điểm cho chart khi phiên dài
+- parse_range kiểm tra from/to/bucket trước khi trả response: sai → ValueError (route trả 400)
+"""
+from src.history_store import RESOLUTIONS
+
+DEFAULT_LIMIT = 2000
+WINDOW_ROWS = 20000
+
+
+def downsample_lttb(rows, n_out, key="net", t_key="t"):
+    """
+    Largest-Triangle-Three-Buckets: giữ n_out điểm giữ được hình dạng đường `key`.
+    Trả về các dict gốc (đủ in/out/net) của những điểm được chọn.
+    """
+    n = len(rows)
+    if n_out >= n or n_out < 3:
+        return list(rows)
+    xs = [float(r.get(t_key, i)) for i, r in enumerate(rows)]
+    ys = [float(r.get(key, 0)) for r in rows]
+    out = [rows[0]]
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        # Trung bình bucket kế tiếp
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        cnt = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / cnt
+        avg_y = sum(ys[next_start:next_end]) / cnt
+        # Chọn điểm trong bucket hiện tại tạo tam giác lớn nhất với a và điểm trung bình
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(rows[best])
+        a = best
+    out.append(rows[-1])
+    return out
+
+
+def downsample_minmax(rows, n_out, key="net"):
+    """Chia n_out/2 bucket, mỗi bucket giữ điểm min và max của `key` (theo thứ tự thời gian)"""
+    n = len(rows)
+    if n_out >= n or n_out < 2:
+        return list(rows)
+    buckets = n_out // 2
+    out = []
+    for b in range(buckets):
+        chunk = rows[b * n // buckets:(b + 1) * n // buckets]
+        if not chunk:
+            continue
+        lo = min(range(len(chunk)), key=lambda i: chunk[i].get(key, 0))
+        hi = max(range(len(chunk)), key=lambda i: chunk[i].get(key, 0))
+        for i in sorted({lo, hi}):
+            out.append(chunk[i])
+    return out
+
+
+def history_response(store, args):
+    """
+    Xử lý query của /api/history (dùng chung cho app.py và realtime.py).
+    - Không có tham số → list như cũ (2000 điểm gần nhất của run mới nhất)
+    - ?since=<cursor> → chỉ các điểm mới sau cursor
+    - ?from=&to= (epoch giây hoặc ISO 8601) → khoảng thời gian bất kỳ qua các run, độ phân giải tự chọn (?bucket=)
+    - ?points=N → downsample còn tối đa N điểm (?mode=minmax để dùng min/max bucket thay cho LTTB)
+    Trả về list hoặc dict {"cursor", "points", "reset"}; from/to/bucket sai → ValueError.
+    """
+    since = args.get("since")
+    points = args.get("points")
+    if since is None and points is None and args.get("from") is None and args.get("to") is None:
+        return store.tail(DEFAULT_LIMIT)
+    start, end, bucket = parse_range(args)
+    if args.get("from") is not None or args.get("to") is not None:
+        rows = store.query(start, end, stream=args.get("stream"), resolution=bucket or "auto")
+        cursor, reset = None, False
+    else:
+        rows, cursor, reset = store.since(since or None, limit=WINDOW_ROWS)
+    if points:
+        try:
+            n = max(2, int(points))
+        except ValueError:
+            n = DEFAULT_LIMIT
+        if args.get("mode") == "minmax":
+            rows = downsample_minmax(rows, n)
+        else:
+            rows = downsample_lttb(rows, n)
+    return {"cursor": cursor, "points": rows, "reset": reset}
+
+
+def _parse_time(value):
+    """Epoch giây hoặc ISO 8601 ("2024-05-01", "2024-05-01T08:30") theo giờ máy → epoch, None nếu trống"""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        from datetime import datetime
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_range(args):
+    """(from, to, bucket) của query; bucket None nếu không truyền. Thời gian / bucket sai → ValueError"""
+    try:
+        start, end = _parse_time(args.get("from")), _parse_time(args.get("to"))
+    except ValueError:
+        raise ValueError("invalid from/to (epoch seconds or ISO 8601)") from None
+    bucket = args.get("bucket") or None
+    if bucket is not None and bucket not in ("raw", "auto", *RESOLUTIONS):
+        raise ValueError(f"invalid bucket {bucket!r} (raw|minute|hour|auto)")
+    return start, end, bucket
+
+
+def iter_csv(store, args, batch=500):
+    """
+    CSV theo từng khối (generator) cho /api/export/csv, bộ nhớ cố định bất kể khoảng thời gian.
+    - Không có from/to → run mới nhất, điểm thô (giống bản export cũ)
+    - ?from=&to= → mọi run trong khoảng, ?bucket=raw|minute|hour|auto (mặc định auto)
+    - ?stream=, ?run= để lọc theo stream / run
+    Kiểm tra query ngay khi gọi (ValueError → route trả 400 trước khi bắt đầu stream), đọc store lúc
+    duyệt generator.
+    """
+    start, end, bucket = parse_range(args)
+    return _csv_chunks(store, start, end, bucket, args.get("stream"), args.get("run"), batch)
+
+
+def _csv_chunks(store, start, end, bucket, stream, run_id, batch):
+    import csv
+    import io
+    import time
+
+    if start is None and end is None and run_id is None:
+        run = store.latest_run(stream)
+        run_id = run["id"] if run else -1
+        bucket = bucket or "raw"
+    rows = store.iter_range(start, end, stream=stream, run_id=run_id,
+                            resolution=bucket or "auto")
+
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    header = ["Thoi_gian", "IN", "OUT", "NET"]
+    aggregated = False
+    yield "\ufeff"  # BOM để Excel đọc đúng UTF-8 (như utf-8-sig trước đây)
+    n = 0
+    for row in rows:
+        if n == 0:
+            # Cột thêm cho dữ liệu tổng hợp theo phút/giờ
+            aggregated = "net_min" in row
+            w.writerow(header + (["NET_MIN", "NET_MAX", "SO_DIEM"] if aggregated else []))
+        t = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["t"]))
+        line = [t, row["in"], row["out"], row["net"]]
+        if aggregated:
+            line += [row["net_min"], row["net_max"], row["n"]]
+        w.writerow(line)
+        n += 1
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if n == 0:
+        w.writerow(header)
+    yield buf.getvalue()
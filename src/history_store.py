@@ -0,0 +1,392 @@
+"""
+Lưu history đếm IN/OUT bằng SQLite (WAL) thay cho history.jsonl.
+
+- Mỗi lần chạy (upload video / bật webcam) là 1 run, gắn với 1 stream ("upload", "webcam", ...)
+  → history các lần chạy trước được giữ lại thay vì bị xoá
+- points: điểm thô {t, in, out, net}, index theo (run_id, t) và t để đọc theo khoảng thời gian
+- agg_minute / agg_hour: tổng hợp theo phút / giờ, thread compaction chạy nền gom điểm thô
+  đã đủ phút vào agg_minute, phút đã đủ giờ vào agg_hour, rồi xoá dữ liệu quá hạn giữ
+- Đọc khoảng dài (tháng) dùng agg_hour nên chỉ vài nghìn dòng, phần chưa compact được gom tại chỗ
+
+IN/OUT trong 1 run là số cộng dồn nên giá trị cuối bucket = MAX(in_count), MAX(out_count).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RAW_RETENTION = 7 * 86400        # giữ điểm thô 7 ngày
+MINUTE_RETENTION = 90 * 86400    # giữ tổng hợp theo phút 90 ngày, theo giờ giữ mãi
+COMPACT_INTERVAL = 60.0
+_COMPACT_SLACK = 5.0             # chờ thêm vài giây cho điểm đến trễ trước khi chốt 1 phút
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stream TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS ix_runs_stream ON runs(stream, id);
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    stream TEXT NOT NULL,
+    t REAL NOT NULL,
+    in_count INTEGER NOT NULL,
+    out_count INTEGER NOT NULL,
+    net INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_points_run_t ON points(run_id, t);
+CREATE INDEX IF NOT EXISTS ix_points_t ON points(t);
+CREATE TABLE IF NOT EXISTS agg_minute (
+    stream TEXT NOT NULL, bucket INTEGER NOT NULL, run_id INTEGER NOT NULL,
+    n INTEGER NOT NULL, in_count INTEGER NOT NULL, out_count INTEGER NOT NULL,
+    net_min INTEGER NOT NULL, net_max INTEGER NOT NULL, t_last REAL NOT NULL,
+    PRIMARY KEY (bucket, stream, run_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS agg_hour (
+    stream TEXT NOT NULL, bucket INTEGER NOT NULL, run_id INTEGER NOT NULL,
+    n INTEGER NOT NULL, in_count INTEGER NOT NULL, out_count INTEGER NOT NULL,
+    net_min INTEGER NOT NULL, net_max INTEGER NOT NULL, t_last REAL NOT NULL,
+    PRIMARY KEY (bucket, stream, run_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+# Nguồn dữ liệu chung dạng (stream, t, run_id, n, in_count, out_count, net_min, net_max, t_last)
+_RAW_SOURCE = ("SELECT stream, t, run_id, 1 AS n, in_count, out_count, net AS net_min, net AS net_max, "
+               "t AS t_last FROM points WHERE t >= ? AND t < ?")
+_MINUTE_SOURCE = ("SELECT stream, bucket AS t, run_id, n, in_count, out_count, net_min, net_max, t_last "
+                  "FROM agg_minute WHERE bucket >= ? AND bucket < ?")
+_GROUP = ("SELECT stream, CAST(t / {w} AS INTEGER) * {w} AS bucket, run_id, SUM(n), MAX(in_count), "
+          "MAX(out_count), MIN(net_min), MAX(net_max), MAX(t_last) FROM ({src}) {where} "
+          "GROUP BY bucket, stream, run_id ORDER BY bucket, stream, run_id")
+
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+
+
+def _agg_row(r):
+    stream, bucket, run_id, n, in_count, out_count, net_min, net_max, t_last = r
+    return {"t": bucket, "in": in_count, "out": out_count, "net": in_count - out_count,
+            "net_min": net_min, "net_max": net_max, "n": n, "run": run_id, "stream": stream}
+
+
+class HistoryStore:
+    """
+    path: file SQLite (vd realtime/history.db), dùng chung được giữa nhiều process nhờ WAL.
+    stream: tên stream mặc định cho các run do store này tạo.
+    Mỗi thread dùng connection riêng (sqlite3 không chia sẻ connection giữa thread).
+    """
+    def __init__(self, path, stream="default", raw_retention=RAW_RETENTION,
+                 minute_retention=MINUTE_RETENTION):
+        self.path = path
+        self.stream = stream
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.run_id = None
+        self.run_stream = None
+        self._local = threading.local()
+        self._compactor = None
+        self._stop = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, conn, key, default=0.0):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+    # --- ghi ---
+    def start_run(self, stream=None):
+        """Bắt đầu run mới (thay cho việc xoá history.jsonl mỗi lần chạy). Trả về run_id."""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            if self.run_id is not None:
+                conn.execute("UPDATE runs SET ended = ? WHERE id = ? AND ended IS NULL", (now, self.run_id))
+            cur = conn.execute("INSERT INTO runs(stream, started) VALUES (?, ?)", (stream or self.stream, now))
+        self.run_id = cur.lastrowid
+        self.run_stream = stream or self.stream
+        return self.run_id
+
+    def end_run(self):
+        if self.run_id is None:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE runs SET ended = ? WHERE id = ? AND ended IS NULL", (time.time(), self.run_id))
+
+    def append(self, row):
+        """Ghi 1 điểm {t, in, out, net} vào run hiện tại (tự tạo run nếu chưa có)"""
+        if self.run_id is None:
+            self.start_run()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO points(run_id, stream, t, in_count, out_count, net) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.run_id, self.run_stream, float(row.get("t", time.time())), int(row.get("in", 0)),
+                 int(row.get("out", 0)), int(row.get("net", 0))))
+
+    def import_jsonl(self, jsonl_path, stream=None):
+        """Nhập history.jsonl cũ thành 1 run (chỉ 1 lần cho mỗi file). Trả về số điểm đã nhập."""
+        conn = self._conn()
+        key = "imported:" + os.path.abspath(jsonl_path)
+        if not os.path.exists(jsonl_path) or self._meta(conn, key, None) is not None:
+            return 0
+        rows = []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                    rows.append((float(r["t"]), int(r.get("in", 0)), int(r.get("out", 0)), int(r.get("net", 0))))
+                except Exception:
+                    continue
+        with conn:
+            self._set_meta(conn, key, time.time())
+            if not rows:
+                return 0
+            stream = stream or self.stream
+            cur = conn.execute("INSERT INTO runs(stream, started, ended) VALUES (?, ?, ?)",
+                               (stream, rows[0][0], rows[-1][0]))
+            run_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO points(run_id, stream, t, in_count, out_count, net) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, stream) + r for r in rows])
+            # Dữ liệu cũ hơn watermark → compaction lần sau gom lại các bucket đó
+            first = min(r[0] for r in rows)
+            for key_wm in ("minute_wm", "hour_wm"):
+                if self._meta(conn, key_wm) > first:
+                    self._set_meta(conn, key_wm, first)
+        return len(rows)
+
+    # --- compaction & retention ---
+    def compact(self, now=None):
+        """Gom điểm thô đã đủ phút → agg_minute, phút đã đủ giờ → agg_hour, xoá dữ liệu quá hạn"""
+        now = time.time() if now is None else now
+        conn = self._conn()
+        with conn:
+            minute_wm = self._meta(conn, "minute_wm")
+            target = int((now - _COMPACT_SLACK) // 60) * 60
+            if target > minute_wm:
+                start = int(minute_wm // 60) * 60
+                conn.execute("INSERT OR REPLACE INTO agg_minute " + _GROUP.format(
+                    w=60, src=_RAW_SOURCE, where=""), (start, target))
+                self._set_meta(conn, "minute_wm", target)
+                minute_wm = target
+            hour_wm = self._meta(conn, "hour_wm")
+            target = int(minute_wm // 3600) * 3600
+            if target > hour_wm:
+                start = int(hour_wm // 3600) * 3600
+                conn.execute("INSERT OR REPLACE INTO agg_hour " + _GROUP.format(
+                    w=3600, src=_MINUTE_SOURCE, where=""), (start, target))
+                self._set_meta(conn, "hour_wm", target)
+            # Chỉ xoá phần đã được tổng hợp
+            conn.execute("DELETE FROM points WHERE t < ?", (min(now - self.raw_retention, minute_wm),))
+            conn.execute("DELETE FROM agg_minute WHERE bucket < ?",
+                         (min(now - self.minute_retention, self._meta(conn, "hour_wm")),))
+
+    def start_compactor(self, interval=COMPACT_INTERVAL):
+        """Chạy compact() định kỳ trong thread nền (daemon)"""
+        if self._compactor is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"[HISTORY] Compaction error: {e}")
+
+        self._compactor = threading.Thread(target=loop, name="history-compactor", daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        self.end_run()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- đọc ---
+    def latest_run(self, stream=None):
+        """Run mới nhất (của stream, hoặc của mọi stream khi stream=None) dạng dict, None nếu chưa có"""
+        conn = self._conn()
+        if stream is None:
+            row = conn.execute("SELECT id, stream, started, ended FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = conn.execute("SELECT id, stream, started, ended FROM runs WHERE stream = ? "
+                               "ORDER BY id DESC LIMIT 1", (stream,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "stream": row[1], "started": row[2], "ended": row[3]}
+
+    def runs(self, stream=None, limit=100):
+        conn = self._conn()
+        sql = "SELECT id, stream, started, ended FROM runs"
+        args = ()
+        if stream is not None:
+            sql += " WHERE stream = ?"
+            args = (stream,)
+        sql += " ORDER BY id DESC LIMIT ?"
+        rows = conn.execute(sql, args + (limit,)).fetchall()
+        return [{"id": r[0], "stream": r[1], "started": r[2], "ended": r[3]} for r in rows]
+
+    def since(self, cursor=None, limit=None, stream=None):
+        """
+        Điểm của run mới nhất sau cursor "run_id:point_id".
+        Trả về (rows, cursor_mới, reset): reset=True khi đã sang run khác so với cursor.
+        """
+        run = self.latest_run(stream)
+        if run is None:
+            return [], None, cursor is not None
+        run_id, last_id = None, 0
+        if cursor:
+            try:
+                run_id, last_id = (int(v) for v in str(cursor).split(":", 1))
+            except ValueError:
+                run_id = None
+        reset = cursor is not None and run_id != run["id"]
+        if run_id != run["id"]:
+            last_id = 0
+        conn = self._conn()
+        if limit is None:
+            rows = conn.execute("SELECT id, t, in_count, out_count, net FROM points "
+                                "WHERE run_id = ? AND id > ? ORDER BY id", (run["id"], last_id)).fetchall()
+        else:
+            # limit điểm gần nhất
+            rows = conn.execute("SELECT id, t, in_count, out_count, net FROM points "
+                                "WHERE run_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                                (run["id"], last_id, limit)).fetchall()[::-1]
+        if rows:
+            last_id = rows[-1][0]
+        out = [{"t": t, "in": i, "out": o, "net": n} for _, t, i, o, n in rows]
+        return out, f"{run['id']}:{last_id}", reset
+
+    def tail(self, limit=2000, stream=None):
+        """limit điểm gần nhất của run mới nhất (tương đương history.jsonl trước đây)"""
+        return self.since(None, limit=limit, stream=stream)[0]
+
+    def pick_resolution(self, start, end, now=None):
+        """Chọn độ phân giải theo độ dài khoảng và thời hạn giữ dữ liệu thô"""
+        now = time.time() if now is None else now
+        span = end - start
+        if span <= 6 * 3600 and start >= now - self.raw_retention:
+            return "raw"
+        if span <= 14 * 86400 and start >= now - self.minute_retention:
+            return "minute"
+        return "hour"
+
+    def iter_range(self, start=None, end=None, stream=None, run_id=None, resolution="auto", batch=1000):
+        """
+        Generator các điểm trong [start, end) theo thứ tự thời gian, đọc theo lô fetchmany(batch)
+        nên bộ nhớ không phụ thuộc độ dài khoảng.
+        resolution: "raw" | "minute" | "hour" | "auto" (chọn theo độ dài khoảng)
+        """
+        now = time.time()
+        start = 0.0 if start is None else float(start)
+        end = now + 1 if end is None else float(end)
+        if resolution == "auto":
+            resolution = self.pick_resolution(start, end, now)
+        conn = self._conn()
+        filters, args = [], []
+        if stream is not None:
+            filters.append("stream = ?")
+            args.append(stream)
+        if run_id is not None:
+            filters.append("run_id = ?")
+            args.append(int(run_id))
+
+        if resolution == "raw":
+            sql = "SELECT t, in_count, out_count, net FROM points WHERE t >= ? AND t < ?"
+            if filters:
+                sql += " AND " + " AND ".join(filters)
+            cur = conn.execute(sql + " ORDER BY t", [start, end] + args)
+            while True:
+                chunk = cur.fetchmany(batch)
+                if not chunk:
+                    return
+                for t, i, o, n in chunk:
+                    yield {"t": t, "in": i, "out": o, "net": n}
+
+        width = RESOLUTIONS[resolution]
+        start = int(start // width) * width
+        minute_wm = self._meta(conn, "minute_wm")
+        hour_wm = self._meta(conn, "hour_wm")
+        where = ("WHERE " + " AND ".join(filters)) if filters else ""
+        table, table_wm = ("agg_minute", minute_wm) if resolution == "minute" else ("agg_hour", hour_wm)
+        queries = []
+        # 1) Các bucket đã compact xong
+        final_end = min(end, table_wm)
+        if final_end > start:
+            sql = ("SELECT stream, bucket, run_id, n, in_count, out_count, net_min, net_max, t_last FROM "
+                   f"{table} WHERE bucket >= ? AND bucket < ?")
+            if filters:
+                sql += " AND " + " AND ".join(filters)
+            queries.append((sql + " ORDER BY bucket, stream, run_id", [start, final_end] + args))
+        # 2) Phần chưa compact: gom tại chỗ từ nguồn mịn hơn
+        tail_start = max(start, table_wm)
+        if end > tail_start:
+            if resolution == "minute":
+                src, src_args = _RAW_SOURCE, [tail_start, end]
+            else:
+                src = _MINUTE_SOURCE + " UNION ALL " + _RAW_SOURCE
+                src_args = [tail_start, minute_wm, max(tail_start, minute_wm), end]
+            queries.append((_GROUP.format(w=width, src=src, where=where), src_args + args))
+        for sql, qargs in queries:
+            cur = conn.execute(sql, qargs)
+            while True:
+                chunk = cur.fetchmany(batch)
+                if not chunk:
+                    break
+                for r in chunk:
+                    yield _agg_row(r)
+
+    def query(self, start=None, end=None, stream=None, run_id=None, resolution="auto"):
+        return list(self.iter_range(start, end, stream=stream, run_id=run_id, resolution=resolution))
+
+
+class HistoryFollower:
+    """
+    Theo dõi điểm mới của run mới nhất trong store (do process khác ghi) và đẩy vào SharedCounter
+    để /api/stream gửi event "history"; sang run mới thì reset state (event "reset").
+    """
+    def __init__(self, store, state, interval=0.5, stream=None):
+        self.store = store
+        self.state = state
+        self.interval = interval
+        self.stream = stream
+        self.cursor = None
+        self._next_check = 0.0
+
+    def poll(self):
+        """Gọi thường xuyên từ thread pump; tự giới hạn tối đa 1 lần mỗi interval giây"""
+        now = time.time()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+        try:
+            # Lần đầu chỉ lấy phần cuối run (state chỉ giữ 500 điểm gần nhất)
+            limit = None if self.cursor else 500
+            rows, self.cursor, reset = self.store.since(self.cursor, limit=limit, stream=self.stream)
+        except Exception:
+            return
+        if reset:
+            self.state.reset()  # sang run mới, rows là điểm của run mới
+        for row in rows:
+            self.state.add_history(row)
@@ -0,0 +1,211 @@
+"""
+Output HLS (H.264, segment fMP4 + playlist cuốn chiếu) thay cho MJPEG /video_feed khi có nhiều viewer.
+
+- Frame đã vẽ overlay của process_video / run_webcam được encode 1 lần bởi ffmpeg (process con, libx264
+  preset veryfast + zerolatency) thành realtime/hls/<key>/index.m3u8 + init.mp4 + seg_NNNNN.m4s;
+  server chỉ phục vụ file tĩnh → chi phí encode không phụ thuộc số viewer, băng thông thấp hơn JPEG nhiều
+- Vòng xử lý không bao giờ chờ ffmpeg: submit() chỉ chép frame vào buffer staging (không cấp phát);
+  thread ghi đẩy frame mới nhất vào stdin ffmpeg theo nhịp cố định fps (lặp lại frame nếu nguồn chậm,
+  bỏ frame nếu nhanh hơn, vd job chạy pacing="fast") → thời lượng segment khớp thời gian thực
+- key = id job (upload) hoặc tên ring của nguồn webcam, như heatmap (src/heatmap.py)
+- Bật bằng HLS_OUTPUT=1 (job upload) / --hls (realtime.py); không có ffmpeg thì báo 1 lần và bỏ qua
+
+    hls = HlsEncoder(hls_dir(key), width, height, fps)
+    hls.start()                   # False nếu không chạy được ffmpeg
+    hls.submit(frame)             # mỗi frame đã vẽ overlay
+    hls.close()
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HLS_DIR = os.path.join(BASE_DIR, "realtime", "hls")
+ENABLED = os.environ.get("HLS_OUTPUT", "0") == "1"
+FFMPEG = os.environ.get("FFMPEG_BIN", "ffmpeg")
+SEGMENT_SECONDS = float(os.environ.get("HLS_SEGMENT_SECONDS", "2"))
+PLAYLIST_SIZE = int(os.environ.get("HLS_PLAYLIST_SIZE", "6"))
+CRF = int(os.environ.get("HLS_CRF", "28"))
+PLAYLIST = "index.m3u8"
+MAX_LAG = 1.0   # giây thread ghi trễ so với nhịp fps thì neo lại (bỏ phần nợ) thay vì ghi dồn
+
+CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".m4s": "video/iso.segment", ".mp4": "video/mp4"}
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+_FILE_RE = re.compile(r"^[A-Za-z0-9_.-]+\.(m3u8|m4s|mp4)$")
+
+
+def hls_dir(key, base_dir=HLS_DIR):
+    """Thư mục output HLS của job / nguồn key"""
+    if not _KEY_RE.match(str(key)) or str(key) in (".", ".."):
+        raise ValueError("invalid hls key")
+    return os.path.join(base_dir, str(key))
+
+
+def playlist_url(key):
+    return f"/hls/{key}/{PLAYLIST}"
+
+
+def has_playlist(key, base_dir=HLS_DIR):
+    try:
+        return os.path.isfile(os.path.join(hls_dir(key, base_dir), PLAYLIST))
+    except ValueError:
+        return False
+
+
+def resolve(key, filename, base_dir=HLS_DIR):
+    """
+    (đường dẫn file, content type, Cache-Control) để server trả file tĩnh, None nếu tên không hợp lệ
+    hoặc chưa có file. Playlist đổi liên tục → no-cache; segment/init không đổi → cache được.
+    """
+    if not _FILE_RE.match(filename or ""):
+        return None
+    try:
+        path = os.path.join(hls_dir(key, base_dir), filename)
+    except ValueError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    ext = os.path.splitext(filename)[1]
+    cache = "no-cache" if ext == ".m3u8" else "public, max-age=60"
+    return path, CONTENT_TYPES[ext], cache
+
+
+class HlsEncoder:
+    def __init__(self, out_dir, width, height, fps, segment_seconds=SEGMENT_SECONDS, playlist_size=PLAYLIST_SIZE,
+                 crf=CRF, ffmpeg=FFMPEG):
+        self.out_dir = out_dir
+        # yuv420p cần kích thước chẵn: frame lẻ được resize về kích thước chẵn gần nhất
+        self.width = max(2, int(width) & ~1)
+        self.height = max(2, int(height) & ~1)
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.segment_seconds = segment_seconds
+        self.playlist_size = playlist_size
+        self.crf = crf
+        self.ffmpeg = ffmpeg
+        self.proc = None
+        self.error = None
+        self.submitted = 0
+        self.written = 0
+        self.repeated = 0   # frame ghi lặp lại vì chưa có frame mới
+        self.skipped = 0    # frame bị frame mới hơn thay trước khi kịp ghi
+        self._staging = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._writing = np.zeros_like(self._staging)
+        self._fresh = False
+        self._has_frame = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def command(self):
+        gop = max(1, round(self.fps * self.segment_seconds))
+        return [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{self.width}x{self.height}",
+            "-framerate", f"{self.fps:.3f}", "-i", "pipe:0", "-an",
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p",
+            # Keyframe đúng mỗi segment để player vào giữa stream được ngay
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-f", "hls", "-hls_time", str(self.segment_seconds), "-hls_list_size", str(self.playlist_size),
+            "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(self.out_dir, "seg_%05d.m4s"),
+            "-hls_flags", "delete_segments+independent_segments+temp_file",
+            os.path.join(self.out_dir, PLAYLIST),
+        ]
+
+    def start(self):
+        """Xoá output cũ, chạy ffmpeg + thread ghi; False (kèm self.error) nếu không chạy được ffmpeg"""
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+        os.makedirs(self.out_dir, exist_ok=True)
+        try:
+            with open(os.path.join(self.out_dir, "ffmpeg.log"), "wb") as log:
+                self.proc = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                             stderr=log)
+        except OSError as e:
+            self.error = f"cannot run {self.ffmpeg}: {e}"
+            print(f"[HLS] Disabled, {self.error}")
+            return False
+        self._thread = threading.Thread(target=self._run, name="hls-writer", daemon=True)
+        self._thread.start()
+        print(f"[HLS] {self.width}x{self.height}@{self.fps:.1f} → {os.path.join(self.out_dir, PLAYLIST)}")
+        return True
+
+    @property
+    def running(self):
+        return self.proc is not None and self.error is None
+
+    def submit(self, frame):
+        """Frame mới nhất (BGR, đã vẽ overlay): chép vào staging, không chờ ffmpeg"""
+        if not self.running:
+            return
+        with self._cond:
+            if frame.shape[0] == self.height and frame.shape[1] == self.width:
+                np.copyto(self._staging, frame)
+            else:
+                import cv2
+                cv2.resize(frame, (self.width, self.height), dst=self._staging)
+            if self._fresh:
+                self.skipped += 1
+            self._fresh = True
+            self._has_frame = True
+            self.submitted += 1
+            self._cond.notify()
+
+    def _run(self):
+        delay = 1.0 / self.fps
+        with self._cond:
+            while not self._has_frame and not self._stop.is_set():
+                self._cond.wait(0.5)
+        due = time.perf_counter()
+        while not self._stop.is_set():
+            with self._cond:
+                # Đổi vai 2 buffer: ghi frame mới nhất trong khi vòng xử lý chép frame sau vào staging;
+                # chưa có frame mới thì ghi lại _writing (vẫn là frame mới nhất)
+                if self._fresh:
+                    self._staging, self._writing = self._writing, self._staging
+                    self._fresh = False
+                else:
+                    self.repeated += 1
+            try:
+                self.proc.stdin.write(self._writing.data)
+            except (BrokenPipeError, OSError, ValueError) as e:
+                self.error = f"ffmpeg exited ({e})"
+                print(f"[HLS] {self.error}, see {os.path.join(self.out_dir, 'ffmpeg.log')}")
+                return
+            self.written += 1
+            due += delay
+            now = time.perf_counter()
+            if due > now:
+                self._stop.wait(due - now)
+            elif now - due > MAX_LAG:
+                due = now
+
+    def stats(self):
+        return {"running": self.running, "error": self.error, "submitted": self.submitted,
+                "written": self.written, "repeated": self.repeated, "skipped": self.skipped,
+                "width": self.width, "height": self.height, "fps": round(self.fps, 2)}
+
+    def close(self, timeout=5.0):
+        """Dừng thread ghi, đóng stdin để ffmpeg ghi nốt segment cuối + #EXT-X-ENDLIST"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
@@ -0,0 +1,162 @@
+"""
+Ingest video khi upload chưa xong: ghi từng chunk xuống đĩa và cho worker decode song song.
+
+- Trong lúc nhận, file <video>.uploading tồn tại làm dấu "file còn đang lớn"
+- GrowingVideoCapture đọc như cv2.VideoCapture nhưng khi hết dữ liệu mà upload chưa xong
+  thì chờ file lớn thêm, mở lại và seek tới frame đang đọc dở thay vì trả EOF
+- Chỉ có lợi với container đọc được khi chưa đủ file (MKV/WebM, MP4 fragmented);
+  MP4 thường có moov ở cuối sẽ chỉ mở được khi upload xong (vẫn chạy đúng, chỉ không sớm hơn)
+"""
+import os
+import time
+
+import cv2
+
+UPLOADING_SUFFIX = ".uploading"
+CHUNK_SIZE = 1024 * 1024
+READY_BYTES = 4 * 1024 * 1024  # đủ cho header container + vài frame đầu
+
+
+def marker_path(path):
+    return path + UPLOADING_SUFFIX
+
+
+def is_growing(path):
+    """File còn đang được upload?"""
+    return os.path.exists(marker_path(path))
+
+
+def receive_stream(stream, path, on_ready=None, ready_bytes=READY_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    Ghi stream (file-like .read()) xuống path theo chunk.
+    on_ready(path) được gọi 1 lần khi đã ghi được ready_bytes (hoặc khi stream kết thúc sớm hơn).
+    Trả về tổng số byte đã ghi.
+    """
+    marker = marker_path(path)
+    open(marker, "w").close()
+    total = 0
+    ready = False
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                total += len(chunk)
+                if not ready and total >= ready_bytes:
+                    f.flush()  # worker mở file bằng handle khác
+                    ready = True
+                    if on_ready is not None:
+                        on_ready(path)
+    finally:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+    if not ready and total > 0 and on_ready is not None:
+        on_ready(path)
+    return total
+
+
+class GrowingVideoCapture:
+    """
+    Wrapper cv2.VideoCapture cho file đang được upload.
+    stall_timeout: số giây không thấy file lớn thêm thì coi như upload hỏng và trả EOF.
+    """
+    def __init__(self, path, poll_interval=0.2, stall_timeout=60.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.frames_read = 0
+        self.cap = None
+        self.live = is_growing(path)  # file thường (upload đã xong) thì EOF là EOF thật
+        self._open(wait=True)
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _wait_for_more(self, size):
+        """
+        Chờ file lớn hơn size hoặc upload kết thúc.
+        Trả về False nếu file đứng yên quá stall_timeout (upload bị bỏ dở).
+        """
+        deadline = time.time() + self.stall_timeout
+        while is_growing(self.path) and self._size() <= size:
+            if time.time() > deadline:
+                print(f"[INGEST] Upload stalled for {self.stall_timeout}s: {self.path}")
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def _open(self, wait):
+        while True:
+            if self.cap is not None:
+                self.cap.release()
+            size = self._size()
+            self.cap = cv2.VideoCapture(self.path)
+            if self.cap.isOpened() or not wait or not is_growing(self.path):
+                return self.cap.isOpened()
+            # Chưa đủ header container → chờ thêm dữ liệu
+            if not self._wait_for_more(size):
+                return False
+
+    def _reopen_at(self, index):
+        """Mở lại file (đã lớn hơn) và đặt vị trí về frame index"""
+        if not self._open(wait=False):
+            return False
+        if index > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            pos = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if pos != index:
+                # Seek không chính xác (keyframe) → mở lại và bỏ qua bằng grab()
+                self._open(wait=False)
+                for _ in range(index):
+                    if not self.cap.grab():
+                        return False
+        return True
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def grab(self):
+        ok, _ = self._next(grab_only=True)
+        return ok
+
+    def read(self, image=None):
+        """Như cv2.VideoCapture.read: image cùng kích thước thì decode thẳng vào đó (không cấp phát)"""
+        return self._next(grab_only=False, image=image)
+
+    def _next(self, grab_only, image=None):
+        final_retry = False
+        while True:
+            size = self._size()
+            if grab_only:
+                ok, frame = self.cap.grab(), None
+            else:
+                ok, frame = self.cap.read(image)
+            if ok:
+                self.frames_read += 1
+                return True, frame
+            if is_growing(self.path):
+                self.live = True
+                if not self._wait_for_more(size):
+                    return False, None
+            elif final_retry or not self.live:
+                return False, None  # đã đọc lại sau khi upload xong → hết file thật
+            else:
+                final_retry = True  # upload vừa xong: mở lại lần cuối để đọc phần đuôi file
+            self._reopen_at(self.frames_read)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
@@ -0,0 +1,467 @@
+"""
+Job scheduler cho video upload: hàng đợi ưu tiên + pool worker process cố định.
+
+- Mỗi upload là 1 job (id, trạng thái, tiến độ frames/fps/ETA, kết quả), không còn mỗi upload 1 thread
+- N worker process (spawn), mỗi worker import torch/ultralytics 1 lần và xử lý lần lượt các job được giao;
+  số thread tính toán mỗi worker = số CPU / N (JOB_THREADS) để dùng hết CPU mà không tranh nhau,
+  JOB_PIN_CPUS=1 gắn mỗi worker vào nhóm core riêng (src/cpu_budget.py)
+- Worker load model + warm-up inference trước khi báo "ready" nên frame đầu của job không chậm
+- Huỷ job: cờ trong mp.Array theo worker, process_video kiểm tra mỗi frame
+- Frame/stats của worker đi qua shared-memory ring riêng (src/shm_ring.py); server chỉ gửi nhu cầu
+  encode cho worker đang được xem nên các job khác không tốn công encode JPEG
+- Kết quả lưu realtime/jobs/<id>.json, đọc lại khi server khởi động; heatmap của job ở realtime/heatmaps/<id>.npz,
+  output HLS (HLS_OUTPUT=1) ở realtime/hls/<id>/ (src/hls.py)
+"""
+import heapq
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import uuid
+
+from src.cpu_budget import configure_cpu_budget, split_cpus
+from src.metrics import QUEUE_DEPTH, REGISTRY
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DIR = os.path.join(BASE_DIR, "realtime", "jobs")
+MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", "100"))
+JOB_THREADS = int(os.environ.get("JOB_THREADS", "0"))       # 0 = số CPU / số worker
+PIN_CPUS = os.environ.get("JOB_PIN_CPUS", "0") == "1"
+WORKER_CHECK_INTERVAL = 1.0   # giây giữa 2 lần kiểm tra worker chết
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def default_pool_size():
+    """JOB_WORKERS hoặc ~4 CPU cho mỗi worker (YOLO CPU chạy tốt nhất với vài thread), tối đa 4 worker"""
+    env = os.environ.get("JOB_WORKERS")
+    if env:
+        return max(1, int(env))
+    return max(1, min(4, (os.cpu_count() or 1) // 4))
+
+
+def _worker_main(idx, ring_name, threads, cpus, task_q, event_q, cancel_flags):
+    """Vòng lặp của 1 worker process: nhận job từ task_q, báo sự kiện qua event_q"""
+    # Giới hạn thread/affinity trước khi import torch/ultralytics
+    budget = configure_cpu_budget(threads, cpus, label="JOBS")
+    import ai_worker
+    from src.heatmap import heatmap_path
+    from src.hls import ENABLED as HLS_ENABLED
+    from src.shm_ring import SharedFrameRing
+
+    ring = SharedFrameRing.create(ring_name)
+    ai_worker.attach_frame_ring(ring)
+    warmup = ai_worker.warmup_model()
+    event_q.put(("ready", idx, None, {"pid": os.getpid(), "warmup": warmup, **budget}))
+    try:
+        while True:
+            task = task_q.get()
+            if task is None:
+                break
+            job_id, path, line_config, auto_detect, overlay_mode = task
+            event_q.put(("started", idx, job_id, None))
+            try:
+                result = ai_worker.process_video(
+                    path, line_config, auto_detect, overlay_mode,
+                    progress=lambda info: event_q.put(("progress", idx, job_id, info)),
+                    should_stop=lambda: cancel_flags[idx] == 1,
+                    heatmap_path=heatmap_path(job_id),
+                    hls_key=job_id if HLS_ENABLED else None,
+                )
+            except Exception as e:
+                result = {"error": str(e)}
+            event_q.put(("finished", idx, job_id, result))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class JobScheduler:
+    """
+    hub/state: FrameHub và SharedCounter của server, nhận frame/số đếm của job đang được xem.
+    history_store: HistoryStore để theo dõi điểm history của job đang chạy (SSE).
+    Pool được khởi động ở lần submit đầu tiên.
+    """
+    def __init__(self, hub, state, history_store=None, workers=None, jobs_dir=JOBS_DIR, max_queued=MAX_QUEUED,
+                 threads=JOB_THREADS, pin_cpus=PIN_CPUS):
+        from src.encoder import STREAM_TIERS
+        self.hub = hub
+        self.state = state
+        self.history_store = history_store
+        self.n_workers = workers or default_pool_size()
+        self.threads_per_worker = threads or max(1, (os.cpu_count() or 1) // self.n_workers)
+        # Nhóm core riêng cho từng worker khi bật pin_cpus, None = để OS tự xếp
+        self.worker_cpus = (split_cpus(self.n_workers, self.threads_per_worker) if pin_cpus
+                            else [None] * self.n_workers)
+        self.jobs_dir = jobs_dir
+        self.max_queued = max_queued
+        self.tier_names = list(STREAM_TIERS)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.heap = []  # (-priority, seq, job_id)
+        self._seq = itertools.count()
+        self.workers = [{"proc": None, "task_q": None, "job": None, "ready": False, "pid": None, "warmup": None}
+                        for _ in range(self.n_workers)]
+        self.watched = None   # index worker đang hiển thị trên dashboard
+        self.pinned = False   # True khi người dùng chọn job qua watch(), không tự chuyển sang job mới
+        self.meta = None      # stats/overlay/encode mới nhất của worker đang xem
+        self.started = False
+        self._ctx = mp.get_context("spawn")
+        self.cancel_flags = None
+        self.event_q = None
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._load_jobs()
+
+    # --- lưu trữ ---
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        tmp = self._job_path(job["id"]) + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp, self._job_path(job["id"]))
+        except Exception as e:
+            print(f"[JOBS] Cannot save job {job['id']}: {e}")
+
+    def _load_jobs(self):
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except Exception:
+                continue
+            if job.get("status") not in FINAL_STATES:
+                # Server trước dừng khi job chưa xong
+                job["status"] = FAILED
+                job["error"] = "interrupted (server restarted)"
+                self._save(job)
+            self.jobs[job["id"]] = job
+
+    # --- pool ---
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.event_q = self._ctx.Queue()
+            self.cancel_flags = self._ctx.Array("b", self.n_workers, lock=False)
+            for idx in range(self.n_workers):
+                self._spawn(idx)
+        QUEUE_DEPTH.set_function(lambda: self._count(QUEUED), queue="jobs_queued")
+        QUEUE_DEPTH.set_function(lambda: self._count(RUNNING), queue="jobs_running")
+        print(f"[JOBS] Started {self.n_workers} worker(s), {self.threads_per_worker} thread(s) each")
+        threading.Thread(target=self._event_loop, name="jobs-events", daemon=True).start()
+        for idx in range(self.n_workers):
+            threading.Thread(target=self._pump, args=(idx,), name=f"jobs-pump-{idx}", daemon=True).start()
+
+    def _ring_name(self, idx):
+        return f"track_people_job_{os.getpid()}_{idx}"
+
+    def _spawn(self, idx):
+        # Gọi khi đang giữ lock
+        w = self.workers[idx]
+        w["task_q"] = self._ctx.Queue()
+        w["job"] = None
+        w["ready"] = False
+        w["pid"] = None
+        w["proc"] = self._ctx.Process(
+            target=_worker_main, name=f"job-worker-{idx}", daemon=True,
+            args=(idx, self._ring_name(idx), self.threads_per_worker, self.worker_cpus[idx],
+                  w["task_q"], self.event_q, self.cancel_flags))
+        w["proc"].start()
+
+    def _dispatch(self):
+        # Gọi khi đang giữ lock: giao job ưu tiên cao nhất cho worker rảnh
+        for idx, w in enumerate(self.workers):
+            if not self.heap:
+                return
+            if not w["ready"] or w["job"] is not None:
+                continue
+            while self.heap:
+                _, _, job_id = heapq.heappop(self.heap)
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    continue  # đã huỷ khi còn trong hàng đợi
+                self.cancel_flags[idx] = 0
+                w["job"] = job_id
+                job["worker"] = idx
+                w["task_q"].put((job_id, job["file"], job["line_config"], job["auto_detect"], job["overlay_mode"]))
+                break
+
+    # --- API ---
+    def _queued(self):
+        return sum(1 for j in self.jobs.values() if j["status"] == QUEUED)
+
+    def is_full(self):
+        """Hàng đợi đã đầy (submit sẽ raise JobQueueFull)? Kiểm tra trước khi nhận upload dài"""
+        with self.lock:
+            return self._queued() >= self.max_queued
+
+    def submit(self, path, line_config=None, auto_detect=True, overlay_mode="server", priority=0):
+        """Thêm job vào hàng đợi, trả về bản sao job. JobQueueFull nếu hàng đợi đầy."""
+        self.start()
+        with self.lock:
+            queued = self._queued()
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"Job queue full ({queued} queued)")
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "file": path,
+                "name": os.path.basename(path),
+                "status": QUEUED,
+                "priority": int(priority),
+                "line_config": line_config,
+                "auto_detect": bool(auto_detect),
+                "overlay_mode": overlay_mode,
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+                "worker": None,
+                "progress": {"frames": 0, "total": 0, "fps": 0.0, "eta": None},
+                "result": None,
+                "error": None,
+            }
+            self.jobs[job["id"]] = job
+            heapq.heappush(self.heap, (-job["priority"], next(self._seq), job["id"]))
+            self._save(job)
+            self._dispatch()
+            return dict(job)
+
+    def cancel(self, job_id):
+        """Huỷ job đang chờ (ngay) hoặc đang chạy (worker dừng ở frame kế tiếp). False nếu không huỷ được."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] in FINAL_STATES:
+                return False
+            if job["status"] == QUEUED and job.get("worker") is None:
+                job["status"] = CANCELLED
+                job["finished"] = time.time()
+                self._save(job)
+                return True
+            idx = job.get("worker")
+            if idx is not None and self.workers[idx]["job"] == job_id:
+                self.cancel_flags[idx] = 1
+            return True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, limit=100):
+        with self.lock:
+            jobs = sorted(self.jobs.values(), key=lambda j: j["created"], reverse=True)
+            return [dict(j) for j in jobs[:limit]]
+
+    def watch(self, job_id):
+        """Chuyển dashboard sang xem job đang chạy job_id"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] != RUNNING:
+                return False
+            self._set_watched(job["worker"])
+            self.pinned = True
+            return True
+
+    def control_target(self, job_id):
+        """
+        Tên ring của worker đang chạy job_id: target điều khiển cho src/profiler.py và src/live_config.py.
+        None nếu job không chạy.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or job.get("worker") is None:
+                return None
+            return self._ring_name(job["worker"])
+
+    def set_line_config(self, job_id, line_config):
+        """Lưu cấu hình line/ROI worker đã áp dụng giữa chừng vào bản ghi job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job["line_config"] = line_config
+            job["auto_detect"] = False
+            self._save(job)
+            return dict(job)
+
+    def _set_watched(self, idx):
+        # Gọi khi đang giữ lock
+        if self.watched == idx:
+            return
+        self.watched = idx
+        self.meta = None
+        self.state.reset()
+        self.state.set_running(True)
+
+    def get_overlay(self):
+        meta = self.meta
+        return (meta or {}).get("overlay") or {"mode": "server"}
+
+    def get_stream_stats(self):
+        """Subscriber theo tier + chi phí encode do worker đang xem báo qua ring"""
+        demand = self.hub.demand()
+        encode = (self.meta or {}).get("encode") or {}
+        out = {}
+        for tier in self.tier_names:
+            item = dict(encode.get(tier, {}))
+            item["subscribers"] = demand.get(tier, 0)
+            out[tier] = item
+        return out
+
+    def _count(self, status):
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if j["status"] == status)
+
+    def summary(self):
+        with self.lock:
+            counts = {}
+            for j in self.jobs.values():
+                counts[j["status"]] = counts.get(j["status"], 0) + 1
+            return {
+                "workers": [{"index": i, "pid": w["pid"], "ready": w["ready"], "job": w["job"],
+                             "warmup_s": w["warmup"], "cpus": self.worker_cpus[i]}
+                            for i, w in enumerate(self.workers)],
+                "threads_per_worker": self.threads_per_worker,
+                "jobs": counts,
+                "watched_job": self.workers[self.watched]["job"] if self.watched is not None else None,
+            }
+
+    # --- sự kiện từ worker ---
+    def _event_loop(self):
+        checked_at = time.monotonic()
+        while True:
+            # Kiểm tra worker chết theo thời gian, không chỉ khi hàng đợi rảnh: nhiều worker báo progress
+            # liên tục thì get() không bao giờ hết timeout
+            if time.monotonic() - checked_at >= WORKER_CHECK_INTERVAL:
+                checked_at = time.monotonic()
+                self._check_workers()
+            try:
+                kind, idx, job_id, data = self.event_q.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                self._handle(kind, idx, job_id, data)
+                self._dispatch()
+
+    def _handle(self, kind, idx, job_id, data):
+        # Gọi khi đang giữ lock
+        w = self.workers[idx]
+        job = self.jobs.get(job_id) if job_id else None
+        if kind == "ready":
+            w["ready"] = True
+            w["pid"] = data["pid"]
+            w["warmup"] = data.get("warmup")
+        elif kind == "started" and job is not None:
+            job["status"] = RUNNING
+            job["started"] = time.time()
+            self._save(job)
+            # Dashboard theo job bắt đầu gần nhất, trừ khi người dùng đã chọn job khác
+            if not self.pinned or self.watched == idx:
+                self.pinned = False
+                self.watched = None
+                self._set_watched(idx)
+        elif kind == "progress" and job is not None:
+            job["progress"] = data
+        elif kind == "finished" and job is not None:
+            self._finish(idx, job, data or {})
+
+    def _finish(self, idx, job, result):
+        error = result.get("error")
+        job["status"] = CANCELLED if result.get("cancelled") else (FAILED if error else DONE)
+        job["error"] = error
+        job["result"] = result
+        job["finished"] = time.time()
+        if result.get("frames"):
+            job["progress"] = dict(job["progress"], frames=result["frames"], eta=0)
+        self._save(job)
+        self.workers[idx]["job"] = None
+        self.cancel_flags[idx] = 0
+        # Gauge (fps, độ trễ...) của job vừa xong không còn đúng; job sau gửi lại snapshot mới
+        REGISTRY.drop_remote(f"worker{idx}")
+        if self.watched == idx:
+            self.pinned = False
+            running = [j for j in self.jobs.values() if j["status"] == RUNNING]
+            if running:
+                # Còn job khác đang chạy → dashboard chuyển sang job bắt đầu gần nhất
+                self._set_watched(max(running, key=lambda j: j["started"] or 0)["worker"])
+            else:
+                self.state.update_from({"in": result.get("in", 0), "out": result.get("out", 0), "running": False,
+                                        "zones": result.get("zones")})
+
+    def _check_workers(self):
+        """Worker chết (crash, bị kill) → job đang chạy thành failed, tạo lại worker"""
+        with self.lock:
+            for idx, w in enumerate(self.workers):
+                proc = w["proc"]
+                if proc is None or proc.is_alive():
+                    continue
+                job = self.jobs.get(w["job"]) if w["job"] else None
+                print(f"[JOBS] Worker {idx} exited (code {proc.exitcode}), restarting")
+                if job is not None:
+                    self._finish(idx, job, {"error": f"worker crashed (exit code {proc.exitcode})"})
+                REGISTRY.drop_remote(f"worker{idx}")
+                self._spawn(idx)
+
+    # --- frame/stats từ ring của worker ---
+    def _pump(self, idx):
+        from src.shm_ring import SharedFrameRing
+        from src.history_store import HistoryFollower
+        follower = HistoryFollower(self.history_store, self.state) if self.history_store is not None else None
+        ring = None
+        ring_pid = None
+        frame_seq = meta_seq = 0
+        while True:
+            try:
+                pid = self.workers[idx]["pid"]
+                if ring is not None and pid != ring_pid:
+                    ring.close()  # worker được tạo lại → segment mới cùng tên
+                    ring = None
+                if ring is None:
+                    ring = SharedFrameRing.attach(self._ring_name(idx)) if pid else None
+                    ring_pid = pid
+                    frame_seq = meta_seq = 0
+                    if ring is None:
+                        time.sleep(0.5)
+                        continue
+                watched = self.watched == idx
+                # Chỉ worker đang được xem mới nhận nhu cầu encode
+                demand = self.hub.demand() if watched else {}
+                ring.write_demand([demand.get(t, 0) for t in self.tier_names])
+                ring.wait(0.5)
+                frame_seq, frames = ring.read_frames(frame_seq)
+                meta_seq, meta = ring.read_stats(meta_seq)
+                if meta is not None and meta.get("metrics"):
+                    REGISTRY.set_remote(f"worker{idx}", meta["metrics"])
+                if not watched:
+                    continue
+                for tier_idx, data in frames.items():
+                    if tier_idx < len(self.tier_names):
+                        self.hub.publish(data, self.tier_names[tier_idx])
+                if meta is not None:
+                    self.meta = meta
+                    if meta.get("stats") and self.workers[idx]["job"] is not None:
+                        self.state.update_from(meta["stats"])
+                if follower is not None:
+                    follower.poll()
+            except Exception as e:
+                print(f"[JOBS] Pump {idx} error: {e}")
+                if ring is not None:
+                    ring.close()
+                ring = None
+                time.sleep(0.5)
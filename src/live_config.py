@@ -0,0 +1,187 @@
+"""
+Đổi line đếm / ROI / vùng của job hoặc nguồn webcam đang chạy, không load lại model, không reset số đếm.
+
+- Server ghi yêu cầu realtime/control/<target>.config.json (target = tên shm ring của process,
+  giống src/profiler.py); yêu cầu mới ghi đè yêu cầu chưa áp dụng
+- Vòng xử lý gọi LiveConfig.poll() giữa 2 frame (đọc file mỗi CHECK_INTERVAL giây), áp dụng bằng apply():
+  PeopleCounter.set_line + tracker.set_roi/clear_roi + dựng lại OverlayRenderer rồi mới đổi tham chiếu
+- Process ghi cấu hình đã áp dụng vào <target>.config.applied.json, server đọc lại để trả về API
+
+Body (mọi trường đều tuỳ chọn, trường không gửi giữ nguyên giá trị đang chạy):
+    {"line_type": "horizontal", "y": 300, "angle": 10, "x1": 0, "x2": 640}
+    {"line_type": "vertical", "line_x": 320}
+    {"roi": {"x1": 0, "y1": 100, "x2": 640, "y2": 480}}   # "roi": null → bỏ ROI
+    {"zones": [{"id": "queue", "points": [[0, 200], [300, 200], [300, 480], [0, 480]]}]}  # src/zones.py, [] → bỏ vùng
+"""
+import json
+import os
+import re
+import time
+import uuid
+
+from src.overlay import OverlayRenderer
+from src.zones import parse_zones
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTROL_DIR = os.path.join(BASE_DIR, "realtime", "control")
+CHECK_INTERVAL = 0.5
+LINE_MARGIN = 50  # line cách mép frame tối thiểu (như khi bắt đầu job)
+
+_TARGET_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+_NUMBERS = {"y": int, "angle": float, "x1": int, "x2": int, "line_x": int}
+
+
+def parse_update(data):
+    """Kiểm tra body API → dict đã chuẩn hoá; ValueError nếu sai kiểu / giá trị"""
+    if not isinstance(data, dict):
+        raise ValueError("body must be a JSON object")
+    update = {}
+    line_type = data.get("line_type")
+    if line_type is not None:
+        if line_type not in ("horizontal", "vertical"):
+            raise ValueError("line_type must be horizontal or vertical")
+        update["line_type"] = line_type
+    for key, cast in _NUMBERS.items():
+        if data.get(key) is not None:
+            try:
+                update[key] = cast(data[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a number")
+    if "roi" in data:
+        roi = data["roi"]
+        if roi is None:
+            update["roi"] = None
+        else:
+            try:
+                update["roi"] = {k: int(roi[k]) for k in ("x1", "y1", "x2", "y2")}
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("roi must be null or {x1, y1, x2, y2}")
+    if "zones" in data:
+        update["zones"] = parse_zones(data["zones"])
+    if not update:
+        raise ValueError("nothing to update")
+    return update
+
+
+def apply(update, counter, tracker, zones=None):
+    """
+    Áp dụng update lên counter/tracker/zones (ZoneTracker, gọi trên thread xử lý, giữa 2 frame).
+    Đổi vùng thì số liệu dwell của vùng bắt đầu lại, số đếm line giữ nguyên.
+    Trả về (overlay mới, cấu hình đang chạy); overlay dựng xong trước khi caller đổi tham chiếu.
+    """
+    w, h = counter.frame_width, counter.frame_height
+    line_type = update.get("line_type", counter.line_type)
+    if line_type == "vertical":
+        line_x = update.get("line_x", counter.line_x if counter.line_type == "vertical" else w // 2)
+        counter.set_line("vertical", line_x=max(LINE_MARGIN, min(line_x, w - LINE_MARGIN)))
+    else:
+        same = counter.line_type == "horizontal"
+        line_y = update.get("y", counter.line_y if same else h // 2)
+        x1 = update.get("x1", counter.line_x1 if same else 0)
+        x2 = update.get("x2", counter.line_x2 if same else w)
+        counter.set_line("horizontal", line_y=max(LINE_MARGIN, min(line_y, h - LINE_MARGIN)),
+                         line_angle=update.get("angle", counter.line_angle if same else 0),
+                         line_x1=max(0, min(x1, w)), line_x2=max(0, min(x2, w)))
+    if "roi" in update:
+        roi = update["roi"]
+        if roi is None:
+            tracker.clear_roi()
+        else:
+            x1 = max(0, min(roi["x1"], w))
+            y1 = max(0, min(roi["y1"], h))
+            tracker.set_roi(x1, y1, max(x1, min(roi["x2"], w)), max(y1, min(roi["y2"], h)))
+    if "zones" in update and zones is not None:
+        zones.set_zones(update["zones"])
+    zone_config = zones.config() if zones is not None else None
+    return (OverlayRenderer.from_counter(counter, roi=tracker.roi, zones=zone_config),
+            current(counter, tracker, zones))
+
+
+def current(counter, tracker, zones=None):
+    """Cấu hình line/ROI/vùng đang chạy (dạng line_config của job)"""
+    if counter.line_type == "vertical":
+        config = {"line_type": "vertical", "line_x": counter.line_x}
+    else:
+        config = {"line_type": "horizontal", "y": counter.line_y, "angle": counter.line_angle,
+                  "x1": counter.line_x1, "x2": counter.line_x2}
+    roi = tracker.roi
+    config["roi"] = dict(zip(("x1", "y1", "x2", "y2"), roi)) if roi is not None else None
+    if zones is not None:
+        config["zones"] = zones.config()
+    config["auto"] = False
+    return config
+
+
+def _paths(target, control_dir):
+    base = os.path.join(control_dir, f"{target}.config")
+    return base + ".json", base + ".applied.json"
+
+
+def request_update(target, update, control_dir=CONTROL_DIR):
+    """Server: gửi update cho process target, trả về id yêu cầu"""
+    if not _TARGET_RE.match(target):
+        raise ValueError("invalid target")
+    os.makedirs(control_dir, exist_ok=True)
+    request_id = uuid.uuid4().hex[:12]
+    path = _paths(target, control_dir)[0]
+    with open(f"{path}.{request_id}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"id": request_id, "update": update, "requested": time.time()}, f)
+    os.replace(f"{path}.{request_id}.tmp", path)
+    return request_id
+
+
+def wait_applied(target, request_id, timeout=3.0, control_dir=CONTROL_DIR):
+    """Chờ process áp dụng yêu cầu; None nếu hết timeout (yêu cầu vẫn chờ đến frame kế tiếp)"""
+    applied_path = _paths(target, control_dir)[1]
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(applied_path, "r", encoding="utf-8") as f:
+                applied = json.load(f)
+            if applied.get("id") == request_id:
+                return applied
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.1)
+    return None
+
+
+class LiveConfig:
+    """Phía vòng xử lý: nhận yêu cầu đổi line/ROI của target"""
+    def __init__(self, target, control_dir=CONTROL_DIR):
+        self.target = target
+        self.path, self.applied_path = _paths(target, control_dir)
+        self._next_check = 0.0
+
+    def poll(self):
+        """Yêu cầu đang chờ ({"id", "update"}) hoặc None; gọi mỗi frame, chỉ đọc file mỗi CHECK_INTERVAL"""
+        now = time.perf_counter()
+        if now < self._next_check:
+            return None
+        self._next_check = now + CHECK_INTERVAL
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                request = json.load(f)
+            os.remove(self.path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[CONFIG] Bad request {self.path}: {e}")
+            return None
+        try:
+            request["update"] = parse_update(request.get("update"))
+        except ValueError as e:
+            print(f"[CONFIG] {self.target}: ignored update: {e}")
+            return None
+        return request
+
+    def applied(self, request, config, frame_index):
+        """Ghi lại cấu hình đã áp dụng cho server"""
+        data = {"id": request["id"], "config": config, "frame": frame_index, "applied": time.time()}
+        try:
+            with open(self.applied_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(self.applied_path + ".tmp", self.applied_path)
+        except OSError as e:
+            print(f"[CONFIG] {self.target}: cannot write {self.applied_path}: {e}")
+        print(f"[CONFIG] {self.target}: applied at frame {frame_index}: {config}")
@@ -0,0 +1,290 @@
+"""
+Metrics registry nhỏ gọn, xuất /metrics theo Prometheus text format (không cần prometheus_client).
+
+- Counter / Gauge / Histogram có label; observe/inc chỉ là cập nhật dict dưới 1 lock → để bật thường trực
+- Label giữ số lượng series có giới hạn: stream (upload, webcam, id nguồn), worker, stage, tier...
+  (không gắn id job vào label để Prometheus không phình series theo số video)
+- Process khác (worker job, webcam) gửi snapshot() qua shm ring; server gọi set_remote() và render()
+  gộp chung, thêm label process="<tên>"; process kết thúc / khởi động lại → drop_remote(), snapshot không
+  được làm mới quá REMOTE_TTL giây (process chết ở nơi server không thấy) bị bỏ khi render
+
+    STAGE_SECONDS.observe(0.004, stream="upload", stage="decode")
+    REGISTRY.render()   # text cho GET /metrics
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REMOTE_TTL = 30.0   # giây; process gửi snapshot khoảng mỗi giây
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(pairs):
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+        self.functions = {}
+
+    def set_function(self, fn, **labels):
+        """Giá trị tính lúc render (độ sâu hàng đợi, số subscriber...), fn lỗi thì bỏ qua"""
+        with self.lock:
+            self.functions[_key(labels)] = fn
+
+    def remove(self, **labels):
+        with self.lock:
+            self.values.pop(_key(labels), None)
+            self.functions.pop(_key(labels), None)
+
+    def samples(self):
+        with self.lock:
+            out = list(self.values.items())
+            functions = list(self.functions.items())
+        for key, fn in functions:
+            try:
+                out.append((key, float(fn())))
+            except Exception:
+                continue
+        return out
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            h = self.values.get(key)
+            if h is None:
+                # [đếm theo bucket (không cộng dồn)..., +Inf, sum]
+                h = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += value
+
+    def samples(self):
+        with self.lock:
+            return [(key, list(h)) for key, h in self.values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.remote = {}  # tên process → (snapshot, thời điểm nhận)
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def snapshot(self):
+        """Dạng JSON để gửi sang process khác (shm ring)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        out = {}
+        for m in metrics:
+            samples = m.samples()
+            if not samples:
+                continue
+            item = {"type": m.type, "help": m.help, "samples": [[dict(k), v] for k, v in samples]}
+            if m.type == "histogram":
+                item["buckets"] = list(m.buckets)
+            out[m.name] = item
+        return out
+
+    def set_remote(self, process, snapshot):
+        with self.lock:
+            self.remote[process] = (snapshot, time.time())
+
+    def drop_remote(self, process):
+        with self.lock:
+            self.remote.pop(process, None)
+
+    def render(self):
+        families = {}
+        for name, item in self.snapshot().items():
+            families[name] = dict(item, samples=[(_key(labels), v) for labels, v in item["samples"]])
+        now = time.time()
+        with self.lock:
+            for process in [p for p, (_, t) in self.remote.items() if now - t > REMOTE_TTL]:
+                del self.remote[process]
+            remote = list(self.remote.items())
+        for process, (snap, _) in remote:
+            for name, item in snap.items():
+                fam = families.setdefault(name, dict(item, samples=[]))
+                if fam["type"] != item["type"]:
+                    continue
+                for labels, v in item["samples"]:
+                    fam["samples"].append((_key(dict(labels, process=process)), v))
+
+        lines = []
+        for name in sorted(families):
+            fam = families[name]
+            lines.append(f"# HELP {name} {fam['help']}")
+            lines.append(f"# TYPE {name} {fam['type']}")
+            for key, value in sorted(fam["samples"]):
+                if fam["type"] == "histogram":
+                    bounds = list(fam["buckets"]) + [float("inf")]
+                    total = 0
+                    for bound, n in zip(bounds, value[:-1]):
+                        total += n
+                        lines.append(f"{name}_bucket{_fmt_labels(key + (('le', _fmt_value(bound)),))} {total}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {_fmt_value(value[-1])}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {total}")
+                else:
+                    lines.append(f"{name}{_fmt_labels(key)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageMetrics:
+    """Timer cùng interface StageTimer (src/timing.py), ghi vào histogram people_stage_seconds"""
+    def __init__(self, **labels):
+        self.labels = labels
+        self._stages = {}
+
+    def stage(self, name):
+        st = self._stages.get(name)
+        if st is None:
+            st = self._stages[name] = _MetricStage(dict(self.labels, stage=name))
+        return st
+
+
+class _MetricStage:
+    __slots__ = ("labels", "t0")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+class CrossingRate:
+    """Số lượt qua line trong 60 giây gần nhất (gauge people_crossings_per_minute)"""
+    def __init__(self, window=60.0):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def add(self, n=1):
+        now = time.time()
+        with self.lock:
+            self.times.extend([now] * n)
+
+    def per_minute(self):
+        cutoff = time.time() - self.window
+        with self.lock:
+            while self.times and self.times[0] < cutoff:
+                self.times.popleft()
+            return len(self.times) * 60.0 / self.window
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("people_stage_seconds", "Thời gian từng stage xử lý 1 frame")
+FRAMES = REGISTRY.counter("people_frames_total", "Số frame đã xử lý")
+FRAMES_SKIPPED = REGISTRY.counter("people_frames_skipped_total", "Frame bỏ qua không chạy tracker (frame interval)")
+FRAMES_DROPPED = REGISTRY.counter("people_frames_dropped_total",
+                                  "Frame bị bỏ theo lý do (stale: có frame mới hơn, read_error, error: lỗi xử lý)")
+CAPTURE_LATENCY = REGISTRY.histogram("people_capture_to_count_seconds", "Độ trễ từ lúc capture frame đến khi đếm xong")
+ACTIVE_TRACKS = REGISTRY.gauge("people_active_tracks", "Số track đang theo dõi ở frame gần nhất")
+CROSSINGS = REGISTRY.counter("people_crossings_total", "Số lượt qua line theo hướng")
+CROSSINGS_PER_MINUTE = REGISTRY.gauge("people_crossings_per_minute", "Lượt qua line trong 60 giây gần nhất")
+FPS = REGISTRY.gauge("people_fps", "FPS xử lý đo mỗi giây")
+MODEL_LOAD_SECONDS = REGISTRY.histogram("people_model_load_seconds", "Thời gian load model", buckets=LOAD_BUCKETS)
+MODEL_WARMUP_SECONDS = REGISTRY.histogram("people_model_warmup_seconds", "Thời gian warm-up inference khi worker khởi động",
+                                          buckets=LOAD_BUCKETS)
+ZONE_OCCUPANCY = REGISTRY.gauge("people_zone_occupancy", "Số người đang ở trong vùng (src/zones.py)")
+REID_MATCHES = REGISTRY.counter("people_reid_matches_total", "ID mới được ghép với người đã đếm (không đếm lại)")
+PLAYBACK_LAG = REGISTRY.gauge("people_playback_lag_seconds", "Độ trễ phát video upload so với timestamp nguồn (src/pacing.py)")
+QUEUE_DEPTH = REGISTRY.gauge("people_queue_depth", "Độ sâu hàng đợi (job chờ, viewer, subscriber...)")
+
+_crossing_rates = {}
+
+
+def record_crossings(stream, d_in, d_out):
+    """Cộng lượt qua line (chênh lệch IN/OUT sau bước đếm) cho stream"""
+    if d_in <= 0 and d_out <= 0:
+        return
+    rate = _crossing_rates.get(stream)
+    if rate is None:
+        rate = _crossing_rates[stream] = CrossingRate()
+        CROSSINGS_PER_MINUTE.set_function(rate.per_minute, stream=stream)
+    if d_in > 0:
+        CROSSINGS.inc(d_in, stream=stream, direction="in")
+    if d_out > 0:
+        CROSSINGS.inc(d_out, stream=stream, direction="out")
+    rate.add(d_in + d_out)
@@ -0,0 +1,196 @@
+import math
+import cv2
+import numpy as np
+
+# Vùng stats box ở góc trên trái (x1, y1, x2, y2) - giống layout cũ
+STATS_BOX = (10, 10, 300, 120)
+
+LINE_COLOR = (0, 255, 255)
+ROI_COLOR = (255, 0, 0)
+ZONE_COLOR = (255, 0, 255)
+BOX_COLOR = (0, 255, 0)
+
+
+def line_endpoints(line_type, frame_width, frame_height, line_y=0, line_angle=0,
+                   line_x1=0, line_x2=None, line_x=None):
+    """Trả về 2 điểm đầu/cuối của đường đếm theo cấu hình (dùng cho vẽ và client overlay)"""
+    if line_x2 is None:
+        line_x2 = frame_width
+    if line_type == "vertical":
+        x = int(line_x) if line_x is not None else frame_width // 2
+        return (x, 0), (x, frame_height)
+    if line_angle == 0:
+        return (int(line_x1), int(line_y)), (int(line_x2), int(line_y))
+    angle_rad = math.radians(line_angle)
+    center_x = (line_x1 + line_x2) // 2
+    center_y = line_y
+    length = abs(line_x2 - line_x1) // 2
+    dx = length * math.cos(angle_rad)
+    dy = length * math.sin(angle_rad)
+    return (int(center_x - dx), int(center_y - dy)), (int(center_x + dx), int(center_y + dy))
+
+
+def _draw_masked(layer, mask, fn, *args, color, **kwargs):
+    """Vẽ cùng một primitive lên layer màu và mask để biết pixel nào thuộc overlay"""
+    fn(layer, *args, color, **kwargs)
+    fn(mask, *args, 255, **kwargs)
+
+
+class OverlayRenderer:
+    """
+    Vẽ overlay lên frame với layer tĩnh được render sẵn 1 lần cho mỗi cấu hình.
+    - Layer tĩnh (ROI, vùng, counting line, label hướng) + mask render 1 lần,
+      mỗi frame chỉ cần composite bằng cv2.copyTo thay vì gọi lại cv2.line/putText
+    - Stats box (IN/OUT/NET) được cache thành patch, chỉ vẽ lại khi số đếm thay đổi
+    - Box + ID của track vẫn vẽ mỗi frame vì thay đổi liên tục
+    """
+    def __init__(self, frame_width, frame_height, line_type="horizontal", line_y=0, line_angle=0,
+                 line_x1=0, line_x2=None, line_x=None, roi=None, zones=None):
+        self.frame_width = int(frame_width)
+        self.frame_height = int(frame_height)
+        self.line_type = line_type
+        self.line_y = int(line_y)
+        self.line_angle = line_angle
+        self.line_x1 = int(line_x1)
+        self.line_x2 = int(line_x2) if line_x2 is not None else self.frame_width
+        self.line_x = int(line_x) if line_x is not None else self.frame_width // 2
+        self.roi = tuple(int(v) for v in roi) if roi is not None else None
+        self.zones = [{"id": z["id"], "points": [list(p) for p in z["points"]]} for z in (zones or [])]
+        self.line_pts = line_endpoints(line_type, self.frame_width, self.frame_height, self.line_y,
+                                       line_angle, self.line_x1, self.line_x2, self.line_x)
+
+        self._layer, self._mask, self._blend_rects = self._build_static_layer()
+        self._stats_key = None
+        self._stats_patch = None
+        self._stats_mask = None
+
+    @classmethod
+    def from_counter(cls, counter, roi=None, zones=None):
+        """Tạo overlay khớp với cấu hình line của một PeopleCounter (+ vùng của src/zones.py)"""
+        return cls(counter.frame_width, counter.frame_height, line_type=counter.line_type,
+                   line_y=counter.line_y, line_angle=counter.line_angle, line_x1=counter.line_x1,
+                   line_x2=counter.line_x2, line_x=counter.line_x, roi=roi, zones=zones)
+
+    def _build_static_layer(self):
+        """
+        Render layer tĩnh 1 lần trên nền đen.
+        Trả về (layer, mask pixel đặc, các vùng chữ có viền anti-alias cần blend riêng)
+        """
+        h, w = self.frame_height, self.frame_width
+        layer = np.zeros((h, w, 3), dtype=np.uint8)
+        mask = np.zeros((h, w), dtype=np.uint8)
+
+        def draw(fn, *args, color, **kwargs):
+            _draw_masked(layer, mask, fn, *args, color=color, **kwargs)
+
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            draw(cv2.rectangle, (x1, y1), (x2, y2), color=ROI_COLOR, thickness=2)
+            draw(cv2.putText, "ROI (Detection Area)", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                 color=ROI_COLOR, thickness=2)
+
+        for zone in self.zones:
+            pts = np.asarray(zone["points"], dtype=np.int32)
+            draw(cv2.polylines, [pts], True, color=ZONE_COLOR, thickness=2)
+            x, y = pts.min(axis=0)
+            draw(cv2.putText, zone["id"], (int(x) + 5, int(y) + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                 color=ZONE_COLOR, thickness=2)
+
+        pt1, pt2 = self.line_pts
+        draw(cv2.line, pt1, pt2, color=LINE_COLOR, thickness=3)
+        if self.line_type == "vertical":
+            draw(cv2.putText, "Trai -> Phai = VAO", (self.line_x + 15, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                 color=(0, 255, 0), thickness=2)
+            draw(cv2.putText, "Phai -> Trai = RA", (self.line_x + 15, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                 color=(0, 0, 255), thickness=2)
+        else:
+            label_x = min(self.line_x1, self.line_x2) + 10
+            label_y = self.line_y - 10 if self.line_y > 30 else self.line_y + 25
+            draw(cv2.putText, f"Counting Line ({self.line_angle}°)", (label_x, label_y),
+                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, color=LINE_COLOR, thickness=2)
+
+        # Pixel đặc (line, ROI) copy thẳng bằng mask
+        solid = np.where(mask == 255, 255, 0).astype(np.uint8)
+
+        # Chữ có viền anti-alias: gom thành các vùng nhỏ, blend out = bg * (1 - a) + px
+        # (layer vẽ trên nền đen nên màu đã nhân alpha sẵn) để giống hệt vẽ trực tiếp
+        aa = ((mask > 0) & (mask < 255)).astype(np.uint8)
+        blend_rects = []
+        if aa.any():
+            _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.dilate(aa, np.ones((9, 9), np.uint8)))
+            for x, y, bw, bh, _area in stats[1:]:
+                region = (slice(y, y + bh), slice(x, x + bw))
+                inv_alpha = cv2.merge([255 - mask[region]] * 3)
+                blend_rects.append((region, inv_alpha, layer[region].copy()))
+        return layer, solid, blend_rects
+
+    def _render_stats_patch(self, counts):
+        """Render lại stats box (nền + viền + IN/OUT/NET) thành patch + mask, toạ độ gốc (0, 0)"""
+        x1, y1, x2, y2 = STATS_BOX
+        # +2 để chứa cả viền dày 2px tràn ra ngoài (x2, y2)
+        patch = np.zeros((y2 + 2, x2 + 2, 3), dtype=np.uint8)
+        mask = np.zeros((y2 + 2, x2 + 2), dtype=np.uint8)
+        _draw_masked(patch, mask, cv2.rectangle, (x1, y1), (x2, y2), color=(0, 0, 0), thickness=-1)
+        _draw_masked(patch, mask, cv2.rectangle, (x1, y1), (x2, y2), color=(255, 255, 255), thickness=2)
+        cv2.putText(patch, f"IN: {counts['in']}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        cv2.putText(patch, f"OUT: {counts['out']}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        net_color = (255, 255, 0) if counts["net"] >= 0 else (0, 165, 255)
+        cv2.putText(patch, f"NET: {counts['net']}", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, net_color, 2)
+        return patch, mask
+
+    def _apply_static(self, frame):
+        if frame.shape[0] != self.frame_height or frame.shape[1] != self.frame_width:
+            return
+        cv2.copyTo(self._layer, self._mask, frame)
+        for region, inv_alpha, px in self._blend_rects:
+            roi = frame[region]
+            cv2.multiply(roi, inv_alpha, dst=roi, scale=1.0 / 255)
+            cv2.add(roi, px, dst=roi)
+
+    def _apply_stats(self, frame, counts):
+        key = (counts["in"], counts["out"], counts["net"])
+        if key != self._stats_key:
+            self._stats_patch, self._stats_mask = self._render_stats_patch(counts)
+            self._stats_key = key
+        ph = min(self._stats_patch.shape[0], frame.shape[0])
+        pw = min(self._stats_patch.shape[1], frame.shape[1])
+        cv2.copyTo(self._stats_patch[:ph, :pw], self._stats_mask[:ph, :pw], frame[:ph, :pw])
+
+    def render(self, frame, boxes, counts, info_text=None):
+        """
+        Vẽ toàn bộ overlay lên frame (in-place).
+        boxes: list (track_id, l, t, r, b)
+        counts: dict từ SharedCounter.get()
+        info_text: dòng thông tin nhỏ dưới stats (frame/FPS), vẽ mỗi frame
+        """
+        self._apply_static(frame)
+        for track_id, l, t, r, b in boxes:
+            cv2.rectangle(frame, (l, t), (r, b), BOX_COLOR, 2)
+            cv2.putText(frame, f"ID {track_id}", (l, t - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, BOX_COLOR, 2)
+        self._apply_stats(frame, counts)
+        if info_text:
+            cv2.putText(frame, info_text, (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        return frame
+
+    def geometry(self):
+        """Hình học tĩnh của overlay (line + ROI + vùng) dạng JSON"""
+        (x1, y1), (x2, y2) = self.line_pts
+        return {
+            "w": self.frame_width,
+            "h": self.frame_height,
+            "line": {"type": self.line_type, "angle": self.line_angle, "pts": [[x1, y1], [x2, y2]]},
+            "roi": list(self.roi) if self.roi is not None else None,
+            "zones": self.zones,
+        }
+
+    def payload(self, boxes, counts, frame_index=None):
+        """
+        Overlay gọn dạng JSON cho chế độ client-side: dashboard tự vẽ, worker không vẽ gì.
+        tracks: [[id, l, t, r, b], ...]
+        """
+        data = self.geometry()
+        data["mode"] = "client"
+        data["frame"] = frame_index
+        data["tracks"] = [[int(i), int(l), int(t), int(r), int(b)] for i, l, t, r, b in boxes]
+        data["counts"] = {"in": counts["in"], "out": counts["out"], "net": counts["net"]}
+        return data
@@ -0,0 +1,83 @@
+"""
+Nhịp phát video upload theo timestamp nguồn (thay cho sleep(frame_delay * 0.3) cố định).
+
+- "realtime": frame i đến hạn lúc t0 + i / fps (đồng hồ wall clock neo ở frame đầu). Xử lý nhanh hơn nguồn
+  → chờ đến hạn (stage "pacing"); chậm hơn quá 1 frame → bỏ frame (cap.grab(), không decode, không track)
+  để đuổi kịp. Tối đa MAX_CATCHUP_SKIP frame bỏ liên tiếp để tracker vẫn ghép được ID và counter vẫn thấy
+  đủ vị trí (debounce) → không mất lượt đếm. Vẫn trễ hơn MAX_LAG giây (tracker quá chậm, upload đang
+  nhận dở) thì neo lại đồng hồ (rebase) thay vì để độ trễ tăng mãi
+- "fast": không chờ, không bỏ frame (benchmark, ghi track để replay, xử lý batch)
+
+    pacer = PlaybackPacer(fps, mode="realtime")
+    if pacer.should_skip(frame_index):   # trước khi đọc frame frame_index
+        cap.grab()
+    ...
+    pacer.wait(frame_index)              # chờ đến hạn của frame (đo trong stage "pacing")
+    pacer.stats()                        # {"mode", "lag_ms", "max_lag_ms", "catchup_skips", "rebases"}
+"""
+import os
+import time
+
+REALTIME, FAST = "realtime", "fast"
+MODES = (REALTIME, FAST)
+DEFAULT_MODE = os.environ.get("PACING_MODE", REALTIME)
+MAX_CATCHUP_SKIP = 2    # frame bỏ liên tiếp tối đa (tracker thấy ít nhất 1/3 số frame khi đuổi)
+MAX_LAG = 2.0           # giây trễ tối đa trước khi neo lại đồng hồ
+
+
+class PlaybackPacer:
+    def __init__(self, fps, mode=DEFAULT_MODE, max_skip=MAX_CATCHUP_SKIP, max_lag=MAX_LAG):
+        if mode not in MODES:
+            raise ValueError(f"pacing mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.frame_delay = 1.0 / fps if fps and fps > 0 else 1.0 / 30.0
+        self.max_skip = max_skip
+        self.max_lag = max_lag
+        self.lag = 0.0
+        self.max_lag_seen = 0.0
+        self.catchup_skips = 0
+        self.rebases = 0
+        self._t0 = None       # wall clock tương ứng timestamp 0 của nguồn
+        self._streak = 0      # số frame đang bỏ liên tiếp
+
+    def _due(self, index):
+        return self._t0 + index * self.frame_delay
+
+    def _lag(self, index):
+        """Trễ (giây) của frame index so với hạn; neo đồng hồ ở frame đầu, rebase khi trễ quá MAX_LAG"""
+        now = time.perf_counter()
+        if self._t0 is None:
+            self._t0 = now - index * self.frame_delay
+        lag = now - self._due(index)
+        if lag > self.max_lag:
+            self._t0 = now - index * self.frame_delay
+            self.rebases += 1
+            lag = 0.0
+        return lag
+
+    def should_skip(self, index):
+        """True nếu nên bỏ frame index (chỉ grab) để đuổi kịp nguồn"""
+        if self.mode != REALTIME:
+            return False
+        lag = self._lag(index)
+        if lag > self.frame_delay and self._streak < self.max_skip:
+            self._streak += 1
+            self.catchup_skips += 1
+            return True
+        self._streak = 0
+        return False
+
+    def wait(self, index):
+        """Sau khi xử lý xong frame index: chờ đến hạn (realtime), ghi lại độ trễ hiện tại"""
+        if self.mode != REALTIME:
+            return
+        lag = self._lag(index)
+        if lag < 0:
+            time.sleep(-lag)
+            lag = 0.0
+        self.lag = lag
+        self.max_lag_seen = max(self.max_lag_seen, lag)
+
+    def stats(self):
+        return {"mode": self.mode, "lag_ms": round(self.lag * 1000, 1), "max_lag_ms": round(self.max_lag_seen * 1000, 1),
+                "catchup_skips": self.catchup_skips, "rebases": self.rebases}
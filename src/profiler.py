@@ -0,0 +1,384 @@
+"""
+Profile CPU theo yêu cầu cho vòng xử lý đang chạy (process_video / run_webcam), không cần restart.
+
+- Server ghi yêu cầu realtime/profiles/<target>.request.json; target = tên shm ring của process
+  (worker job: track_people_job_<pid>_<idx>, webcam: track_people_ring[_<source id>])
+- Vòng lặp gọi ProfileControl.poll() đầu mỗi frame: khi không profile chỉ stat file mỗi CHECK_INTERVAL giây
+- mode "sample": thread lấy mẫu stack của thread xử lý mỗi SAMPLE_INTERVAL giây → collapsed stacks
+  (flamegraph.pl, speedscope); mode "cprofile": cProfile → .pstats (python -m pstats, snakeviz)
+- Cả 2 mode ghi thời gian từng stage theo frame (timer của vòng lặp được bọc bằng ProfileControl.wrap)
+- Kết quả: realtime/profiles/<id>.json (tóm tắt + breakdown theo frame) và <id>.collapsed | <id>.pstats
+- Endpoint admin cần header X-Admin-Token = ADMIN_TOKEN; không đặt ADMIN_TOKEN thì chỉ nhận request từ loopback
+
+    control = ProfileControl(ring_name)
+    timer = control.wrap(timer)
+    while True:
+        control.poll()
+        with timer.stage("decode"): ...
+    control.close()
+"""
+import cProfile
+import hmac
+import io
+import ipaddress
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from src.timing import StageTimer
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES_DIR = os.path.join(BASE_DIR, "realtime", "profiles")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MODES = ("sample", "cprofile")
+MAX_SECONDS = 120
+CHECK_INTERVAL = 0.5
+SAMPLE_INTERVAL = 0.005
+MAX_FRAMES = 5000   # breakdown theo frame giữ tối đa N frame, tổng hợp stage vẫn tính đủ
+TOP_N = 25
+
+_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+_TARGET_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _is_loopback(remote_addr):
+    try:
+        return ipaddress.ip_address((remote_addr or "").split("%")[0]).is_loopback
+    except ValueError:
+        return False
+
+
+def authorized(token, remote_addr=None):
+    """
+    Endpoint admin: header X-Admin-Token phải khớp ADMIN_TOKEN (so sánh hằng thời gian);
+    chưa đặt ADMIN_TOKEN thì chỉ cho phép client loopback (127.0.0.1, ::1)
+    """
+    if not ADMIN_TOKEN:
+        return _is_loopback(remote_addr)
+    return hmac.compare_digest((token or "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def _request_path(target, profiles_dir):
+    return os.path.join(profiles_dir, f"{target}.request.json")
+
+
+def request_profile(target, seconds=10, mode="sample", profiles_dir=PROFILES_DIR):
+    """Server: yêu cầu process target profile trong seconds giây, trả về id kết quả"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if not _TARGET_RE.match(target):
+        raise ValueError("invalid target")
+    seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+    os.makedirs(profiles_dir, exist_ok=True)
+    profile_id = uuid.uuid4().hex[:12]
+    path = _request_path(target, profiles_dir)
+    tmp = f"{path}.{profile_id}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"id": profile_id, "seconds": seconds, "mode": mode, "requested": time.time()}, f)
+    os.replace(tmp, path)
+    return profile_id
+
+
+def wait_result(profile_id, target, timeout, profiles_dir=PROFILES_DIR):
+    """Chờ process ghi kết quả; hết timeout (process không chạy / không nhận) thì huỷ yêu cầu, trả về None"""
+    path = os.path.join(profiles_dir, f"{profile_id}.json")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.path.exists(path):
+            return load_result(profile_id, profiles_dir)
+        time.sleep(0.2)
+    try:
+        with open(_request_path(target, profiles_dir), "r", encoding="utf-8") as f:
+            pending = json.load(f)
+        if pending.get("id") == profile_id:
+            os.remove(_request_path(target, profiles_dir))
+    except (OSError, ValueError):
+        pass
+    return load_result(profile_id, profiles_dir)
+
+
+def run_profile(target, params, profiles_dir=PROFILES_DIR):
+    """
+    Dùng chung cho các endpoint admin: ?seconds=10&mode=sample|cprofile → (body, status).
+    Block đến khi process ghi xong kết quả (seconds + vài giây), chạy trên thread của request.
+    """
+    try:
+        seconds = float(params.get("seconds", 10))
+        profile_id = request_profile(target, seconds, params.get("mode", "sample"), profiles_dir)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    result = wait_result(profile_id, target, min(seconds, MAX_SECONDS) + 2 * CHECK_INTERVAL + 5, profiles_dir)
+    if result is None:
+        return {"error": f"No running loop picked up the request for {target}"}, 504
+    result["artifact_url"] = f"/api/admin/profiles/{profile_id}/artifact"
+    return result, 200
+
+
+def load_result(profile_id, profiles_dir=PROFILES_DIR):
+    if not _ID_RE.match(profile_id or ""):
+        return None
+    try:
+        with open(os.path.join(profiles_dir, f"{profile_id}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def artifact_path(profile_id, profiles_dir=PROFILES_DIR):
+    """File .collapsed / .pstats của 1 lần profile (None nếu id sai hoặc chưa có)"""
+    result = load_result(profile_id, profiles_dir)
+    if not result or not result.get("artifact"):
+        return None
+    path = os.path.join(profiles_dir, result["artifact"])
+    return path if os.path.exists(path) else None
+
+
+class _SessionStage:
+    __slots__ = ("session", "name", "t0")
+
+    def __init__(self, session, name):
+        self.session = session
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.session.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class _BothStage:
+    """Đo cho timer gốc (metrics/bench) và cho phiên profile cùng lúc"""
+    __slots__ = ("base", "extra")
+
+    def __init__(self, base, extra):
+        self.base = base
+        self.extra = extra
+
+    def __enter__(self):
+        self.base.__enter__()
+        self.extra.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.extra.__exit__(*exc)
+        self.base.__exit__(*exc)
+        return False
+
+
+class _ProfiledTimer:
+    """Timer bọc: khi không profile chỉ thêm 1 lần kiểm tra thuộc tính mỗi stage"""
+    def __init__(self, control, base):
+        self.control = control
+        self.base = base
+
+    def stage(self, name):
+        session = self.control.session
+        if session is None:
+            return self.base.stage(name)
+        return _BothStage(self.base.stage(name), _SessionStage(session, name))
+
+    def add(self, name, seconds):
+        self.base.add(name, seconds)
+        if self.control.session is not None:
+            self.control.session.add(name, seconds)
+
+    def summary(self):
+        return self.base.summary()
+
+
+class _Sampler(threading.Thread):
+    """Lấy mẫu stack của 1 thread (sys._current_frames) → đếm collapsed stack"""
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+    def top_functions(self, n=TOP_N):
+        """Hàm ở đỉnh stack (self time) nhiều nhất"""
+        leaf = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = max(1, self.samples)
+        return [{"function": fn, "samples": c, "pct": round(c * 100.0 / total, 1)} for fn, c in leaf.most_common(n)]
+
+
+class _Session:
+    def __init__(self, request, target):
+        self.id = request["id"]
+        self.mode = request["mode"]
+        self.seconds = float(request["seconds"])
+        self.target = target
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.deadline = self.t0 + self.seconds
+        self.timer = StageTimer()
+        self.frames = []
+        self.frame_count = 0
+        self.frame_times = []
+        self.current = {}
+        self.frame_t0 = None
+        self.profiler = None
+        self.sampler = None
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = _Sampler(threading.get_ident())
+            self.sampler.start()
+
+    def add(self, name, seconds):
+        self.timer.add(name, seconds)
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def frame_boundary(self, now):
+        """Gọi đầu mỗi frame: chốt breakdown của frame trước"""
+        if self.frame_t0 is not None:
+            wall = now - self.frame_t0
+            self.frame_count += 1
+            self.frame_times.append(wall)
+            if len(self.frames) < MAX_FRAMES:
+                self.frames.append({
+                    "frame": self.frame_count,
+                    "wall_ms": round(wall * 1000, 3),
+                    "stages": {k: round(v * 1000, 3) for k, v in self.current.items()},
+                })
+        self.current = {}
+        self.frame_t0 = now
+
+    def finish(self, profiles_dir):
+        duration = time.perf_counter() - self.t0
+        result = {
+            "id": self.id,
+            "target": self.target,
+            "pid": os.getpid(),
+            "mode": self.mode,
+            "seconds": self.seconds,
+            "started": self.started,
+            "duration": round(duration, 3),
+            "frames": self.frame_count,
+            "fps": round(self.frame_count / duration, 2) if duration > 0 else 0.0,
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            artifact = f"{self.id}.pstats"
+            self.profiler.dump_stats(os.path.join(profiles_dir, artifact))
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(TOP_N)
+            result["top"] = out.getvalue().splitlines()
+        else:
+            self.sampler.stop()
+            artifact = f"{self.id}.collapsed"
+            with open(os.path.join(profiles_dir, artifact), "w", encoding="utf-8") as f:
+                for stack, count in self.sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            result["samples"] = self.sampler.samples
+            result["top"] = self.sampler.top_functions()
+        result["artifact"] = artifact
+
+        # Tỉ lệ từng stage trên tổng wall time các frame (phần còn lại = ngoài các stage đã đo)
+        wall_total = sum(self.frame_times)
+        stages = self.timer.summary()
+        for item in stages.values():
+            item["share_pct"] = round(item["total_ms"] / 10.0 / wall_total, 1) if wall_total > 0 else 0.0
+        result["stages"] = stages
+        times = sorted(self.frame_times)
+        if times:
+            result["frame_ms"] = {
+                "mean": round(wall_total * 1000 / len(times), 3),
+                "p50": round(times[len(times) // 2] * 1000, 3),
+                "p95": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+                "max": round(times[-1] * 1000, 3),
+            }
+        result["per_frame"] = self.frames
+        path = os.path.join(profiles_dir, f"{self.id}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(path + ".tmp", path)
+        print(f"[PROFILE] {self.target}: {self.mode} {duration:.1f}s, {self.frame_count} frames → {artifact}")
+        return result
+
+
+class ProfileControl:
+    """Phía vòng xử lý: nhận yêu cầu profile của target, chạy phiên profile rồi ghi kết quả"""
+    def __init__(self, target, profiles_dir=PROFILES_DIR):
+        self.target = target
+        self.profiles_dir = profiles_dir
+        self.path = _request_path(target, profiles_dir)
+        self.session = None
+        self._next_check = 0.0
+
+    def wrap(self, timer):
+        return _ProfiledTimer(self, timer)
+
+    def poll(self):
+        """Gọi đầu mỗi frame trên thread xử lý"""
+        now = time.perf_counter()
+        session = self.session
+        if session is not None:
+            session.frame_boundary(now)
+            if now >= session.deadline:
+                self._finish()
+            return
+        if now < self._next_check:
+            return
+        self._next_check = now + CHECK_INTERVAL
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                request = json.load(f)
+            os.remove(self.path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[PROFILE] Bad request {self.path}: {e}")
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+        if request.get("mode") not in MODES or not _ID_RE.match(str(request.get("id", ""))):
+            return
+        print(f"[PROFILE] {self.target}: start {request['mode']} for {request['seconds']}s")
+        self.session = _Session(request, self.target)
+        self.session.frame_boundary(time.perf_counter())
+
+    def _finish(self):
+        session, self.session = self.session, None
+        try:
+            session.finish(self.profiles_dir)
+        except Exception as e:
+            print(f"[PROFILE] {self.target}: failed to write result: {e}")
+
+    def close(self):
+        """Vòng lặp kết thúc giữa phiên profile: ghi kết quả với số frame đã có"""
+        if self.session is not None:
+            self._finish()
@@ -0,0 +1,188 @@
+"""
+Re-identification nhẹ chống đếm lại sau khi ByteTrack đổi ID (bị che khuất, mất track rồi tạo ID mới).
+
+- Chữ ký ngoại hình: histogram HSV (H_BINS x S_BINS) của vùng thân (bỏ đầu/chân, thu nhỏ crop về
+  CROP_SIZE trước) tính vector hoá bằng np.bincount, chuẩn hoá sqrt + L2 → tích vô hướng giữa
+  2 chữ ký = hệ số Bhattacharyya (1 = giống hệt)
+- Gallery LRU cố định GALLERY_SIZE chữ ký của người đã được đếm (mảng numpy, không dict theo track);
+  tra cứu = 1 phép nhân ma trận + lọc theo tuổi (MAX_AGE giây), khoảng cách vị trí (MAX_JUMP x đường chéo
+  frame) và track còn đang hiện (không thể là ID mới của người đang thấy)
+- Chỉ track MỚI xuất hiện gần line (NEAR_LINE px) mới tra gallery; khớp → ID mới thừa hưởng trạng thái
+  đã đếm (PeopleCounter.mark_counted), không cộng số đếm
+- Ngân sách mỗi frame: tối đa MAX_SIGNATURES chữ ký (tính khi đếm + tra cứu), phần vượt bỏ qua
+
+    reid = ReIdCache(counter)
+    reid.begin(frame, t, active_ids)            # mỗi frame trước vòng đếm
+    reid.match_new(track_id, l, t, r, b)        # trước counter.update
+    counted = counter.update(...)
+    if counted: reid.remember(track_id, l, t, r, b, counted)
+    reid.end(boxes)                             # cập nhật vị trí / thời điểm thấy của người đã đếm
+"""
+import os
+
+import cv2
+import numpy as np
+
+from src.metrics import REID_MATCHES
+
+ENABLED = os.environ.get("REID_ENABLED", "1") == "1"
+H_BINS, S_BINS = 16, 4
+CROP_SIZE = (16, 32)          # (w, h) crop thân sau khi thu nhỏ
+GALLERY_SIZE = int(os.environ.get("REID_GALLERY_SIZE", "64"))
+THRESHOLD = float(os.environ.get("REID_THRESHOLD", "0.9"))
+MAX_AGE = 10.0                # giây, chữ ký cũ hơn không dùng để ghép
+MAX_JUMP = 0.25               # tỉ lệ đường chéo frame: ID mới phải xuất hiện gần chỗ người cũ
+NEAR_LINE = 120               # px, chỉ tra gallery cho track mới gần line
+MAX_SIGNATURES = 6            # chữ ký tối đa mỗi frame
+MIN_SATURATION = 40           # pixel xám (nền, bóng) không tính vào histogram
+
+_KINDS = {"in": 1, "out": -1}
+_NAMES = {1: "in", -1: "out"}
+
+
+def signature(frame, l, t, r, b):
+    """Chữ ký HSV (vector float32 đã chuẩn hoá) của vùng thân trong box, None nếu box quá nhỏ"""
+    h, w = frame.shape[:2]
+    bh = b - t
+    # Thân người: bỏ ~15% trên (đầu) và ~40% dưới (chân, sàn)
+    y1, y2 = max(0, int(t + 0.15 * bh)), min(h, int(t + 0.6 * bh))
+    x1, x2 = max(0, int(l)), min(w, int(r))
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    crop = cv2.resize(frame[y1:y2, x1:x2], CROP_SIZE, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+    hsv = hsv[hsv[:, 1] >= MIN_SATURATION]
+    if hsv.shape[0] < 8:
+        return None
+    bins = (hsv[:, 0].astype(np.intp) * H_BINS // 180) * S_BINS + hsv[:, 1].astype(np.intp) * S_BINS // 256
+    hist = np.sqrt(np.bincount(bins, minlength=H_BINS * S_BINS).astype(np.float32))
+    return hist / np.linalg.norm(hist)
+
+
+class AppearanceGallery:
+    """Gallery LRU kích thước cố định: chữ ký + trạng thái đếm + vị trí + thời điểm dùng gần nhất"""
+    def __init__(self, size=GALLERY_SIZE, dim=H_BINS * S_BINS):
+        self.signatures = np.zeros((size, dim), dtype=np.float32)
+        self.track_ids = np.full(size, -1, dtype=np.int64)
+        self.kinds = np.zeros(size, dtype=np.int8)         # 1 = in, -1 = out, 0 = trống
+        self.positions = np.zeros((size, 2), dtype=np.float32)
+        self.stamps = np.full(size, -np.inf)
+
+    def put(self, track_id, sig, kind, pos, t, slot=None):
+        """Thêm/cập nhật chữ ký của track_id (hoặc ghi đè slot); gallery đầy thì thay mục dùng lâu nhất"""
+        if slot is None:
+            hit = np.flatnonzero(self.track_ids == track_id)
+            slot = hit[0] if hit.size else int(np.argmin(self.stamps))
+        self.signatures[slot] = sig
+        self.track_ids[slot] = track_id
+        self.kinds[slot] = _KINDS[kind]
+        self.positions[slot] = pos
+        self.stamps[slot] = t
+
+    def match(self, sig, pos, t, max_age, max_dist, threshold, exclude=()):
+        """Slot khớp nhất (similarity >= threshold, còn hạn, gần vị trí) hoặc None"""
+        valid = (self.kinds != 0) & (t - self.stamps <= max_age)
+        valid &= np.hypot(*(self.positions - pos).T) <= max_dist
+        if len(exclude):
+            valid &= ~np.isin(self.track_ids, exclude)
+        if not valid.any():
+            return None
+        scores = np.where(valid, self.signatures @ sig, -1.0)
+        slot = int(np.argmax(scores))
+        return slot if scores[slot] >= threshold else None
+
+    def clear(self):
+        self.kinds[:] = 0
+        self.track_ids[:] = -1
+        self.stamps[:] = -np.inf
+
+
+class ReIdCache:
+    def __init__(self, counter, enabled=ENABLED, threshold=THRESHOLD, max_age=MAX_AGE, near_line=NEAR_LINE,
+                 budget=MAX_SIGNATURES, stream=None):
+        self.counter = counter
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_age = max_age
+        self.near_line = near_line
+        self.budget = budget
+        self.stream = stream  # label people_reid_matches_total của /metrics
+        self.gallery = AppearanceGallery()
+        self.max_dist = MAX_JUMP * float(np.hypot(counter.frame_width, counter.frame_height))
+        self.matches = 0
+        self.skipped = 0   # chữ ký bỏ qua vì hết ngân sách frame
+        self._frame = None
+        self._t = 0.0
+        self._active = np.empty(0, dtype=np.int64)
+        self._left = 0
+
+    def begin(self, frame, t, active_ids):
+        """Bắt đầu frame mới: frame gốc (chưa vẽ overlay), thời điểm t (giây), id track đang hiện"""
+        self._frame = frame
+        self._t = t
+        self._active = np.fromiter(active_ids, dtype=np.int64)
+        self._left = self.budget
+
+    def _signature(self, l, t, r, b):
+        if self._left <= 0:
+            self.skipped += 1
+            return None
+        self._left -= 1
+        return signature(self._frame, l, t, r, b)
+
+    def match_new(self, track_id, l, t, r, b):
+        """
+        Track mới (counter chưa thấy) gần line: ghép với người đã đếm trong gallery.
+        Khớp → ID mới thừa hưởng trạng thái đếm, trả về track_id cũ; không khớp → None.
+        """
+        if not self.enabled or self._frame is None or track_id in self.counter.direction_state:
+            return None
+        cx, cy = (l + r) / 2, (t + b) / 2
+        if self.counter._get_distance_to_line(cx, cy) > self.near_line:
+            return None
+        sig = self._signature(l, t, r, b)
+        if sig is None:
+            return None
+        pos = np.array((cx, cy), dtype=np.float32)
+        slot = self.gallery.match(sig, pos, self._t, self.max_age, self.max_dist, self.threshold, self._active)
+        if slot is None:
+            return None
+        old_id = int(self.gallery.track_ids[slot])
+        kind = _NAMES[int(self.gallery.kinds[slot])]
+        self.counter.mark_counted(track_id, kind)
+        # Mục gallery chuyển sang ID mới: người đổi ID nhiều lần vẫn ghép được
+        self.gallery.put(track_id, sig, kind, pos, self._t, slot=slot)
+        self.matches += 1
+        if self.stream is not None:
+            REID_MATCHES.inc(stream=self.stream)
+        if self.counter.verbose:
+            print(f"[REID] Track {track_id} matches counted track {old_id} ({kind}), not counting again")
+        return old_id
+
+    def remember(self, track_id, l, t, r, b, kind):
+        """Lưu chữ ký của track vừa được đếm (kind = "in" | "out")"""
+        if not self.enabled or self._frame is None:
+            return
+        sig = self._signature(l, t, r, b)
+        if sig is not None:
+            self.gallery.put(track_id, sig, kind, np.array(((l + r) / 2, (t + b) / 2), dtype=np.float32), self._t)
+
+    def end(self, boxes):
+        """Sau vòng đếm: mục gallery của track còn hiện lấy vị trí mới + tính tuổi từ lần thấy cuối"""
+        if not self.enabled or not boxes:
+            return
+        arr = np.asarray(boxes, dtype=np.float64)
+        ids = arr[:, 0].astype(np.int64)
+        slots = np.flatnonzero(np.isin(self.gallery.track_ids, ids))
+        if not slots.size:
+            return
+        order = np.argsort(ids)
+        rows = order[np.searchsorted(ids, self.gallery.track_ids[slots], sorter=order)]
+        self.gallery.positions[slots, 0] = (arr[rows, 1] + arr[rows, 3]) / 2
+        self.gallery.positions[slots, 1] = (arr[rows, 2] + arr[rows, 4]) / 2
+        self.gallery.stamps[slots] = self._t
+
+    def reset(self):
+        self.gallery.clear()
+        self.matches = 0
+        self.skipped = 0
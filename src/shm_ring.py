@@ -0,0 +1,262 @@
+"""
+Ring buffer shared-memory giữa process webcam (writer) và process server (reader).
+
+Layout:
+    header  : magic, n_slots, slot_size, write_seq, stats_seq, stats_len, heartbeat
+    demand  : timestamp + số client theo tier (reader ghi, writer đọc để chỉ encode tier cần)
+    slots   : n_slots x (seq, length, tier)  - seq = 0 khi slot đang được ghi (seqlock)
+    stats   : STATS_SIZE bytes JSON (stats đếm + overlay client-side nếu có)
+    data    : n_slots x slot_size bytes JPEG
+
+Wakeup: writer gõ 1 byte vào FIFO "doorbell" mỗi frame, reader select() trên FIFO.
+Trên nền tảng không có mkfifo (Windows) reader tự poll header với chu kỳ ngắn.
+"""
+import json
+import os
+import select
+import struct
+import tempfile
+import time
+from multiprocessing import shared_memory
+
+MAGIC = b"TPR1"
+DEFAULT_NAME = "track_people_ring"
+DEFAULT_SLOTS = 8
+MAX_TIERS = 4
+DEFAULT_SLOT_SIZE = 2 * 1024 * 1024
+STATS_SIZE = 16 * 1024
+
+_HEADER = struct.Struct("<4sIIQQId")   # magic, n_slots, slot_size, write_seq, stats_seq, stats_len, heartbeat
+_DEMAND = struct.Struct("<d4I")        # timestamp, số client của tối đa MAX_TIERS tier
+_SLOT = struct.Struct("<QIB3x")        # seq, length, tier
+_DEMAND_OFF = _HEADER.size
+_HEADER_SIZE = 64
+
+
+def _doorbell_path(name):
+    return os.path.join(tempfile.gettempdir(), f"{name}.doorbell")
+
+
+class SharedFrameRing:
+    def __init__(self, shm, name, n_slots, slot_size, owner):
+        self.shm = shm
+        self.name = name
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self.owner = owner
+        self.buf = shm.buf
+        self._slots_off = _HEADER_SIZE
+        self._stats_off = self._slots_off + n_slots * _SLOT.size
+        self._data_off = self._stats_off + STATS_SIZE
+        self._write_seq = 0
+        self._stats_seq = 0
+        self._doorbell_fd = None
+        self._warned_oversize = False
+
+    @staticmethod
+    def _total_size(n_slots, slot_size):
+        return _HEADER_SIZE + n_slots * _SLOT.size + STATS_SIZE + n_slots * slot_size
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, n_slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE):
+        """Tạo ring mới (writer). Segment cũ cùng tên (writer trước bị crash) sẽ bị thay thế."""
+        size = cls._total_size(n_slots, slot_size)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ring = cls(shm, name, n_slots, slot_size, owner=True)
+        shm.buf[:ring._data_off] = bytes(ring._data_off)
+        _HEADER.pack_into(shm.buf, 0, MAGIC, n_slots, slot_size, 0, 0, 0, time.time())
+        ring._open_doorbell_writer()
+        return ring
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """Gắn vào ring đã có (reader). Trả về None nếu writer chưa chạy."""
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        _untrack(shm)
+        magic, n_slots, slot_size = _HEADER.unpack_from(shm.buf, 0)[:3]
+        if magic != MAGIC:
+            shm.close()
+            return None
+        ring = cls(shm, name, n_slots, slot_size, owner=False)
+        ring._open_doorbell_reader()
+        return ring
+
+    # --- doorbell (FIFO) ---
+    def _open_doorbell_writer(self):
+        if not hasattr(os, "mkfifo"):
+            return
+        path = _doorbell_path(self.name)
+        try:
+            if not os.path.exists(path):
+                os.mkfifo(path)
+            # O_RDWR: không block và không lỗi ENXIO khi chưa có reader
+            self._doorbell_fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            self._doorbell_fd = None
+
+    def _open_doorbell_reader(self):
+        if not hasattr(os, "mkfifo"):
+            return
+        try:
+            self._doorbell_fd = os.open(_doorbell_path(self.name), os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            self._doorbell_fd = None
+
+    def _ring_doorbell(self):
+        if self._doorbell_fd is None:
+            return
+        try:
+            os.write(self._doorbell_fd, b"\x01")
+        except (BlockingIOError, OSError):
+            pass  # FIFO đầy = reader đã có sẵn tín hiệu chưa đọc
+
+    def wait(self, timeout):
+        """Reader: chờ writer báo có dữ liệu mới (hoặc hết timeout)"""
+        if self._doorbell_fd is None:
+            time.sleep(min(timeout, 0.005))
+            return
+        try:
+            ready, _, _ = select.select([self._doorbell_fd], [], [], timeout)
+            if ready:
+                os.read(self._doorbell_fd, 4096)
+        except OSError:
+            time.sleep(min(timeout, 0.005))
+
+    # --- writer ---
+    def write_frame(self, data, tier=0):
+        """Ghi 1 frame đã encode (bytes hoặc numpy buffer từ cv2.imencode, không copy trung gian)"""
+        data = memoryview(data).cast("B")
+        n = len(data)
+        if n > self.slot_size:
+            if not self._warned_oversize:
+                print(f"[SHM] Frame {n} bytes > slot {self.slot_size} bytes, skipping")
+                self._warned_oversize = True
+            return False
+        seq = self._write_seq + 1
+        slot = seq % self.n_slots
+        slot_off = self._slots_off + slot * _SLOT.size
+        data_off = self._data_off + slot * self.slot_size
+        _SLOT.pack_into(self.buf, slot_off, 0, 0, tier)   # đánh dấu đang ghi
+        self.buf[data_off:data_off + n] = data
+        _SLOT.pack_into(self.buf, slot_off, seq, n, tier)
+        self._write_seq = seq
+        self._write_header()
+        self._ring_doorbell()
+        return True
+
+    def write_stats(self, stats):
+        """Ghi stats JSON; False (không ghi) nếu vượt STATS_SIZE thay vì để reader nhận JSON bị cắt"""
+        data = json.dumps(stats, ensure_ascii=False).encode("utf-8")
+        if len(data) > STATS_SIZE:
+            return False
+        self._stats_seq += 1
+        # stats_seq = 0 trong lúc ghi để reader bỏ qua bản đọc dở
+        _HEADER.pack_into(self.buf, 0, MAGIC, self.n_slots, self.slot_size, self._write_seq, 0, 0, time.time())
+        self.buf[self._stats_off:self._stats_off + len(data)] = data
+        _HEADER.pack_into(self.buf, 0, MAGIC, self.n_slots, self.slot_size, self._write_seq,
+                          self._stats_seq, len(data), time.time())
+        self._ring_doorbell()
+        return True
+
+    def _write_header(self):
+        _, _, _, _, stats_seq, stats_len, _ = _HEADER.unpack_from(self.buf, 0)
+        _HEADER.pack_into(self.buf, 0, MAGIC, self.n_slots, self.slot_size, self._write_seq,
+                          stats_seq, stats_len, time.time())
+
+    # --- reader ---
+    def header(self):
+        _, _, _, write_seq, stats_seq, stats_len, heartbeat = _HEADER.unpack_from(self.buf, 0)
+        return write_seq, stats_seq, stats_len, heartbeat
+
+    def is_alive(self, max_age=2.0):
+        """Writer còn sống nếu heartbeat được cập nhật gần đây"""
+        return (time.time() - self.header()[3]) <= max_age
+
+    def read_frames(self, last_seq):
+        """
+        Trả về (seq, {tier: data}) gồm frame mới nhất của mỗi tier được ghi sau last_seq.
+        Đọc trực tiếp từ shared memory, chỉ copy 1 lần ra bytes cho toàn bộ subscriber.
+        """
+        write_seq = self.header()[0]
+        if write_seq == 0 or write_seq == last_seq:
+            return last_seq, {}
+        if write_seq < last_seq:
+            last_seq = 0  # writer khởi động lại
+        frames = {}
+        first = max(last_seq + 1, write_seq - self.n_slots + 1)
+        for seq in range(write_seq, first - 1, -1):
+            slot = seq % self.n_slots
+            slot_off = self._slots_off + slot * _SLOT.size
+            seq1, n, tier = _SLOT.unpack_from(self.buf, slot_off)
+            if seq1 != seq or n > self.slot_size or tier in frames:
+                continue
+            data_off = self._data_off + slot * self.slot_size
+            data = bytes(self.buf[data_off:data_off + n])
+            if _SLOT.unpack_from(self.buf, slot_off)[0] != seq1:
+                continue  # slot bị ghi đè trong lúc đọc
+            frames[tier] = data
+        return write_seq, frames
+
+    # --- demand (reader → writer) ---
+    def write_demand(self, counts):
+        """Reader: ghi số client đang xem theo tier (list theo index tier)"""
+        counts = (list(counts) + [0] * MAX_TIERS)[:MAX_TIERS]
+        _DEMAND.pack_into(self.buf, _DEMAND_OFF, time.time(), *counts)
+
+    def read_demand(self, max_age=2.0):
+        """Writer: số client theo tier; [0, ...] nếu reader không cập nhật trong max_age giây"""
+        ts, *counts = _DEMAND.unpack_from(self.buf, _DEMAND_OFF)
+        if time.time() - ts > max_age:
+            return [0] * MAX_TIERS
+        return counts
+
+    def read_stats(self, last_seq):
+        _, stats_seq, stats_len, _ = self.header()
+        if stats_seq == 0 or stats_seq == last_seq:
+            return last_seq, None
+        data = bytes(self.buf[self._stats_off:self._stats_off + stats_len])
+        if self.header()[1] != stats_seq:
+            return last_seq, None
+        try:
+            return stats_seq, json.loads(data.decode("utf-8"))
+        except Exception:
+            return last_seq, None
+
+    def close(self):
+        if self._doorbell_fd is not None:
+            try:
+                os.close(self._doorbell_fd)
+            except OSError:
+                pass
+            self._doorbell_fd = None
+        self.buf = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except Exception:
+                pass
+
+
+def _untrack(shm):
+    """
+    Reader không sở hữu segment: bỏ đăng ký khỏi resource_tracker để khi reader thoát
+    segment của writer không bị unlink theo (hành vi mặc định của Python < 3.13).
+    """
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
@@ -0,0 +1,239 @@
+"""
+Supervisor nhiều nguồn realtime: mỗi nguồn (camera, file video, file lặp giả lập stream) chạy trong
+1 worker process riêng, gắn vào 1 nhóm CPU cố định.
+
+Config JSON (python realtime.py --sources sources.json):
+    {
+      "cpus_per_source": 2,                       # tuỳ chọn, mặc định chia đều CPU cho các nguồn
+      "sources": [
+        {"id": "cam0", "source": 0},
+        {"id": "lobby", "source": "videos/lobby.mp4", "loop": true, "line_x": 400},
+        {"id": "gate", "source": "rtsp://...", "cpus": [6, 7]}
+      ]
+    }
+Mỗi nguồn nhận các khoá giống tham số CLI webcam (line_x, flip, width, height, overlay, write_every, hls).
+
+- Worker tự mở lại capture khi mất tín hiệu (backoff trong process, không phải load lại model)
+- Worker chết → supervisor tạo lại với backoff 1s, 2s, 4s... tối đa 60s; chạy ổn định 30s thì reset backoff
+- Nguồn file không lặp chạy hết → trạng thái "done", không khởi động lại
+- Health (fps, độ trễ capture → đếm, frame bị bỏ, số frame, IN/OUT, số lần reconnect) gom về realtime/sources.json
+- Frame/stats mỗi nguồn đi qua shm ring "<shm_name>_<id>", history ghi với stream=<id>
+"""
+import json
+import multiprocessing as mp
+import os
+import queue
+import signal
+import tempfile
+import time
+
+from src.cpu_budget import available_cpus, configure_cpu_budget
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES_JSON = os.path.join(BASE_DIR, "realtime", "sources.json")
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+STABLE_AFTER = 30.0   # giây chạy liên tục thì coi worker ổn định, reset backoff
+STALE_AFTER = 5.0     # không nhận health quá lâu → "stalled"
+EXIT_DONE = 0         # file không lặp đã chạy hết
+EXIT_OPEN_FAILED = 2  # không mở được nguồn
+
+
+def is_file_source(source):
+    """File video trên đĩa (hết là hết), khác với camera index và URL stream (rtsp://, http://)"""
+    return isinstance(source, str) and "://" not in source
+
+
+def load_sources(path):
+    """Đọc config, trả về (sources, cpus_per_source). ValueError nếu config sai."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    sources = config.get("sources") if isinstance(config, dict) else config
+    if not sources:
+        raise ValueError("Config has no sources")
+    seen = set()
+    for i, src in enumerate(sources):
+        if "source" not in src:
+            raise ValueError(f"Source #{i} has no 'source'")
+        src.setdefault("id", f"src{i}")
+        if src["id"] in seen:
+            raise ValueError(f"Duplicate source id {src['id']!r}")
+        seen.add(src["id"])
+    cpus = config.get("cpus_per_source") if isinstance(config, dict) else None
+    return sources, cpus
+
+
+def assign_cpus(sources, cpus_per_source=None):
+    """
+    Chia CPU cho các nguồn: nguồn có "cpus" giữ nguyên, còn lại chia đều (hoặc cpus_per_source mỗi nguồn)
+    trên các CPU mà process được phép chạy. Trả về {id: [cpu, ...]}.
+    """
+    available = available_cpus()
+    reserved = {c for s in sources for c in s.get("cpus", [])}
+    free = [c for c in available if c not in reserved] or available
+    auto = [s for s in sources if not s.get("cpus")]
+    per = cpus_per_source or max(1, len(free) // max(1, len(auto)))
+    out = {}
+    pos = 0
+    for s in sources:
+        if s.get("cpus"):
+            out[s["id"]] = list(s["cpus"])
+            continue
+        out[s["id"]] = [free[(pos + k) % len(free)] for k in range(min(per, len(free)))]
+        pos += per
+    return out
+
+
+def _raise_interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def _source_main(spec, cpus, shm_name, health_q):
+    """Entry của worker process: chạy vòng lặp webcam của realtime.py cho 1 nguồn"""
+    # terminate() từ supervisor → thoát qua finally của run_webcam (đóng ring, capture)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    configure_cpu_budget(len(cpus), cpus, label="SUPERVISOR")
+    import realtime
+
+    def report(health):
+        health["id"] = spec["id"]
+        try:
+            health_q.put_nowait(health)
+        except Exception:
+            pass
+
+    args = realtime.source_args(spec, shm_name)
+    try:
+        ok = realtime.run_webcam(args, report=report)
+    except KeyboardInterrupt:
+        ok = True
+    raise SystemExit(EXIT_DONE if ok else EXIT_OPEN_FAILED)
+
+
+def _atomic_write_json(path, obj):
+    fd, tmp = tempfile.mkstemp(prefix="tmp_", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class Supervisor:
+    def __init__(self, sources, shm_name="track_people_ring", cpus_per_source=None, status_path=SOURCES_JSON):
+        self.sources = sources
+        self.shm_name = shm_name
+        self.status_path = status_path
+        self.cpus = assign_cpus(sources, cpus_per_source)
+        self._ctx = mp.get_context("spawn")
+        self.health_q = self._ctx.Queue()
+        self.workers = {
+            s["id"]: {"spec": s, "proc": None, "state": "starting", "restarts": 0, "backoff": BACKOFF_MIN,
+                      "next_start": 0.0, "started": 0.0, "health": {}, "last_health": 0.0, "exit_code": None}
+            for s in sources
+        }
+
+    def _start(self, w):
+        spec = w["spec"]
+        w["proc"] = self._ctx.Process(target=_source_main, name=f"source-{spec['id']}", daemon=True,
+                                      args=(spec, self.cpus[spec["id"]], self.shm_name, self.health_q))
+        w["proc"].start()
+        w["state"] = "starting"
+        w["started"] = time.time()
+        w["last_health"] = w["started"]
+        print(f"[SUPERVISOR] {spec['id']}: started pid {w['proc'].pid} on CPUs {self.cpus[spec['id']]}")
+
+    def _check(self, now):
+        for sid, w in self.workers.items():
+            proc = w["proc"]
+            if w["state"] == "done":
+                continue
+            if proc is None:
+                if now >= w["next_start"]:
+                    self._start(w)
+                continue
+            if proc.is_alive():
+                if now - w["started"] > STABLE_AFTER:
+                    w["backoff"] = BACKOFF_MIN
+                if now - w["last_health"] > STALE_AFTER and w["state"] == "running":
+                    w["state"] = "stalled"
+                continue
+            w["exit_code"] = proc.exitcode
+            w["proc"] = None
+            if proc.exitcode == EXIT_DONE and not w["spec"].get("loop") and is_file_source(w["spec"]["source"]):
+                w["state"] = "done"
+                print(f"[SUPERVISOR] {sid}: finished")
+                continue
+            # Chết bất thường / không mở được nguồn → chờ backoff rồi tạo lại
+            w["state"] = "backoff"
+            w["restarts"] += 1
+            w["next_start"] = now + w["backoff"]
+            print(f"[SUPERVISOR] {sid}: exited with code {proc.exitcode}, restarting in {w['backoff']:.0f}s")
+            w["backoff"] = min(BACKOFF_MAX, w["backoff"] * 2)
+
+    def status(self):
+        now = time.time()
+        out = {"t": round(now, 2), "sources": []}
+        for sid, w in self.workers.items():
+            item = {
+                "id": sid,
+                "source": w["spec"]["source"],
+                "state": w["state"],
+                "pid": w["proc"].pid if w["proc"] is not None else None,
+                "cpus": self.cpus[sid],
+                "restarts": w["restarts"],
+                "exit_code": w["exit_code"],
+                "ring": f"{self.shm_name}_{sid}",
+                "health_age": round(now - w["last_health"], 1) if w["last_health"] else None,
+            }
+            item.update({k: v for k, v in w["health"].items() if k not in ("id", "state")})
+            if w["state"] == "backoff":
+                item["restart_in"] = round(max(0.0, w["next_start"] - now), 1)
+            out["sources"].append(item)
+        return out
+
+    def _on_health(self, health):
+        w = self.workers.get(health.get("id"))
+        if w is not None and w["proc"] is not None:
+            w["health"] = health
+            w["last_health"] = time.time()
+            w["state"] = health.get("state", "running")
+
+    def run(self, interval=1.0):
+        print(f"[SUPERVISOR] {len(self.workers)} source(s), status → {self.status_path}")
+        next_write = 0.0
+        try:
+            while True:
+                # Chờ tối đa 0.2s cho health đầu tiên rồi lấy hết phần còn lại không chờ: nhiều nguồn báo
+                # liên tục vẫn không chặn được _check (restart worker chết) và việc ghi status
+                try:
+                    self._on_health(self.health_q.get(timeout=0.2))
+                    while True:
+                        self._on_health(self.health_q.get_nowait())
+                except queue.Empty:
+                    pass
+                now = time.time()
+                self._check(now)
+                if now >= next_write:
+                    next_write = now + interval
+                    try:
+                        _atomic_write_json(self.status_path, self.status())
+                    except Exception as e:
+                        print(f"[SUPERVISOR] Cannot write status: {e}")
+        except KeyboardInterrupt:
+            print("\n[SUPERVISOR] Stopping.")
+        finally:
+            for w in self.workers.values():
+                if w["proc"] is not None:
+                    w["proc"].terminate()
+            for w in self.workers.values():
+                if w["proc"] is not None:
+                    w["proc"].join(timeout=5)
+                    w["state"] = "stopped"
+                    w["proc"] = None
+            try:
+                _atomic_write_json(self.status_path, self.status())
+            except Exception:
+                pass
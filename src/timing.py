@@ -0,0 +1,110 @@
+"""
+Đo thời gian từng stage của pipeline (decode, resize, track, count, heatmap, draw, encode, write, pacing),
+cùng tên stage với histogram people_stage_seconds của /metrics (src/metrics.py).
+
+    timer = StageTimer()
+    with timer.stage("decode"):
+        ret, frame = cap.read()
+    timer.summary()  # {"decode": {"count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms"}, ...}
+
+NULL_TIMER không đo gì, chi phí gần như bằng 0 (mặc định của LatestFrameGrabber, _publish_frame);
+process_video / run_webcam mặc định dùng metrics.StageMetrics (src/metrics.py) để stage vào /metrics.
+"""
+import time
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "t0")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class StageTimer:
+    def __init__(self, keep_samples=True):
+        self.keep_samples = keep_samples
+        self.totals = {}
+        self.counts = {}
+        self.samples = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self.keep_samples:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+        self.samples.clear()
+
+    def summary(self):
+        out = {}
+        for name, total in self.totals.items():
+            n = self.counts[name]
+            item = {"count": n, "total_ms": round(total * 1000, 3), "mean_ms": round(total * 1000 / n, 4)}
+            samples = sorted(self.samples.get(name, ()))
+            if samples:
+                item["p50_ms"] = round(samples[len(samples) // 2] * 1000, 4)
+                item["p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4)
+                item["max_ms"] = round(samples[-1] * 1000, 4)
+            out[name] = item
+        return out
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTimer:
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def summary(self):
+        return {}
+
+
+NULL_TIMER = _NullTimer()
+
+
+class FpsMeter:
+    """FPS đo theo cửa sổ interval giây; mỗi vòng xử lý 1 instance (không dùng chung giữa các job)"""
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.t0 = time.time()
+        self.n = 0
+        self.fps = None
+
+    def tick(self):
+        """Đếm 1 frame; True khi vừa tính xong fps của cửa sổ mới"""
+        self.n += 1
+        now = time.time()
+        if now - self.t0 < self.interval:
+            return False
+        self.fps = self.n / (now - self.t0)
+        self.t0, self.n = now, 0
+        return True
@@ -0,0 +1,119 @@
+"""
+Ghi / phát lại output của tracker theo từng frame để chỉnh tham số PeopleCounter mà không chạy lại YOLO.
+
+- TrackRecorder: process_video(..., record_tracks="run.npz") ghi (frame, id, box, conf) mỗi frame đã xử lý
+- File .npz nén gồm các mảng phẳng frame/track_id/ltrb/conf + meta (kích thước frame, line, fps)
+- replay(): đưa track đã ghi qua PeopleCounter, hàng nghìn frame/giây (tools/replay_tracks.py sweep)
+"""
+import json
+
+import numpy as np
+
+from src.counter import PeopleCounter
+
+
+class TrackRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.frames = []
+        self.ids = []
+        self.boxes = []
+        self.confs = []
+
+    def add(self, frame_index, tracks):
+        """Ghi các track đã confirmed của 1 frame (cùng điều kiện process_video dùng để đếm)"""
+        for track in tracks:
+            if not track.is_confirmed():
+                continue
+            self.frames.append(frame_index)
+            self.ids.append(int(track.track_id))
+            self.boxes.append(track.to_ltrb())
+            self.confs.append(float(getattr(track, "conf", 1.0)))
+
+    def save(self, meta):
+        # Toạ độ int16 đủ cho frame ≤ 32767 px (process_video resize về ≤ 1280x720), conf float16.
+        # astype cắt phần thập phân giống map(int, ...) trong process_video
+        np.savez_compressed(
+            self.path,
+            frame=np.asarray(self.frames, dtype=np.int32),
+            track_id=np.asarray(self.ids, dtype=np.int32),
+            ltrb=np.asarray(self.boxes, dtype=np.float32).reshape(-1, 4).astype(np.int16),
+            conf=np.asarray(self.confs, dtype=np.float16),
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        )
+        print(f"[RECORD] {len(self.ids)} track points → {self.path}")
+
+
+class TrackRecording:
+    """Bản ghi đã load; iter_frames() trả về (frame, ids, centers) đã nhóm theo frame"""
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as data:
+            self.frame = data["frame"]
+            self.track_id = data["track_id"]
+            self.ltrb = data["ltrb"].astype(np.int32)
+            self.conf = data["conf"]
+            self.meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+        # Tâm bbox giống process_video: int((l + r) / 2)
+        self.cx = (self.ltrb[:, 0] + self.ltrb[:, 2]) // 2
+        self.cy = (self.ltrb[:, 1] + self.ltrb[:, 3]) // 2
+        # Chia sẵn theo frame (mảng frame đã tăng dần khi ghi)
+        cuts = np.flatnonzero(np.diff(self.frame)) + 1
+        starts = np.concatenate(([0], cuts))
+        ends = np.concatenate((cuts, [len(self.frame)]))
+        self._groups = [
+            (int(self.frame[s]), self.track_id[s:e].tolist(), self.cx[s:e].tolist(), self.cy[s:e].tolist())
+            for s, e in zip(starts, ends) if e > s
+        ]
+
+    def __len__(self):
+        return self.meta.get("frames", len(self._groups))
+
+    def iter_frames(self):
+        return iter(self._groups)
+
+
+class _Tally:
+    """Thay SharedCounter khi replay: chỉ cần add_in/add_out, không lock"""
+    __slots__ = ("in_count", "out_count")
+
+    def __init__(self):
+        self.in_count = 0
+        self.out_count = 0
+
+    def add_in(self):
+        self.in_count += 1
+
+    def add_out(self):
+        self.out_count += 1
+
+
+def make_counter(meta, line=None, debounce_threshold=None, min_distance=None):
+    """
+    PeopleCounter theo cấu hình đã ghi trong meta; line ghi đè vị trí line
+    ({"y": .., "angle": ..} cho đường ngang, {"line_x": ..} cho đường dọc).
+    """
+    w, h = meta["frame_width"], meta["frame_height"]
+    cfg = dict(meta.get("line", {}))
+    cfg.update(line or {})
+    if cfg.get("line_type") == "vertical":
+        counter = PeopleCounter(h // 2, 0, 0, w, w, h, line_type="vertical", line_x=cfg.get("line_x", w // 2))
+    else:
+        counter = PeopleCounter(cfg.get("y", h // 2), cfg.get("angle", 0), cfg.get("x1", 0), cfg.get("x2", w),
+                                w, h, line_type="horizontal")
+    if debounce_threshold is not None:
+        counter.debounce_threshold = debounce_threshold
+    if min_distance is not None:
+        counter.MIN_DISTANCE = min_distance
+    counter.verbose = False
+    return counter
+
+
+def replay(recording, counter):
+    """Chạy lại bản ghi qua counter, trả về (in, out)"""
+    tally = _Tally()
+    update = counter.update
+    for _, ids, xs, ys in recording.iter_frames():
+        for tid, cx, cy in zip(ids, xs, ys):
+            update(tid, cx, cy, tally)
+    return tally.in_count, tally.out_count
@@ -1,6 +1,26 @@
-from ultralytics import YOLO
 import numpy as np
 import os
+import time
+
+MODEL_WEIGHTS = os.environ.get("TRACKER_WEIGHTS", "yolov8n.pt")
+# Kích thước input của YOLO: giảm (480, 416...) để tăng FPS trên CPU, đổi qua env TRACKER_IMGSZ
+IMGSZ = int(os.environ.get("TRACKER_IMGSZ", "640"))
+WARMUP_RUNS = int(os.environ.get("TRACKER_WARMUP_RUNS", "2"))
+
+_models = {}
+
+
+def load_model(weights=MODEL_WEIGHTS):
+    """YOLO model dùng chung trong process: mỗi job mới chỉ tạo PersonTracker, không load lại weights"""
+    model = _models.get(weights)
+    if model is None:
+        from ultralytics import YOLO
+        from src.metrics import MODEL_LOAD_SECONDS
+        t0 = time.perf_counter()
+        model = _models[weights] = YOLO(weights)
+        MODEL_LOAD_SECONDS.observe(time.perf_counter() - t0, model=weights)
+    return model
+
 
 class PersonTracker:
     """
@@ -10,15 +30,18 @@ class PersonTracker:
     - Đông người - xử lý tốt hơn với nhiều đối tượng
     - Giữ ID ổn định hơn qua các frame
     """
-    def __init__(self, roi=None):
+    def __init__(self, roi=None, imgsz=None):
         """
         Args:
             roi: Region of Interest dạng (x1, y1, x2, y2) hoặc None để detect toàn bộ frame
                  Nếu None, sẽ detect toàn bộ frame
+            imgsz: kích thước input YOLO (mặc định IMGSZ)
         """
         # ByteTracker được tích hợp trong YOLO model
         # Sử dụng model nhẹ để tracking
-        self.model = YOLO("yolov8n.pt")
+        # Import khi tạo tracker: module này import được khi không có ultralytics (benchmark dùng tracker giả)
+        self.model = load_model()
+        self.imgsz = imgsz or IMGSZ
         self.track_history = {}  # Lưu lịch sử tracking để giữ ID ổn định
         
         # ROI (Region of Interest) để giảm detect thừa
@@ -49,7 +72,33 @@ class PersonTracker:
     def reset(self):
         """Reset tracker state khi video mới"""
         self.track_history.clear()
+        # Model dùng chung giữa các job: xoá cả track của ByteTrack để ID không nối từ video trước
+        for byte_tracker in getattr(getattr(self.model, "predictor", None), "trackers", None) or []:
+            try:
+                byte_tracker.reset()
+            except AttributeError:
+                pass
         print("[TRACKER] Tracker state reset")
+
+    def warmup(self, runs=WARMUP_RUNS):
+        """
+        Chạy vài lần inference trên frame đen ở imgsz đang dùng (fuse layer, khởi tạo predictor/ByteTrack,
+        cấp phát buffer) để frame đầu của job không phải trả chi phí này. Trả về số giây đã chạy.
+        """
+        from src.metrics import MODEL_WARMUP_SECONDS
+        t0 = time.perf_counter()
+        blank = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        roi, self.roi = self.roi, None
+        try:
+            for _ in range(max(1, runs)):
+                self.update(None, blank)
+        finally:
+            self.roi = roi
+        self.reset()
+        dt = time.perf_counter() - t0
+        MODEL_WARMUP_SECONDS.observe(dt, model=MODEL_WEIGHTS)
+        print(f"[TRACKER] Warm-up {runs} run(s) at imgsz={self.imgsz}: {dt:.2f}s")
+        return dt
         
     def update(self, detections, frame):
         """
@@ -98,7 +147,7 @@ class PersonTracker:
             persist=True,  # Giữ ID qua các frame - QUAN TRỌNG để tránh ID switch
             tracker="bytetrack",  # Sử dụng ByteTracker (tốt hơn DeepSort cho occlusion và đông người)
             verbose=False,  # Không in log
-            imgsz=640,  # Input size (có thể giảm xuống 480 để tăng FPS nếu cần)
+            imgsz=self.imgsz,  # Input size (TRACKER_IMGSZ, giảm xuống 480 để tăng FPS nếu cần)
             half=False,  # Sử dụng FP16 nếu GPU hỗ trợ (có thể set True để tăng tốc)
             device=None,  # Tự động chọn device (CPU/GPU)
         )
@@ -153,6 +202,12 @@ class TrackObject:
         return True
 
 
-tracker = PersonTracker()
+_tracker = None
+
+
 def get_tracker():
-    return tracker
\ No newline at end of file
+    """Tracker dùng chung, chỉ load model ở lần gọi đầu"""
+    global _tracker
+    if _tracker is None:
+        _tracker = PersonTracker()
+    return _tracker
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Vùng đa giác (hàng chờ, quầy, lối vào...): số người đang ở trong vùng và thời gian lưu lại (dwell).
+
+- Cấu hình cùng line đếm: line_config["zones"] (job upload), --zones (webcam), đổi khi đang chạy qua
+  src/live_config.py. Mỗi vùng {"id": "queue", "points": [[x, y], ...]} (toạ độ frame sau resize)
+- Điểm đại diện của track là tâm cạnh dưới box (chân người), không phải tâm box
+- Mỗi frame: 1 lượt ray casting vector hoá cho mọi (vùng, cạnh, track) → ma trận inside (zones x tracks),
+  không lặp Python theo track
+- Trạng thái gọn trong mảng: id track (đã sort), thời điểm vào vùng (zones x tracks, NaN = ngoài vùng),
+  lần cuối thấy track; chỉ giữ track đang ở trong ít nhất 1 vùng. Track mất dấu < LOST_AFTER giây
+  (bị che, ByteTrack mất tạm thời) vẫn tính là ở trong vùng
+- Dwell của các lượt đã rời vùng ghi vào ring buffer DWELL_WINDOW mẫu mỗi vùng → percentile p50/p90/p95
+- Tổng kết đẩy vào SharedCounter (stats["zones"]) khi số người trong vùng đổi hoặc mỗi REPORT_INTERVAL giây
+
+    zones = ZoneTracker(parse_zones(line_config.get("zones")))
+    zones.update(boxes, t)                 # t: giây (thời gian video hoặc thời điểm capture)
+    zones.report(counter_state, t)
+"""
+import json
+import time
+import warnings
+
+import numpy as np
+
+from src.metrics import ZONE_OCCUPANCY
+
+LOST_AFTER = 1.0        # giây không thấy track thì coi như đã rời vùng
+DWELL_WINDOW = 1024     # số lượt dwell gần nhất mỗi vùng dùng để tính percentile
+REPORT_INTERVAL = 1.0
+MAX_ZONES = 16
+MAX_POINTS = 64
+PERCENTILES = (50, 90, 95)
+
+
+def parse_zones(data):
+    """
+    Chuẩn hoá cấu hình vùng: list (hoặc chuỗi JSON) các {"id", "points"}.
+    None/"" → []. ValueError nếu sai định dạng.
+    """
+    if data is None or data == "":
+        return []
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            raise ValueError("zones must be a JSON list")
+    if not isinstance(data, list):
+        raise ValueError("zones must be a list")
+    if len(data) > MAX_ZONES:
+        raise ValueError(f"at most {MAX_ZONES} zones")
+    zones = []
+    for i, zone in enumerate(data):
+        points = zone.get("points") if isinstance(zone, dict) else None
+        if not isinstance(points, list) or not 3 <= len(points) <= MAX_POINTS:
+            raise ValueError(f"zone {i}: points must be a list of 3..{MAX_POINTS} [x, y]")
+        try:
+            points = [[int(p[0]), int(p[1])] for p in points]
+        except (TypeError, ValueError, IndexError, KeyError):
+            raise ValueError(f"zone {i}: points must be [x, y] numbers")
+        zone_id = str(zone.get("id") or f"zone{i + 1}")
+        if any(z["id"] == zone_id for z in zones):
+            raise ValueError(f"duplicate zone id {zone_id}")
+        zones.append({"id": zone_id, "points": points})
+    return zones
+
+
+def _edges(zones):
+    """Cạnh của các đa giác dạng mảng (zones x MAX cạnh); vùng ít đỉnh hơn đệm cạnh suy biến (y1 == y2)"""
+    n_edges = max((len(z["points"]) for z in zones), default=0)
+    x1 = np.zeros((len(zones), n_edges))
+    y1 = np.zeros((len(zones), n_edges))
+    x2 = np.zeros((len(zones), n_edges))
+    y2 = np.zeros((len(zones), n_edges))
+    for i, zone in enumerate(zones):
+        pts = np.asarray(zone["points"], dtype=np.float64)
+        nxt = np.roll(pts, -1, axis=0)
+        k = len(pts)
+        x1[i, :k], y1[i, :k] = pts[:, 0], pts[:, 1]
+        x2[i, :k], y2[i, :k] = nxt[:, 0], nxt[:, 1]
+    return x1, y1, x2, y2
+
+
+def points_in_polygons(xs, ys, edges):
+    """Ray casting vector hoá: ma trận bool (zones x điểm), True nếu điểm nằm trong vùng"""
+    x1, y1, x2, y2 = (e[:, :, None] for e in edges)
+    px, py = xs[None, None, :], ys[None, None, :]
+    straddle = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = np.count_nonzero(straddle & (px < x_cross), axis=1)
+    return (crossings & 1).astype(bool)
+
+
+class ZoneTracker:
+    def __init__(self, zones=None, lost_after=LOST_AFTER, window=DWELL_WINDOW, stream=None):
+        self.lost_after = lost_after
+        self.window = window
+        self.stream = stream  # label gauge people_zone_occupancy của /metrics
+        self._reported_at = 0.0
+        self._reported_occupancy = None
+        self._dirty = False
+        self.set_zones(zones or [])
+
+    def set_zones(self, zones):
+        """Đổi cấu hình vùng (đã qua parse_zones); số liệu vùng bắt đầu lại từ đầu"""
+        self.zones = list(zones)
+        self.ids = [z["id"] for z in self.zones]
+        self._edges = _edges(self.zones)
+        n = len(self.zones)
+        self._track_ids = np.empty(0, dtype=np.int64)
+        self._last_seen = np.empty(0, dtype=np.float64)
+        self._entered = np.empty((n, 0), dtype=np.float64)
+        self.entries = np.zeros(n, dtype=np.int64)
+        self.exits = np.zeros(n, dtype=np.int64)
+        self._dwell = np.full((n, self.window), np.nan)
+        self._dwell_count = np.zeros(n, dtype=np.int64)
+        self._dirty = True  # báo lại ngay cả khi vừa xoá hết vùng
+
+    def config(self):
+        return [dict(z) for z in self.zones]
+
+    def update(self, boxes, t):
+        """Cập nhật vào/ra vùng từ boxes [(track_id, l, t, r, b), ...] tại thời điểm t (giây)"""
+        if not self.zones:
+            return
+        if boxes:
+            arr = np.asarray(boxes, dtype=np.float64)
+            cur_ids = arr[:, 0].astype(np.int64)
+            inside_now = points_in_polygons((arr[:, 1] + arr[:, 3]) * 0.5, arr[:, 4], self._edges)
+        else:
+            cur_ids = np.empty(0, dtype=np.int64)
+            inside_now = np.zeros((len(self.zones), 0), dtype=bool)
+
+        # Gộp track đang theo dõi (trong vùng) với track của frame này, theo id đã sort
+        all_ids = np.union1d(self._track_ids, cur_ids)
+        old_pos = np.searchsorted(all_ids, self._track_ids)
+        cur_pos = np.searchsorted(all_ids, cur_ids)
+        entered = np.full((len(self.zones), all_ids.size), np.nan)
+        entered[:, old_pos] = self._entered
+        last_seen = np.full(all_ids.size, -np.inf)
+        last_seen[old_pos] = self._last_seen
+        last_seen[cur_pos] = t
+        seen = np.zeros(all_ids.size, dtype=bool)
+        seen[cur_pos] = True
+
+        was_inside = ~np.isnan(entered)
+        inside = was_inside.copy()  # track không thấy ở frame này giữ nguyên trạng thái...
+        inside[:, cur_pos] = inside_now
+        inside[:, (t - last_seen) > self.lost_after] = False  # ...cho tới khi mất dấu quá lâu
+
+        entering = inside & ~was_inside
+        leaving = was_inside & ~inside
+        entered[entering] = t
+        if leaving.any():
+            # Track mất dấu rời vùng tại lần cuối còn thấy
+            left_at = np.where(seen, t, last_seen)
+            zone_idx, track_idx = np.nonzero(leaving)
+            durations = left_at[track_idx] - entered[zone_idx, track_idx]
+            rank = np.arange(zone_idx.size) - np.searchsorted(zone_idx, zone_idx)
+            slot = (self._dwell_count[zone_idx] + rank) % self.window
+            self._dwell[zone_idx, slot] = durations
+            self._dwell_count += np.bincount(zone_idx, minlength=len(self.zones))
+            entered[leaving] = np.nan
+        self.entries += np.count_nonzero(entering, axis=1)
+        self.exits += np.count_nonzero(leaving, axis=1)
+
+        keep = inside.any(axis=0)
+        self._track_ids = all_ids[keep]
+        self._last_seen = last_seen[keep]
+        self._entered = entered[:, keep]
+
+    def summary(self, t):
+        """{zone_id: {occupancy, entries, exits, dwell_p50/p90/p95, dwell_samples, current_dwell_max}} (giây)"""
+        if not self.zones:
+            return {}
+        present = ~np.isnan(self._entered)
+        occupancy = np.count_nonzero(present, axis=1)
+        current = np.where(present, t - self._entered, 0.0)
+        current_max = current.max(axis=1) if current.shape[1] else np.zeros(len(self.zones))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # vùng chưa có lượt dwell nào → NaN
+            pct = np.nanpercentile(self._dwell, PERCENTILES, axis=1)
+        out = {}
+        for i, zone_id in enumerate(self.ids):
+            item = {"occupancy": int(occupancy[i]), "entries": int(self.entries[i]), "exits": int(self.exits[i]),
+                    "dwell_samples": int(min(self._dwell_count[i], self.window)),
+                    "current_dwell_max": round(float(current_max[i]), 1)}
+            for p, value in zip(PERCENTILES, pct[:, i]):
+                item[f"dwell_p{p}"] = None if np.isnan(value) else round(float(value), 1)
+            out[zone_id] = item
+        return out
+
+    def report(self, state, t, force=False):
+        """Đẩy tổng kết vào SharedCounter khi số người trong vùng đổi hoặc mỗi REPORT_INTERVAL giây"""
+        if not self.zones and not self._dirty:
+            return
+        occupancy = np.count_nonzero(~np.isnan(self._entered), axis=1).tolist()
+        now = time.monotonic()
+        if not (force or self._dirty or occupancy != self._reported_occupancy
+                or now - self._reported_at >= REPORT_INTERVAL):
+            return
+        self._reported_at = now
+        self._reported_occupancy = occupancy
+        self._dirty = False
+        summary = self.summary(t)
+        state.set_zones(summary or None)
+        if self.stream is not None:
+            for zone_id, item in summary.items():
+                ZONE_OCCUPANCY.set(item["occupancy"], stream=self.stream, zone=zone_id)
@@ -0,0 +1,129 @@
+"""
+Benchmark throughput tổng khi chạy 1/2/4 job process_video song song, mỗi job 1 process như worker
+của src/jobs.py, với ngân sách CPU (src/cpu_budget.py) và warm-up model.
+
+    python tools/bench_concurrency.py --concurrency 1,2,4                  # StubTracker, chia đều CPU
+    python tools/bench_concurrency.py --model yolo --imgsz 480 --pin       # YOLO thật, gắn core
+    python tools/bench_concurrency.py --model yolo --no-budget --no-warmup # để torch/cv2 tự chọn thread
+
+Job chạy không pacing (process_video(pacing="fast")), tất cả bắt đầu cùng lúc sau khi đã load/warm-up.
+In ra: fps tổng (tổng frame / thời gian đến job cuối xong), fps mỗi job, thời gian track của
+5 frame đầu so với trung bình (chi phí khởi tạo lười còn lại nếu không warm-up).
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+from src.cpu_budget import available_cpus, split_cpus  # noqa: E402
+
+FIRST_FRAMES = 5
+
+
+def _job(idx, video, truth, threads, cpus, model, imgsz, warmup, barrier, results):
+    """1 job trong process riêng (spawn), giống _worker_main của src/jobs.py"""
+    from src.cpu_budget import configure_cpu_budget
+    budget = configure_cpu_budget(threads, cpus, label=f"BENCH{idx}") if threads else {"threads": None, "cpus": None}
+    from bench_pipeline import _setup_worker
+    from src.timing import StageTimer
+    worker = _setup_worker(tempfile.mkdtemp(prefix=f"bench_concurrency_{idx}_"))
+    factory = None
+    if model == "stub":
+        from synthetic import StubTracker
+        factory = StubTracker
+    else:
+        import src.tracker
+        if imgsz:
+            src.tracker.IMGSZ = imgsz
+    warmup_s = worker.warmup_model(factory) if warmup and factory is None else None
+
+    line_config = {"line_type": "horizontal", "y": truth["line_y"], "angle": 0,
+                   "x1": 0, "x2": truth["width"], "auto": False}
+    timer = StageTimer()
+    barrier.wait()
+    t0 = time.perf_counter()
+    result = worker.process_video(video, line_config, auto_detect=False, timer=timer,
+                                  tracker_factory=factory, pacing="fast")
+    wall = time.perf_counter() - t0
+    track = timer.samples.get("track", [])
+    results.put({
+        "job": idx, "frames": result["frames"], "wall": wall, "end": time.time(),
+        "fps": result["frames"] / wall if wall > 0 else 0.0, "warmup_s": warmup_s, **budget,
+        "first_track_ms": sum(track[:FIRST_FRAMES]) * 1000 / max(1, len(track[:FIRST_FRAMES])),
+        "mean_track_ms": sum(track) * 1000 / max(1, len(track)),
+    })
+
+
+def run_level(n, video, truth, args):
+    ctx = mp.get_context("spawn")
+    cpus = available_cpus()
+    threads = 0 if args.no_budget else (args.threads or max(1, len(cpus) // n))
+    groups = split_cpus(n, threads) if args.pin and threads else [None] * n
+    barrier = ctx.Barrier(n + 1)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_job, args=(i, video, truth, threads, groups[i], args.model, args.imgsz,
+                                             not args.no_warmup, barrier, results))
+             for i in range(n)]
+    for proc in procs:
+        proc.start()
+    barrier.wait()  # mọi job đã load + warm-up xong
+    start = time.time()
+    jobs = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = max(j["end"] for j in jobs) - start
+    frames = sum(j["frames"] for j in jobs)
+    return {
+        "concurrency": n, "threads_per_job": threads or None, "pinned": bool(args.pin and threads),
+        "aggregate_fps": round(frames / wall, 2) if wall > 0 else 0.0, "wall": round(wall, 3),
+        "jobs": sorted(jobs, key=lambda j: j["job"]),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Throughput tổng khi chạy nhiều job song song")
+    p.add_argument("--concurrency", default="1,2,4")
+    p.add_argument("--model", choices=("stub", "yolo"), default="stub")
+    p.add_argument("--imgsz", type=int, default=0, help="Kích thước input YOLO (mặc định TRACKER_IMGSZ)")
+    p.add_argument("--threads", type=int, default=0, help="Thread mỗi job (mặc định số CPU / số job)")
+    p.add_argument("--pin", action="store_true", help="Gắn mỗi job vào nhóm core riêng")
+    p.add_argument("--no-budget", action="store_true", help="Không giới hạn thread (để thư viện tự chọn)")
+    p.add_argument("--no-warmup", action="store_true")
+    p.add_argument("--resolution", default="640x360")
+    p.add_argument("--density", type=float, default=4)
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--output", help="Ghi kết quả JSON")
+    args = p.parse_args()
+
+    from synthetic import generate_video
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    video = os.path.join(tempfile.mkdtemp(prefix="bench_concurrency_"), "video.avi")
+    truth = generate_video(video, width, height, args.frames, args.density, 25, 0)
+
+    print(f"{len(available_cpus())} CPUs | model={args.model} | {args.resolution} x {args.frames} frames/job")
+    print(f"{'jobs':>4s}  {'threads':>7s}  {'pinned':>6s}  {'total fps':>9s}  {'fps/job':>8s}  "
+          f"{'first track ms':>14s}  {'mean track ms':>13s}")
+    levels = []
+    for n in (int(v) for v in args.concurrency.split(",")):
+        level = run_level(n, video, truth, args)
+        levels.append(level)
+        jobs = level["jobs"]
+        print(f"{n:4d}  {str(level['threads_per_job'] or '-'):>7s}  {str(level['pinned']):>6s}  "
+              f"{level['aggregate_fps']:9.1f}  {sum(j['fps'] for j in jobs) / len(jobs):8.1f}  "
+              f"{sum(j['first_track_ms'] for j in jobs) / len(jobs):14.2f}  "
+              f"{sum(j['mean_track_ms'] for j in jobs) / len(jobs):13.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": levels}, f, indent=2)
+        print(f"\nResults → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark ingest: time-to-first-frame / time-to-first-count khi upload video lớn.
+
+So sánh 2 cách:
+- buffered : nhận xong toàn bộ file rồi mới mở VideoCapture (cách /upload cũ)
+- streaming: receive_stream + GrowingVideoCapture, decode song song khi file còn đang lớn
+
+Ví dụ:
+    python tools/bench_ingest.py --frames 3000 --mbps 20
+    python tools/bench_ingest.py --video big.mkv --mbps 50
+    python tools/bench_ingest.py --video big.mkv --url http://127.0.0.1:5000   # đo qua app.py thật (cần model)
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ingest import GrowingVideoCapture, receive_stream  # noqa: E402
+
+
+class ThrottledReader:
+    """File-like giả lập băng thông upload (bytes/giây)"""
+    def __init__(self, path, bytes_per_sec, block=256 * 1024):
+        self.f = open(path, "rb")
+        self.bytes_per_sec = bytes_per_sec
+        self.block = block
+        self.t0 = time.perf_counter()
+        self.sent = 0
+
+    def read(self, n=-1):
+        n = self.block if n is None or n < 0 else min(n, self.block)
+        data = self.f.read(n)
+        self.sent += len(data)
+        # Ngủ tới đúng thời điểm lượng byte này "đến nơi"
+        delay = self.sent / self.bytes_per_sec - (time.perf_counter() - self.t0)
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read()
+            if not data:
+                return
+            yield data
+
+
+def make_synthetic(path, frames, width, height, fps=25):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame = np.roll(noise, i * 4, axis=1)
+        cv2.putText(frame, f"{i}", (40, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+        writer.write(frame)
+    writer.release()
+
+
+def _decode_all(cap, t0, result):
+    n = 0
+    while True:
+        ok, _ = cap.read()
+        if not ok:
+            break
+        if n == 0:
+            result["first_frame"] = time.perf_counter() - t0
+        n += 1
+    result["frames"] = n
+    result["done"] = time.perf_counter() - t0
+    cap.release()
+
+
+def bench_buffered(src, dst, bps):
+    t0 = time.perf_counter()
+    reader = ThrottledReader(src, bps)
+    with open(dst, "wb") as f:
+        for chunk in reader:
+            f.write(chunk)
+    result = {"upload": time.perf_counter() - t0}
+    _decode_all(cv2.VideoCapture(dst), t0, result)
+    return result
+
+
+def bench_streaming(src, dst, bps):
+    t0 = time.perf_counter()
+    result = {}
+    threads = []
+
+    def on_ready(path):
+        t = threading.Thread(target=lambda: _decode_all(GrowingVideoCapture(path), t0, result))
+        t.start()
+        threads.append(t)
+
+    receive_stream(ThrottledReader(src, bps), dst, on_ready=on_ready)
+    result["upload"] = time.perf_counter() - t0
+    for t in threads:
+        t.join()
+    return result
+
+
+def bench_server(src, url, bps):
+    """POST /upload/stream lên app.py thật, đo thời điểm /api/result có số đếm đầu tiên"""
+    params = urllib.parse.urlencode({"filename": os.path.basename(src), "auto_detect": "false",
+                                     "line_type": "vertical"})
+    size = os.path.getsize(src)
+    t0 = time.perf_counter()
+    result = {}
+
+    def poll():
+        while "first_count" not in result:
+            try:
+                with urllib.request.urlopen(f"{url}/api/result", timeout=2) as r:
+                    d = json.load(r)
+                if d.get("running") and "running" not in result:
+                    result["running"] = time.perf_counter() - t0
+                if d.get("in", 0) + d.get("out", 0) > 0:
+                    result["first_count"] = time.perf_counter() - t0
+            except Exception:
+                pass
+            time.sleep(0.1)
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    req = urllib.request.Request(f"{url}/upload/stream?{params}", data=ThrottledReader(src, bps), method="POST",
+                                 headers={"Content-Type": "application/octet-stream", "Content-Length": str(size)})
+    with urllib.request.urlopen(req) as r:
+        r.read()
+    result["upload"] = time.perf_counter() - t0
+    poller.join(timeout=600)
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark time-to-first-frame khi upload video")
+    p.add_argument("--video", help="File video có sẵn (mặc định tạo video tổng hợp .mkv)")
+    p.add_argument("--frames", type=int, default=1500)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.add_argument("--mbps", type=float, default=20.0, help="Băng thông upload giả lập (megabit/s)")
+    p.add_argument("--url", help="Đo qua app.py đang chạy thay vì giả lập tại chỗ")
+    args = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    src = args.video
+    if not src:
+        src = os.path.join(workdir, "synthetic.mkv")
+        print(f"Generating {args.frames} frames {args.width}x{args.height} → {src}")
+        make_synthetic(src, args.frames, args.width, args.height)
+    size = os.path.getsize(src)
+    bps = args.mbps * 1e6 / 8
+    print(f"Video {size / 1e6:.1f} MB, upload {args.mbps} Mbit/s (~{size / bps:.1f}s)")
+
+    if args.url:
+        r = bench_server(src, args.url.rstrip("/"), bps)
+        print(json.dumps({k: round(v, 2) for k, v in r.items()}))
+        return
+
+    ext = os.path.splitext(src)[1]
+    for name, fn in (("buffered", bench_buffered), ("streaming", bench_streaming)):
+        r = fn(src, os.path.join(workdir, f"{name}{ext}"), bps)
+        print(f"{name:9s} upload={r['upload']:.2f}s first_frame={r.get('first_frame', float('nan')):.2f}s "
+              f"done={r.get('done', float('nan')):.2f}s frames={r.get('frames', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Đo cấp phát bộ nhớ mỗi frame và RSS của process_video, có / không dùng lại buffer frame
+(FramePool của src/frame_pool.py, FRAME_POOL_SIZE=0 = mỗi frame cấp phát buffer mới).
+
+    python tools/bench_memory.py                                   # 1920x1080 (có resize) + 1280x720
+    python tools/bench_memory.py --resolutions 1280x720 --frames 600 --tiers full,thumb
+    python tools/bench_memory.py --output mem.json
+
+Mỗi chế độ chạy trong process riêng (spawn) 2 lần:
+- lần đo RSS/fps không bật tracemalloc: RSS cuối (VmRSS) và peak (ru_maxrss)
+- lần bật tracemalloc: mỗi frame chia đoạn tại mỗi lần vào/ra stage, reset peak đầu mỗi đoạn → tổng byte
+  cấp phát (peak - mức nền từng đoạn) của pipeline, không tính stage "track" (StubTracker / YOLO tự cấp phát
+  theo model); quy ra số frame-buffer tương đương (÷ h*w*3)
+Chạy trên checkout cũ (trước FramePool) cũng được: biến môi trường bị bỏ qua, cho số liệu "trước".
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+MODES = {"pool": None, "no-pool": "0"}   # giá trị FRAME_POOL_SIZE (None = mặc định)
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def _run(video, truth, pool_size, traced, tiers, results):
+    """1 lần chạy trong process riêng"""
+    if pool_size is not None:
+        os.environ["FRAME_POOL_SIZE"] = pool_size
+    import tracemalloc
+    from contextlib import ExitStack
+    from bench_pipeline import _setup_worker
+    from synthetic import StubTracker
+    from shared_state import frame_hub
+    from src.timing import StageTimer
+
+    class AllocTimer(StageTimer):
+        """
+        Cấp phát mỗi frame = tổng peak (trên mức nền) của từng đoạn giữa các mốc vào/ra stage, trừ đoạn
+        "track". Chia nhỏ theo stage để 1 lần giải phóng (frame cũ) không che lần cấp phát ở đoạn khác.
+        """
+        def __init__(self):
+            super().__init__(keep_samples=False)
+            self.frame_peaks = []
+            self._base = None
+            self._sum = 0
+
+        def segment(self, counted=True):
+            """Đóng đoạn đang mở (cộng peak vào frame hiện tại nếu counted), mở đoạn mới"""
+            current, peak = tracemalloc.get_traced_memory()
+            if self._base is not None and counted:
+                self._sum += max(0, peak - self._base)
+            tracemalloc.reset_peak()
+            self._base = current
+
+        def stage(self, name):
+            if not traced:
+                return super().stage(name)
+            if name == "decode":
+                self.segment()
+                if self._base is not None and self._sum:
+                    self.frame_peaks.append(self._sum)
+                self._sum = 0
+            return _Segmented(self, name, super().stage(name))
+
+    class _Segmented:
+        def __init__(self, timer, name, inner):
+            self.timer = timer
+            self.name = name
+            self.inner = inner
+
+        def __enter__(self):
+            self.timer.segment()
+            self.inner.__enter__()
+            return self
+
+        def __exit__(self, *exc):
+            self.inner.__exit__(*exc)
+            self.timer.segment(counted=self.name != "track")  # tracker tự cấp phát theo model, không tính
+            return False
+
+    worker = _setup_worker(tempfile.mkdtemp(prefix="bench_memory_"))
+    line_config = {"line_type": "horizontal", "y": truth["line_y"], "angle": 0,
+                   "x1": 0, "x2": truth["width"], "auto": False}
+    timer = AllocTimer()
+    rss_before = _rss_mb()
+    if traced:
+        tracemalloc.start()
+    with ExitStack() as stack:
+        for tier in tiers:
+            stack.enter_context(frame_hub.subscribe(tier))
+        t0 = time.perf_counter()
+        result = worker.process_video(video, line_config, auto_detect=False, timer=timer,
+                                      tracker_factory=StubTracker, pacing="fast",
+                                      heatmap_path=os.path.join(tempfile.mkdtemp(), "heatmap.npz"))
+        wall = time.perf_counter() - t0
+    if traced:
+        tracemalloc.stop()
+    peaks = timer.frame_peaks[5:] or timer.frame_peaks  # bỏ vài frame đầu (khởi tạo lười)
+    results.put({
+        "frames": result["frames"], "fps": round(result["frames"] / wall, 1) if wall > 0 else 0.0,
+        "rss_before_mb": rss_before, "rss_after_mb": _rss_mb(),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "alloc_mean": sum(peaks) / len(peaks) if peaks else None,
+        "alloc_p95": _percentile(peaks, 95) if peaks else None,
+        "frame_pool": result.get("frame_pool"),
+    })
+
+
+def run_mode(video, truth, pool_size, tiers):
+    ctx = mp.get_context("spawn")
+    out = {}
+    for traced in (False, True):
+        results = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(video, truth, pool_size, traced, tiers, results))
+        proc.start()
+        item = results.get()
+        proc.join()
+        if traced:
+            out.update(alloc_mean=item["alloc_mean"], alloc_p95=item["alloc_p95"])
+        else:
+            out.update(item)
+            out.pop("alloc_mean", None)
+            out.pop("alloc_p95", None)
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description="Cấp phát bộ nhớ mỗi frame + RSS của process_video")
+    p.add_argument("--resolutions", default="1920x1080,1280x720")
+    p.add_argument("--modes", default="pool,no-pool")
+    p.add_argument("--density", type=float, default=4)
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--tiers", default="full", help="Tier /video_feed giả lập đang xem (rỗng = không encode)")
+    p.add_argument("--output", help="Ghi kết quả JSON")
+    args = p.parse_args()
+
+    from synthetic import generate_video
+    tiers = [t for t in args.tiers.split(",") if t]
+    workdir = tempfile.mkdtemp(prefix="bench_memory_")
+    rows = []
+    print(f"{'resolution':>10s}  {'mode':>7s}  {'fps':>6s}  {'alloc/frame MB':>14s}  {'p95 MB':>7s}  "
+          f"{'frame bufs':>10s}  {'RSS MB':>7s}  {'max RSS MB':>10s}")
+    for res in args.resolutions.split(","):
+        width, height = (int(v) for v in res.lower().split("x"))
+        video = os.path.join(workdir, f"video_{width}x{height}.avi")
+        truth = generate_video(video, width, height, args.frames, args.density, 25, 0)
+        # Kích thước frame sau resize của process_video (tối đa 1280x720)
+        scale = min(1.0, 1280 / width, 720 / height)
+        frame_bytes = int(width * scale) * int(height * scale) * 3
+        for mode in args.modes.split(","):
+            row = {"resolution": res, "mode": mode, **run_mode(video, truth, MODES[mode], tiers)}
+            rows.append(row)
+            mean = row["alloc_mean"] or 0.0
+            print(f"{res:>10s}  {mode:>7s}  {row['fps']:6.1f}  {mean / 2 ** 20:14.2f}  "
+                  f"{(row['alloc_p95'] or 0.0) / 2 ** 20:7.2f}  {mean / frame_bytes:10.2f}  "
+                  f"{row['rss_after_mb'] or 0.0:7.1f}  {row['max_rss_mb']:10.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "rows": rows}, f, indent=2)
+        print(f"\nResults → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark end-to-end process_video: thời gian từng stage (decode, resize, track, count, heatmap,
+draw, encode, write, pacing) trên video tổng hợp với nhiều độ phân giải / mật độ người.
+
+Mặc định dùng StubTracker (tools/synthetic.py) nên chạy được khi không có mạng / weights;
+--model yolo để đo với PersonTracker thật.
+
+Ví dụ:
+    python tools/bench_pipeline.py --resolutions 640x360,1280x720 --densities 2,10 --frames 300
+    python tools/bench_pipeline.py --output bench.json                       # lưu kết quả làm baseline
+    python tools/bench_pipeline.py --baseline bench.json --threshold 0.25     # exit 1 nếu stage chậm hơn >25%
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import StubTracker, generate_video  # noqa: E402
+from src.timing import StageTimer  # noqa: E402
+
+# Stage nhỏ hơn ngưỡng này (ms/lần) dao động do nhiễu đo nhiều hơn là do code, không tính regression
+MIN_REGRESSION_MS = 0.05
+
+
+def _parse_resolutions(value):
+    out = []
+    for item in value.split(","):
+        w, h = item.lower().split("x")
+        out.append((int(w), int(h)))
+    return out
+
+
+def _setup_worker(workdir):
+    """Import ai_worker với artifact/history ghi vào thư mục tạm (không đụng realtime/ của repo)"""
+    import ai_worker
+    from src.history_store import HistoryStore
+    ai_worker.STATS_JSON_PATH = os.path.join(workdir, "stats.json")
+    ai_worker.LATEST_JPG_PATH = os.path.join(workdir, "latest.jpg")
+    ai_worker.history_store = HistoryStore(os.path.join(workdir, "history.db"), stream="bench")
+    return ai_worker
+
+
+def run_case(worker, video, truth, model, overlay_mode, tiers):
+    from shared_state import frame_hub
+    from contextlib import ExitStack
+    timer = StageTimer()
+    line_config = {"line_type": "horizontal", "y": truth["line_y"], "angle": 0,
+                   "x1": 0, "x2": truth["width"], "auto": False}
+    factory = StubTracker if model == "stub" else None
+    with ExitStack() as stack:
+        # Giả lập viewer /video_feed để encoder thực sự encode các tier này
+        for tier in tiers:
+            stack.enter_context(frame_hub.subscribe(tier))
+        t0 = time.perf_counter()
+        result = worker.process_video(video, line_config, auto_detect=False, overlay_mode=overlay_mode,
+                                      timer=timer, tracker_factory=factory, pacing="fast")
+        wall = time.perf_counter() - t0
+    stages = timer.summary()
+    frames = result.get("frames", 0)
+    pacing = stages.get("pacing", {}).get("total_ms", 0.0) / 1000
+    measured = sum(s["total_ms"] for s in stages.values()) / 1000
+    return {
+        "frames": frames,
+        "wall_s": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall > 0 else 0.0,
+        # FPS nếu bỏ phần sleep giữ nhịp video: giới hạn thực của pipeline
+        "busy_fps": round(frames / (wall - pacing), 2) if wall > pacing else 0.0,
+        "unaccounted_ms": round(max(0.0, wall - measured) * 1000, 1),
+        "stages": stages,
+        "counts": {"in": result.get("in", 0), "out": result.get("out", 0)},
+        "truth": {"in": truth["in"], "out": truth["out"]},
+        "error": result.get("error"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Danh sách regression: stage mean_ms hoặc busy_fps tệ hơn baseline quá threshold"""
+    regressions = []
+    base_cases = {c["name"]: c for c in baseline.get("cases", [])}
+    for case in results["cases"]:
+        base = base_cases.get(case["name"])
+        if base is None:
+            continue
+        for stage, item in case["stages"].items():
+            if stage == "pacing":
+                continue
+            old = base["stages"].get(stage, {}).get("mean_ms")
+            new = item["mean_ms"]
+            if old and new > old * (1 + threshold) and new - old > MIN_REGRESSION_MS:
+                regressions.append(f"{case['name']} {stage}: {old:.3f} → {new:.3f} ms (+{(new / old - 1) * 100:.0f}%)")
+        old_fps, new_fps = base.get("busy_fps"), case["busy_fps"]
+        if old_fps and new_fps < old_fps * (1 - threshold):
+            regressions.append(f"{case['name']} busy_fps: {old_fps:.1f} → {new_fps:.1f}")
+    return regressions
+
+
+def _print_case(case):
+    print(f"\n{case['name']}: {case['frames']} frames, {case['fps']:.1f} fps (busy {case['busy_fps']:.1f}), "
+          f"counts {case['counts']} truth {case['truth']}")
+    print(f"  {'stage':10s} {'count':>6s} {'mean ms':>9s} {'p95 ms':>9s} {'total ms':>10s}")
+    for name, s in sorted(case["stages"].items(), key=lambda kv: -kv[1]["total_ms"]):
+        print(f"  {name:10s} {s['count']:6d} {s['mean_ms']:9.3f} {s.get('p95_ms', 0):9.3f} {s['total_ms']:10.1f}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark từng stage của process_video trên video tổng hợp")
+    p.add_argument("--resolutions", default="640x360,1280x720")
+    p.add_argument("--densities", default="2,8", help="Số người trung bình trong khung, phân cách dấu phẩy")
+    p.add_argument("--frames", type=int, default=250)
+    p.add_argument("--fps", type=int, default=25)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--model", choices=("stub", "yolo"), default="stub")
+    p.add_argument("--overlay", choices=("server", "client"), default="server")
+    p.add_argument("--tiers", default="full", help="Tier đang có người xem (encode), rỗng = không encode")
+    p.add_argument("--output", help="Ghi kết quả JSON")
+    p.add_argument("--baseline", help="JSON kết quả trước đó để so sánh")
+    p.add_argument("--threshold", type=float, default=0.25, help="Tỉ lệ chậm hơn cho phép so với baseline")
+    p.add_argument("--workdir", help="Thư mục video tổng hợp (mặc định thư mục tạm)")
+    args = p.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.makedirs(workdir, exist_ok=True)
+    worker = _setup_worker(workdir)
+    tiers = [t for t in args.tiers.split(",") if t]
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "model": args.model,
+            "overlay": args.overlay,
+            "tiers": tiers,
+            "frames": args.frames,
+        },
+        "cases": [],
+    }
+    for width, height in _parse_resolutions(args.resolutions):
+        for density in (float(d) for d in args.densities.split(",")):
+            name = f"{width}x{height}_d{density:g}"
+            video = os.path.join(workdir, f"{name}_s{args.seed}_f{args.frames}.avi")
+            if os.path.exists(video) and os.path.exists(video + ".json"):
+                with open(video + ".json", "r", encoding="utf-8") as f:
+                    truth = json.load(f)
+            else:
+                truth = generate_video(video, width, height, args.frames, density, args.fps, args.seed)
+            case = {"name": name, "resolution": [width, height], "density": density}
+            case.update(run_case(worker, video, truth, args.model, args.overlay, tiers))
+            results["cases"].append(case)
+            _print_case(case)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults → {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSION (> {args.threshold * 100:.0f}% vs {args.baseline}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regression vs {args.baseline} (threshold {args.threshold * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
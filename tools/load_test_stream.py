@@ -0,0 +1,129 @@
+"""
+Load test /video_feed: mở nhiều viewer MJPEG đồng thời và đo số frame mỗi viewer nhận được.
+
+Ví dụ (2 terminal):
+    python realtime.py --serve --async --shm-name loadtest_ring
+    python tools/load_test_stream.py --viewers 300 --synthetic --shm-name loadtest_ring
+
+--synthetic: tự tạo shared-memory ring và ghi frame JPEG tổng hợp (không cần webcam/model).
+--slow N   : N viewer đọc chậm để kiểm tra backpressure (viewer chậm bỏ qua frame, không làm chậm viewer khác).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _synthetic_writer(shm_name, fps, stop):
+    import cv2
+    import numpy as np
+    from src.shm_ring import SharedFrameRing
+
+    ring = SharedFrameRing.create(shm_name)
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    n = 0
+    try:
+        while not stop.is_set():
+            frame[:] = (n * 3 % 255, 80, 160)
+            cv2.putText(frame, f"frame {n}", (50, 360), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if ok:
+                ring.write_frame(buf, 0)
+                ring.write_stats({"stats": {"in": n, "out": 0, "net": n, "running": True}})
+            n += 1
+            time.sleep(1.0 / fps)
+    finally:
+        ring.close()
+
+
+async def _viewer(session, url, duration, slow, result):
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                result["status"] = resp.status
+                return
+            result["status"] = 200
+            t_end = time.perf_counter() + duration
+            tail = b""
+            while time.perf_counter() < t_end:
+                try:
+                    chunk = await asyncio.wait_for(resp.content.read(65536), timeout=max(0.1, t_end - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    break
+                if not chunk:
+                    break
+                data = tail + chunk
+                result["frames"] += data.count(b"--frame\r\n")
+                result["bytes"] += len(chunk)
+                tail = data[-9:]
+                if slow:
+                    await asyncio.sleep(0.5)
+    except aiohttp.ClientError as e:
+        result["status"] = str(e)
+
+
+async def run(args):
+    url = f"{args.url.rstrip('/')}/video_feed?tier={args.tier}"
+    conn = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+    results = [{"frames": 0, "bytes": 0, "status": None, "slow": i < args.slow} for i in range(args.viewers)]
+    async with aiohttp.ClientSession(connector=conn, timeout=timeout) as session:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_viewer(session, url, args.duration, r["slow"], r) for r in results))
+        elapsed = time.perf_counter() - t0
+        try:
+            async with session.get(f"{args.url.rstrip('/')}/api/stream/stats") as resp:
+                server_stats = await resp.json()
+        except Exception:
+            server_stats = None
+
+    ok = [r for r in results if r["status"] == 200]
+    fast = [r["frames"] / args.duration for r in ok if not r["slow"]]
+    slow = [r["frames"] / args.duration for r in ok if r["slow"]]
+    rejected = sum(1 for r in results if r["status"] == 503)
+    print(f"viewers={args.viewers} connected={len(ok)} rejected={rejected} elapsed={elapsed:.1f}s")
+    if fast:
+        print(f"fps/viewer: min={min(fast):.1f} median={statistics.median(fast):.1f} max={max(fast):.1f}")
+    if slow:
+        print(f"slow viewers fps: median={statistics.median(slow):.1f}")
+    total_mb = sum(r["bytes"] for r in ok) / 1e6
+    print(f"total {total_mb:.1f} MB ({total_mb / args.duration:.1f} MB/s)")
+    if server_stats and "viewers" in server_stats:
+        print(f"server viewers: {server_stats['viewers']}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Load test /video_feed với nhiều viewer đồng thời")
+    p.add_argument("--url", default="http://127.0.0.1:5001")
+    p.add_argument("--viewers", type=int, default=200)
+    p.add_argument("--duration", type=float, default=10.0)
+    p.add_argument("--tier", default="full")
+    p.add_argument("--slow", type=int, default=0, help="Số viewer đọc chậm")
+    p.add_argument("--synthetic", action="store_true", help="Tự ghi frame tổng hợp vào shared-memory ring")
+    p.add_argument("--shm-name", default="track_people_ring")
+    p.add_argument("--fps", type=float, default=25.0)
+    args = p.parse_args()
+
+    stop = threading.Event()
+    writer = None
+    if args.synthetic:
+        writer = threading.Thread(target=_synthetic_writer, args=(args.shm_name, args.fps, stop), daemon=True)
+        writer.start()
+        time.sleep(1.5)  # chờ server attach ring
+    try:
+        asyncio.run(run(args))
+    finally:
+        stop.set()
+        if writer is not None:
+            writer.join(timeout=2.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Ghi track 1 lần, chỉnh tham số PeopleCounter nhiều lần (không chạy lại YOLO).
+
+    # 1. Ghi track (YOLO thật, hoặc --stub với video tổng hợp của tools/synthetic.py)
+    python tools/replay_tracks.py record video.mp4 video.npz --line-type horizontal --line-y 300
+
+    # 2. Phát lại với tham số khác
+    python tools/replay_tracks.py replay video.npz --debounce 1 --min-distance 20
+
+    # 3. Sweep lưới tham số trong process pool, so với ground truth
+    python tools/replay_tracks.py sweep a.npz b.npz --truth a.npz=12,9 --truth b.npz=4,4 \
+        --debounce 1,2,3 --min-distance 10,20,40 --line-y 0.4,0.5,0.6
+
+Ground truth mỗi bản ghi: --truth FILE=IN,OUT, hoặc <video>.json cạnh video (tools/synthetic.py).
+Vị trí line: số ≤ 1 là tỉ lệ theo chiều cao/rộng frame, lớn hơn là pixel.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.track_record import TrackRecording, make_counter, replay  # noqa: E402
+
+_recordings = None  # bản ghi đã load trong mỗi process của pool
+
+
+def _floats(value):
+    return [float(v) for v in value.split(",")] if value else [None]
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",")] if value else [None]
+
+
+def _line_override(meta, position):
+    """position: None = giữ line đã ghi; ≤ 1 = tỉ lệ; > 1 = pixel"""
+    if position is None:
+        return None
+    vertical = meta.get("line", {}).get("line_type") == "vertical"
+    size = meta["frame_width"] if vertical else meta["frame_height"]
+    px = int(position * size) if position <= 1 else int(position)
+    return {"line_x": px} if vertical else {"y": px}
+
+
+def _load_truth(path, rec, overrides):
+    if os.path.basename(path) in overrides:
+        return overrides[os.path.basename(path)]
+    if path in overrides:
+        return overrides[path]
+    video = rec.meta.get("video_path")
+    if video and os.path.exists(video + ".json"):
+        with open(video + ".json", "r", encoding="utf-8") as f:
+            truth = json.load(f)
+        return truth["in"], truth["out"]
+    return None
+
+
+def _init_pool(paths):
+    global _recordings
+    _recordings = [TrackRecording(p) for p in paths]
+
+
+def _evaluate(params):
+    """Chạy 1 bộ tham số trên mọi bản ghi (trong process của pool)"""
+    debounce, min_distance, position = params
+    counts = []
+    for rec in _recordings:
+        counter = make_counter(rec.meta, _line_override(rec.meta, position), debounce, min_distance)
+        counts.append(replay(rec, counter))
+    return params, counts
+
+
+def cmd_record(args):
+    from bench_pipeline import _setup_worker
+    # stats/history của lần ghi không ghi vào realtime/ của dashboard
+    worker = _setup_worker(tempfile.mkdtemp(prefix="record_tracks_"))
+    factory = None
+    if args.stub:
+        from synthetic import StubTracker
+        factory = StubTracker
+    if args.line_type == "vertical":
+        line_config = {"line_type": "vertical", "line_x": args.line_x or 320, "auto": False}
+    else:
+        line_config = {"line_type": "horizontal", "y": args.line_y or 300, "angle": args.line_angle,
+                       "x1": 0, "x2": args.line_x2, "auto": False}
+    result = worker.process_video(args.video, line_config, auto_detect=args.auto, tracker_factory=factory,
+                                  record_tracks=args.output, pacing="fast")
+    print(json.dumps({k: result.get(k) for k in ("frames", "in", "out", "duration", "error")}))
+
+
+def cmd_replay(args):
+    rec = TrackRecording(args.recording)
+    line = _line_override(rec.meta, args.line_y)
+    counter = make_counter(rec.meta, line, args.debounce, args.min_distance)
+    t0 = time.perf_counter()
+    n_in, n_out = replay(rec, counter)
+    dt = time.perf_counter() - t0
+    print(f"{args.recording}: IN={n_in} OUT={n_out} (recorded IN={rec.meta.get('in')} OUT={rec.meta.get('out')}) "
+          f"| {len(rec)} frames in {dt * 1000:.1f} ms ({len(rec) / max(dt, 1e-9):,.0f} frames/s)")
+
+
+def cmd_sweep(args):
+    overrides = {}
+    for item in args.truth or []:
+        name, counts = item.rsplit("=", 1)
+        n_in, n_out = (int(v) for v in counts.split(","))
+        overrides[name] = (n_in, n_out)
+    recordings = [TrackRecording(p) for p in args.recordings]
+    truths = []
+    for path, rec in zip(args.recordings, recordings):
+        truth = _load_truth(path, rec, overrides)
+        if truth is None:
+            print(f"No ground truth for {path} (use --truth {os.path.basename(path)}=IN,OUT)")
+            sys.exit(2)
+        truths.append(truth)
+
+    grid = list(itertools.product(_ints(args.debounce), _floats(args.min_distance), _floats(args.line_y)))
+    frames = sum(len(r) for r in recordings)
+    print(f"Sweep {len(grid)} settings × {len(recordings)} recording(s) ({frames} frames) on {args.workers or os.cpu_count()} processes")
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_pool, initargs=(args.recordings,)) as pool:
+        for params, counts in pool.map(_evaluate, grid, chunksize=max(1, len(grid) // (4 * (args.workers or os.cpu_count() or 1)))):
+            # Sai số: tổng |IN - IN thật| + |OUT - OUT thật| trên mọi bản ghi
+            error = sum(abs(c[0] - t[0]) + abs(c[1] - t[1]) for c, t in zip(counts, truths))
+            results.append((error, params, counts))
+    dt = time.perf_counter() - t0
+    print(f"Done in {dt:.2f}s ({len(grid) * frames / max(dt, 1e-9):,.0f} replayed frames/s)\n")
+
+    results.sort(key=lambda r: (r[0], r[1][0] or 0))
+    print(f"{'error':>5s}  {'debounce':>8s}  {'min_dist':>8s}  {'line':>6s}  counts (truth {truths})")
+    for error, (debounce, min_distance, position), counts in results[:args.top]:
+        fmt = lambda v, spec: "-" if v is None else format(v, spec)  # noqa: E731
+        print(f"{error:5d}  {fmt(debounce, '8d')}  {fmt(min_distance, '8g')}  {fmt(position, '6g')}  {counts}")
+    best = results[0]
+    print(f"\nBest: debounce_threshold={best[1][0]} MIN_DISTANCE={best[1][1]} line={best[1][2]} (error {best[0]})")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([{"error": e, "debounce_threshold": p[0], "min_distance": p[1], "line": p[2], "counts": c}
+                       for e, p, c in results], f, indent=2)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Ghi / phát lại track và sweep tham số PeopleCounter")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("record", help="Chạy process_video và ghi track ra .npz")
+    r.add_argument("video")
+    r.add_argument("output")
+    r.add_argument("--stub", action="store_true", help="Dùng StubTracker (video tổng hợp) thay YOLO")
+    r.add_argument("--auto", action="store_true", help="Tự phát hiện line như khi upload")
+    r.add_argument("--line-type", choices=("horizontal", "vertical"), default="horizontal")
+    r.add_argument("--line-y", type=int, default=None)
+    r.add_argument("--line-x", type=int, default=None)
+    r.add_argument("--line-angle", type=float, default=0.0)
+    r.add_argument("--line-x2", type=int, default=10000)
+
+    rp = sub.add_parser("replay", help="Phát lại 1 bản ghi với tham số counter")
+    rp.add_argument("recording")
+    rp.add_argument("--debounce", type=int, default=None)
+    rp.add_argument("--min-distance", type=float, default=None)
+    rp.add_argument("--line-y", type=float, default=None, help="Vị trí line (tỉ lệ ≤ 1 hoặc pixel)")
+
+    s = sub.add_parser("sweep", help="Đánh giá lưới tham số trong process pool")
+    s.add_argument("recordings", nargs="+")
+    s.add_argument("--truth", action="append", help="FILE=IN,OUT (lặp lại cho nhiều bản ghi)")
+    s.add_argument("--debounce", default="1,2,3", help="debounce_threshold, phân cách dấu phẩy")
+    s.add_argument("--min-distance", default="10,20,30,40")
+    s.add_argument("--line-y", default=None, help="Vị trí line (tỉ lệ ≤ 1 hoặc pixel); bỏ trống = giữ line đã ghi")
+    s.add_argument("--workers", type=int, default=None)
+    s.add_argument("--top", type=int, default=10)
+    s.add_argument("--output", help="Ghi toàn bộ kết quả JSON")
+
+    args = p.parse_args()
+    {"record": cmd_record, "replay": cmd_replay, "sweep": cmd_sweep}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
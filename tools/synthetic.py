@@ -0,0 +1,154 @@
+"""
+Video tổng hợp cho benchmark: người (hình màu) đi dọc qua đường ngang giữa khung, biết trước số IN/OUT.
+Kèm StubTracker: tracker giả thay PersonTracker (tách blob màu + ghép ID theo tâm gần nhất),
+kết quả xác định, không cần model/mạng.
+
+    truth = generate_video("clip.avi", 640, 360, frames=300, density=5)
+    # truth = {"in": .., "out": .., "line_y": .., "frames": .., "fps": ..}, lưu kèm clip.avi.json
+"""
+import json
+import math
+
+import cv2
+import numpy as np
+
+
+def _draw_person(frame, cx, cy, h, color):
+    """Người giản lược: đầu tròn + thân chữ nhật, tâm bbox tại (cx, cy)"""
+    w = max(4, int(h * 0.4))
+    top = int(cy - h / 2)
+    head = max(2, int(h * 0.12))
+    cv2.circle(frame, (int(cx), top + head), head, color, -1)
+    cv2.rectangle(frame, (int(cx - w / 2), top + 2 * head), (int(cx + w / 2), int(cy + h / 2)), color, -1)
+
+
+def _background(width, height, rng):
+    # Nền xám (độ bão hoà thấp) để StubTracker tách người bằng saturation
+    grad = np.linspace(60, 170, width, dtype=np.float32)[None, :, None]
+    bg = np.repeat(np.repeat(grad, height, axis=0), 3, axis=2)
+    bg += rng.normal(0, 6, (height, width, 1)).astype(np.float32)
+    return np.clip(bg, 0, 255).astype(np.uint8)
+
+
+def plan_walkers(width, height, frames, density, fps=25, seed=0):
+    """Lịch đi của từng người: (frame bắt đầu, x, y0, vận tốc y/frame, chiều cao, màu)"""
+    rng = np.random.default_rng(seed)
+    person_h = max(24, height // 5)
+    walkers = []
+    # Số người xuất hiện sao cho trung bình có ~density người trong khung cùng lúc
+    mean_life = 3.0 * fps  # trung bình ~3 giây để đi hết chiều cao khung
+    n = max(1, int(round(density * frames / mean_life)))
+    for i in range(n):
+        down = bool(rng.integers(0, 2))
+        speed = height / (rng.uniform(2.0, 4.0) * fps)
+        y0 = -person_h / 2 if down else height + person_h / 2
+        hue = int(rng.integers(0, 180))
+        color = cv2.cvtColor(np.uint8([[[hue, 230, 220]]]), cv2.COLOR_HSV2BGR)[0, 0].tolist()
+        walkers.append({
+            "start": int(rng.integers(-int(mean_life), frames)),
+            "x": float(rng.uniform(0.08, 0.92) * width),
+            "y0": float(y0),
+            "vy": float(speed if down else -speed),
+            "h": person_h,
+            "color": [int(c) for c in color],
+        })
+    return walkers
+
+
+def generate_video(path, width=640, height=360, frames=300, density=5, fps=25, seed=0, fourcc="MJPG"):
+    """Ghi video + file ground truth <path>.json, trả về ground truth"""
+    rng = np.random.default_rng(seed + 1)
+    bg = _background(width, height, rng)
+    walkers = plan_walkers(width, height, frames, density, fps, seed)
+    line_y = height // 2
+    truth = {"in": 0, "out": 0, "line_y": line_y, "frames": frames, "fps": fps,
+             "width": width, "height": height, "density": density, "seed": seed}
+    for w in walkers:
+        # Frame mà tâm người đi qua line_y, chỉ tính nếu nằm trong video (và không ở ngay frame đầu)
+        cross = w["start"] + (line_y - w["y0"]) / w["vy"]
+        if 1 <= cross < frames - 1:
+            truth["in" if w["vy"] > 0 else "out"] += 1
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot open video writer for {path}")
+    try:
+        for f in range(frames):
+            frame = bg.copy()
+            for w in walkers:
+                y = w["y0"] + w["vy"] * (f - w["start"])
+                if f < w["start"] or y < -w["h"] or y > height + w["h"]:
+                    continue
+                _draw_person(frame, w["x"], y, w["h"], w["color"])
+            writer.write(frame)
+    finally:
+        writer.release()
+    with open(path + ".json", "w", encoding="utf-8") as fp:
+        json.dump(truth, fp)
+    return truth
+
+
+class _StubTrack:
+    __slots__ = ("track_id", "bbox", "conf")
+
+    def __init__(self, track_id, bbox):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.conf = 1.0
+
+    def to_ltrb(self):
+        return self.bbox
+
+    def is_confirmed(self):
+        return True
+
+
+class StubTracker:
+    """
+    Thay PersonTracker trong benchmark: mask saturation → connected components → ghép ID theo tâm gần nhất.
+    Cùng interface (update(detections, frame), reset(), roi, set_roi/clear_roi) nên chạy được cả process_video.
+    """
+    def __init__(self, roi=None, min_area=80, max_jump=None):
+        self.roi = roi
+        self.min_area = min_area
+        self.max_jump = max_jump
+        self.next_id = 1
+        self.prev = {}  # track_id → (cx, cy)
+
+    def reset(self):
+        self.next_id = 1
+        self.prev = {}
+
+    def set_roi(self, x1, y1, x2, y2):
+        self.roi = (int(x1), int(y1), int(x2), int(y2))
+
+    def clear_roi(self):
+        self.roi = None
+
+    def update(self, detections, frame):
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, (0, 120, 60), (180, 255, 255))
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        max_jump = self.max_jump or frame.shape[0] / 8
+        free = dict(self.prev)
+        current = {}
+        tracks = []
+        for i in range(1, n):
+            x, y, w, h, area = stats[i]
+            if area < self.min_area:
+                continue
+            cx, cy = float(x + w / 2), float(y + h / 2)
+            best, best_d = None, max_jump
+            for tid, (px, py) in free.items():
+                d = math.hypot(cx - px, cy - py)
+                if d < best_d:
+                    best, best_d = tid, d
+            if best is None:
+                best = self.next_id
+                self.next_id += 1
+            else:
+                del free[best]
+            current[best] = (cx, cy)
+            tracks.append(_StubTrack(best, (float(x), float(y), float(x + w), float(y + h))))
+        self.prev = current
+        return tracks